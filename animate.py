@@ -0,0 +1,238 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+from PIL import Image
+
+# Animated loops from per-hour frames.
+#
+# Frames are grouped by the output naming scheme, {var}_{level}_fXXX.png for GFS
+# and {var}_lvlN_FXXX.png for MPASSIT: everything before the forecast hour is
+# the loop key and the loop is written next to the frames as {key}.gif / .mp4.
+# GIF frames are quantized to 8 bits as they arrive and spooled to a temporary
+# file; Pillow's save_all reads them back one at a time when the loop is closed.
+# MP4 frames are piped to an ffmpeg process as they arrive; at most
+# ANIMATE_MAX_ENCODERS (default 4) such processes run at once, and loops opened
+# beyond that spool raw frames to a temporary file that ffmpeg encodes when the
+# loop is closed. No loop keeps its frames in memory, however many hours or loops
+# are open. When loops are built in the rendering process, frames still in the
+# figure canvas are used directly instead of re-reading PNGs.
+
+FRAME_NAME = re.compile(r"^(?P<key>.+)_[fF](?P<fh>\d{2,3})\.png$")
+FORMATS = ('gif', 'mp4')
+DEFAULT_FPS = 4
+MAX_ENCODERS = int(os.environ.get('ANIMATE_MAX_ENCODERS', 4))
+
+_encoders = 0  # ffmpeg processes currently fed frame by frame
+PALETTE_BYTES = 768  # 256 RGB entries ahead of each spooled GIF frame
+
+
+def frame_key(path):
+    """Return (loop key, forecast hour) for a frame file name, or None."""
+    m = FRAME_NAME.match(os.path.basename(path))
+    return (m.group('key'), int(m.group('fh'))) if m else None
+
+
+def group_frames(output_dir):
+    """{key: [frame paths sorted by forecast hour]} for the frames in output_dir."""
+    groups = {}
+    for name in os.listdir(output_dir):
+        parsed = frame_key(name)
+        if parsed is not None:
+            groups.setdefault(parsed[0], []).append((parsed[1], os.path.join(output_dir, name)))
+    return {key: [path for _, path in sorted(frames)] for key, frames in groups.items()}
+
+
+def _rgb(frame):
+    if isinstance(frame, str):
+        with Image.open(frame) as im:
+            return np.asarray(im.convert('RGB'))
+    frame = np.asarray(frame)
+    return frame[..., :3] if frame.shape[-1] == 4 else frame
+
+
+def open_writer(path, fps=DEFAULT_FPS):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported loop format {fmt!r}; use one of {FORMATS}")
+    if fmt == 'mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError("ffmpeg not found on PATH; it is needed for MP4 loops")
+    tmp = f"{path}.tmp{os.getpid()}"
+    return {'fmt': fmt, 'path': path, 'tmp': tmp, 'fps': fps, 'frames': 0, 'shape': None,
+            'proc': None, 'spool': None}
+
+
+def _ffmpeg(writer, source):
+    """Start ffmpeg encoding raw RGB frames from source ('-' for stdin, or a file) into the loop."""
+    height, width = writer['shape'][:2]
+    return subprocess.Popen(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+         '-s', f"{width}x{height}", '-r', str(writer['fps']), '-i', source,
+         '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', '-f', 'mp4', writer['tmp']],
+        stdin=subprocess.PIPE if source == '-' else subprocess.DEVNULL)
+
+
+def write_frame(writer, frame):
+    """Append one frame (PNG path or RGB/RGBA array) to an open loop."""
+    rgb = np.ascontiguousarray(_rgb(frame))
+    if writer['shape'] is None:
+        writer['shape'] = rgb.shape
+    elif rgb.shape != writer['shape']:
+        raise ValueError(f"Frame size {rgb.shape[:2]} differs from {writer['shape'][:2]} in {writer['path']}")
+
+    global _encoders
+    if writer['fmt'] == 'gif':
+        if writer['frames'] == 0:
+            writer['spool'] = open(f"{writer['tmp']}.p8", 'wb')
+        image = Image.fromarray(rgb).quantize(256, method=Image.Quantize.FASTOCTREE)
+        writer['spool'].write(bytes(image.getpalette()).ljust(PALETTE_BYTES, b'\0'))
+        writer['spool'].write(image.tobytes())
+    else:
+        if writer['frames'] == 0:
+            if _encoders < MAX_ENCODERS:
+                writer['proc'] = _ffmpeg(writer, '-')
+                _encoders += 1
+            else:
+                writer['spool'] = open(f"{writer['tmp']}.rgb", 'wb')
+        (writer['proc'].stdin if writer['proc'] is not None else writer['spool']).write(rgb.tobytes())
+    writer['frames'] += 1
+
+
+def _spooled_gif_frames(writer):
+    """Read the spooled 8-bit frames back one at a time."""
+    height, width = writer['shape'][:2]
+    with open(writer['spool'].name, 'rb') as f:
+        while palette := f.read(PALETTE_BYTES):
+            image = Image.frombytes('P', (width, height), f.read(width * height))
+            image.putpalette(palette)
+            yield image
+
+
+def _discard(writer):
+    """Stop the loop's encoder and remove its temporary files; frees its encoder slot."""
+    global _encoders
+    if writer['proc'] is not None:
+        if writer['proc'].poll() is None:
+            writer['proc'].kill()
+        try:
+            writer['proc'].stdin.close()
+        except OSError:
+            pass
+        writer['proc'].wait()
+        writer['proc'] = None
+        _encoders -= 1
+    paths = [writer['tmp']]
+    if writer['spool'] is not None:
+        writer['spool'].close()
+        paths.append(writer['spool'].name)
+        writer['spool'] = None
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def close_writer(writer):
+    """Finish the loop and move it into place; returns its path (None if it got no frames)."""
+    global _encoders
+    try:
+        if writer['fmt'] == 'gif':
+            if writer['spool'] is not None:
+                writer['spool'].close()
+                frames = _spooled_gif_frames(writer)
+                next(frames).save(writer['tmp'], format='GIF', save_all=True, append_images=frames,
+                                  duration=int(1000 / writer['fps']), loop=0, disposal=1)
+        elif writer['proc'] is not None:
+            writer['proc'].stdin.close()
+            returncode = writer['proc'].wait()
+            writer['proc'] = None
+            _encoders -= 1
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg failed writing {writer['path']}")
+        elif writer['spool'] is not None:
+            # Encoded now that a single ffmpeg can read the spooled frames in one go
+            writer['spool'].close()
+            if _ffmpeg(writer, writer['spool'].name).wait() != 0:
+                raise RuntimeError(f"ffmpeg failed writing {writer['path']}")
+    except BaseException:
+        _discard(writer)
+        raise
+    if writer['spool'] is not None:
+        os.remove(writer['spool'].name)
+        writer['spool'] = None
+    if writer['frames'] == 0:
+        if os.path.exists(writer['tmp']):
+            os.remove(writer['tmp'])
+        return None
+    os.replace(writer['tmp'], writer['path'])
+    return writer['path']
+
+
+def animate_dir(output_dir, fmt='gif', fps=DEFAULT_FPS, keys=None):
+    """Build one loop per frame group in output_dir from the PNGs on disk; returns the loop paths."""
+    loops = []
+    for key, frames in sorted(group_frames(output_dir).items()):
+        if keys is not None and key not in keys:
+            continue
+        writer = open_writer(os.path.join(output_dir, f"{key}.{fmt}"), fps)
+        for path in frames:
+            write_frame(writer, path)
+        loops.append(close_writer(writer))
+        print(f"  🎞️ Saved: {os.path.basename(loops[-1])} ({len(frames)} frames)")
+    return loops
+
+
+# In-process loops, fed as frames are saved (hours must arrive in order)
+
+def new_loops(fmt='gif', fps=DEFAULT_FPS):
+    return {'fmt': fmt, 'fps': fps, 'writers': {}}
+
+
+def add_frame(loops, filepath, frame=None):
+    """Append a saved frame to its loop; frame is the in-memory image, else the PNG is read."""
+    parsed = frame_key(filepath)
+    if parsed is None:
+        return
+    path = os.path.join(os.path.dirname(filepath), f"{parsed[0]}.{loops['fmt']}")
+    if path not in loops['writers']:
+        loops['writers'][path] = open_writer(path, loops['fps'])
+    write_frame(loops['writers'][path], filepath if frame is None else frame)
+
+
+def close_loops(loops):
+    saved = []
+    writers = iter(list(loops['writers'].values()))
+    loops['writers'].clear()
+    try:
+        for writer in writers:
+            path = close_writer(writer)
+            if path is not None:
+                saved.append(path)
+                print(f"  🎞️ Saved: {os.path.basename(path)} ({writer['frames']} frames)")
+    finally:
+        # If one loop failed, the ones not closed yet still release their encoders and temporary files
+        for writer in writers:
+            _discard(writer)
+    return saved
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python animate.py <output_dir> [gif|mp4] [fps]")
+        sys.exit(1)
+
+    output_dir = sys.argv[1]
+    fmt = sys.argv[2] if len(sys.argv) >= 3 else 'gif'
+    try:
+        fps = float(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_FPS
+    except ValueError as e:
+        print(f"❌ Invalid fps: {e}")
+        sys.exit(1)
+    if not os.path.isdir(output_dir):
+        print(f"❌ Output directory not found: {output_dir}")
+        sys.exit(1)
+
+    print(f"🎬 Building {fmt} loops in {output_dir}...")
+    animate_dir(output_dir, fmt, fps)
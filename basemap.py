@@ -0,0 +1,327 @@
+import os
+import sys
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib import colormaps
+from matplotlib.cm import ScalarMappable
+from matplotlib.colorbar import make_axes
+from matplotlib.colors import BoundaryNorm, ListedColormap, Normalize
+from matplotlib.ticker import MaxNLocator
+import cartopy
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from cartopy.io import shapereader
+
+import timings
+
+# Reusable map templates.
+#
+# A template is a figure + map axes + colorbar axes built once per
+# (projection, extent, figsize, dpi, features). The map features (coastlines,
+# borders, states) are rasterized once into a transparent overlay image that is
+# pasted on top of every field, so Natural Earth geometry is never drawn twice.
+# Each field only adds its contourf/colorbar/title, saves, and removes them again.
+#
+# engine='image' is a faster path for regular lat/lon grids: the field is binned
+# into the same discrete levels contourf would use and drawn as one RGBA image
+# (imshow in PlateCarree) instead of tracing contour polygons. Other grids fall
+# back to contourf.
+#
+# Figures are drawn on an explicit Agg canvas; pyplot and its backend selection
+# are never involved. Natural Earth shapefiles are read once per process and
+# per scale (110m/50m/10m, chosen from the map extent as cartopy's auto scaler
+# does). Set NATURAL_EARTH_DIR to a directory pre-staged with
+# `python basemap.py <dir>` so compute nodes never download them.
+
+ENGINES = ('contourf', 'image')
+
+DEFAULT_FEATURES = ('coastlines', 'borders', 'states')
+
+# feature -> (Natural Earth category, layer name)
+NATURAL_EARTH_LAYERS = {
+    'coastlines': ('physical', 'coastline'),
+    'borders': ('cultural', 'admin_0_boundary_lines_land'),
+    'states': ('cultural', 'admin_1_states_provinces_lakes'),
+}
+NATURAL_EARTH_SCALES = ('110m', '50m', '10m')
+
+if os.environ.get('NATURAL_EARTH_DIR'):
+    cartopy.config['pre_existing_data_dir'] = os.environ['NATURAL_EARTH_DIR']
+
+_scaler = cfeature.AdaptiveScaler('110m', (('50m', 50), ('10m', 15)))
+_geometries = {}
+
+
+def natural_earth(name, scale):
+    """Geometries of one Natural Earth layer, read from its shapefile once per process."""
+    key = (name, scale)
+    if key not in _geometries:
+        category, layer = NATURAL_EARTH_LAYERS[name]
+        path = shapereader.natural_earth(resolution=scale, category=category, name=layer)
+        _geometries[key] = tuple(shapereader.Reader(path).geometries())
+    return _geometries[key]
+
+
+def _add_natural_earth(ax, name, **kwargs):
+    scale = _scaler.scale_from_extent(ax.get_extent(ccrs.PlateCarree()))
+    feature = cfeature.ShapelyFeature(natural_earth(name, scale), ccrs.PlateCarree(),
+                                      edgecolor='black', facecolor='none')
+    return ax.add_feature(feature, **kwargs)
+
+
+_FEATURES = {
+    'coastlines': lambda ax, linestyle: _add_natural_earth(ax, 'coastlines'),
+    'borders': lambda ax, linestyle: _add_natural_earth(ax, 'borders', linestyle=linestyle),
+    'states': lambda ax, linestyle: _add_natural_earth(ax, 'states', linestyle=linestyle),
+}
+
+_basemaps = {}
+_last_saved = {}
+
+
+def _build_basemap(projection, extent, figsize, dpi, features, linestyle, grid=(1, 1, 1)):
+    """Build a template with grid=(nrows, ncols, npanels) map axes, each with its own colorbar axes."""
+    nrows, ncols, npanels = grid
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+
+    panels = []
+    feature_artists = []
+    for i in range(npanels):
+        ax = fig.add_subplot(nrows, ncols, i + 1, projection=projection)
+        if extent is None:
+            ax.set_global()
+        else:
+            ax.set_extent(extent, crs=ccrs.PlateCarree())
+
+        feature_artists += [_FEATURES[name](ax, linestyle) for name in features]
+
+        # Reserve the colorbar axes exactly where plt.colorbar(..., pad=0.05) would put it
+        cax, _ = make_axes(ax, orientation='horizontal', pad=0.05)
+        panels.append({'ax': ax, 'cax': cax, 'cax_aspect': cax.get_box_aspect()})
+        fig.colorbar(ScalarMappable(cmap='viridis'), cax=cax, orientation='horizontal')
+
+    # Render only the features on a transparent canvas and keep the pixels
+    hidden = [fig.patch]
+    for panel in panels:
+        hidden += [panel['ax'].patch, panel['cax'], *panel['ax'].spines.values()]
+    for artist in hidden:
+        artist.set_visible(False)
+    fig.canvas.draw()
+    overlay = np.asarray(fig.canvas.buffer_rgba()).copy()
+    for artist in hidden:
+        artist.set_visible(True)
+    for artist in feature_artists:
+        artist.set_visible(False)
+
+    fig.figimage(overlay, origin='upper', zorder=10)
+    return dict(panels[0], fig=fig, panels=panels)
+
+
+def get_basemap(projection=None, extent=None, figsize=(10, 6), dpi=150, features=DEFAULT_FEATURES, linestyle=':',
+                grid=(1, 1, 1)):
+    projection = projection or ccrs.PlateCarree()
+    key = (projection.proj4_init, tuple(extent) if extent is not None else None, tuple(figsize), dpi, tuple(features),
+           linestyle, tuple(grid))
+    if key not in _basemaps:
+        _basemaps[key] = _build_basemap(projection, extent, figsize, dpi, features, linestyle, grid)
+    return _basemaps[key]
+
+
+def _remove_contours(cf):
+    try:
+        cf.remove()
+    except (AttributeError, NotImplementedError):
+        for coll in cf.collections:
+            coll.remove()
+
+
+def regular_axes(lons, lats):
+    """Return the 1-D (lon, lat) axes if the grid is a regular lat/lon grid, else None."""
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    if lons.ndim == 2:
+        # Rectilinear only if every row repeats the first one (checked on the edges)
+        if not (np.array_equal(lons[0], lons[-1]) and np.array_equal(lats[:, 0], lats[:, -1])):
+            return None
+        lon, lat = lons[0], lats[:, 0]
+    else:
+        lon, lat = lons, lats
+    lon, lat = lon.astype(np.float64), lat.astype(np.float64)
+    if lon.size < 2 or lat.size < 2:
+        return None
+    dlon, dlat = np.diff(lon), np.diff(lat)
+    if dlon[0] <= 0 or dlat[0] == 0 or not (np.allclose(dlon, dlon[0]) and np.allclose(dlat, dlat[0])):
+        return None
+    return lon, lat
+
+
+def _band_colors(levels, cmap, norm, extend):
+    """RGBA colors of contourf's filled bands (midpoint colors), plus the below/above colors."""
+    levels = np.asarray(levels, dtype=np.float64)
+    norm = norm or Normalize(levels[0], levels[-1])
+    bands = cmap(norm(0.5 * (levels[:-1] + levels[1:])))
+    if extend == 'both':
+        return bands, cmap(norm(levels[0] - 1)), cmap(norm(levels[-1] + 1))
+    return bands, (0, 0, 0, 0), (0, 0, 0, 0)
+
+
+def _image_rgba(lon, lat, data, levels, colors):
+    """Bin data into contour levels and return (rgba, extent, origin) for imshow."""
+    data = np.ma.filled(data, np.nan) if np.ma.isMaskedArray(data) else np.asarray(data)
+    dlon = lon[1] - lon[0]
+
+    # A cyclic point repeats the first column 360 degrees later
+    if lon[-1] - lon[0] >= 360 - dlon / 2:
+        lon, data = lon[:-1], data[:, :-1]
+    # PlateCarree axes span -180..180; rotate 0..360 grids to match
+    if lon[-1] > 180:
+        shift = int(np.count_nonzero(lon >= 180))
+        lon = np.roll(np.where(lon >= 180, lon - 360, lon), shift)
+        data = np.roll(data, shift, axis=1)
+
+    # Color table indexed by band: [below, band 1..n, above, missing]
+    bands, under, over = colors
+    nbands = len(bands)
+    lut = np.vstack([under, bands, over, (0, 0, 0, 0)])
+    lut = (lut * 255).round().astype(np.uint8)
+
+    index = np.searchsorted(levels, data, side='right')
+    index[data == levels[-1]] = nbands  # the top level closes the last band
+    index[np.isnan(data)] = nbands + 2
+    rgba = lut[index]
+
+    dlat = lat[1] - lat[0]
+    extent = [lon[0] - dlon / 2, lon[-1] + dlon / 2,
+              min(lat[0], lat[-1]) - abs(dlat) / 2, max(lat[0], lat[-1]) + abs(dlat) / 2]
+    return rgba, extent, 'upper' if dlat < 0 else 'lower'
+
+
+def _draw_image(ax, axes, data, levels, cmap, norm, extend):
+    cmap = colormaps[cmap] if isinstance(cmap, str) else cmap
+    if isinstance(levels, int):
+        # The same "nice" levels contourf(levels=N) picks for this field
+        levels = MaxNLocator(levels + 1).tick_values(np.nanmin(data), np.nanmax(data))
+    levels = np.asarray(levels, dtype=np.float64)
+    colors = _band_colors(levels, cmap, norm, extend)
+    rgba, extent, origin = _image_rgba(*axes, data, levels, colors)
+    im = ax.imshow(rgba, extent=extent, origin=origin, interpolation='nearest', transform=ccrs.PlateCarree())
+
+    # Colorbar from the band colors so it matches contourf's discrete look
+    bands, under, over = colors
+    band_cmap = ListedColormap(bands).with_extremes(under=under, over=over)
+    return im, ScalarMappable(norm=BoundaryNorm(levels, band_cmap.N), cmap=band_cmap)
+
+
+def _draw_field(fig, panel, lons, lats, data, title, cmap, cbar_label, levels, engine, barbs=None):
+    """Draw one field with its title and colorbar into a template panel; returns the artists to remove.
+
+    barbs is an optional (lons, lats, u, v) tuple of already thinned wind barbs.
+    """
+    ax, cax = panel['ax'], panel['cax']
+
+    # A list of levels is a fixed scale shared across figures: map it with a
+    # BoundaryNorm and extend the colorbar for values outside it
+    norm = None
+    extend = 'neither'
+    if not isinstance(levels, int):
+        cmap = colormaps[cmap] if isinstance(cmap, str) else cmap
+        norm = BoundaryNorm(levels, cmap.N, extend='both')
+        extend = 'both'
+
+    axes = regular_axes(lons, lats) if engine == 'image' else None
+
+    ax.set_title(title)
+    if axes is not None:
+        cf, mappable = _draw_image(ax, axes, data, levels, cmap, norm, extend)
+    else:
+        cf = mappable = ax.contourf(lons, lats, data, levels=levels, cmap=cmap, norm=norm, extend=extend,
+                                    transform=ccrs.PlateCarree())
+    # Each colorbar installs its own axes locator (and resizes for extends); start clean
+    cax.clear()
+    cax.set_axes_locator(None)
+    cax.set_box_aspect(panel['cax_aspect'])
+    fig.colorbar(mappable, cax=cax, orientation='horizontal', label=cbar_label or '', extend=extend)
+    if barbs is None:
+        return [cf]
+    return [cf, ax.barbs(*barbs, length=5, linewidth=0.5, transform=ccrs.PlateCarree())]
+
+
+def plot_on_basemap(lons, lats, data, title, filepath, cmap='viridis', cbar_label=None, levels=20,
+                    projection=None, extent=None, figsize=(10, 6), dpi=150, features=DEFAULT_FEATURES, linestyle=':',
+                    engine='contourf', barbs=None):
+    with timings.stage('figure', file=filepath):
+        bm = get_basemap(projection, extent, figsize, dpi, features, linestyle)
+    with timings.stage('contour', file=filepath, engine=engine):
+        drawn = _draw_field(bm['fig'], bm, lons, lats, data, title, cmap, cbar_label, levels, engine, barbs)
+    try:
+        with timings.stage('savefig', file=filepath):
+            bm['fig'].savefig(filepath, dpi=dpi)
+        _last_saved.update(filepath=filepath, fig=bm['fig'])
+    finally:
+        for artist in drawn:
+            _remove_contours(artist)
+        bm['ax'].set_title('')
+
+
+def last_frame(filepath):
+    """RGBA pixels of filepath if it was the last image saved in this process, else None.
+
+    The array is a view of the template's canvas and is only valid until the next plot.
+    """
+    if _last_saved.get('filepath') != filepath:
+        return None
+    return np.asarray(_last_saved['fig'].canvas.buffer_rgba())
+
+
+def panel_grid(npanels, ncols=None):
+    ncols = ncols or min(npanels, 3)
+    return -(-npanels // ncols), ncols, npanels
+
+
+def plot_panels(panels, title, filepath, ncols=None, projection=None, extent=None, panel_size=(6, 4), dpi=150,
+                features=DEFAULT_FEATURES, linestyle=':', engine='contourf'):
+    """Draw several fields on one shared-projection subplot grid and save a single image.
+
+    Each panel is a dict with 'lons', 'lats', 'data', 'title' and optionally
+    'cmap', 'cbar_label', 'levels' and 'barbs' (as in plot_on_basemap).
+    """
+    grid = panel_grid(len(panels), ncols)
+    figsize = (panel_size[0] * grid[1], panel_size[1] * grid[0])
+    with timings.stage('figure', file=filepath):
+        bm = get_basemap(projection, extent, figsize, dpi, features, linestyle, grid)
+    fig = bm['fig']
+
+    drawn = []
+    try:
+        fig.suptitle(title)
+        contour = timings.start('contour', file=filepath, engine=engine, panels=len(panels))
+        for panel, field in zip(bm['panels'], panels):
+            drawn += _draw_field(fig, panel, field['lons'], field['lats'], field['data'], field['title'],
+                                 field.get('cmap', 'viridis'), field.get('cbar_label'), field.get('levels', 20),
+                                 engine, field.get('barbs'))
+        timings.stop(contour)
+        with timings.stage('savefig', file=filepath):
+            fig.savefig(filepath, dpi=dpi)
+        _last_saved.update(filepath=filepath, fig=fig)
+    finally:
+        for cf in drawn:
+            _remove_contours(cf)
+        for panel in bm['panels']:
+            panel['ax'].set_title('')
+        fig.suptitle('')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python basemap.py <natural_earth_dir>")
+        sys.exit(1)
+
+    # Download every layer and scale the templates can use, laid out as cartopy expects
+    cartopy.config['data_dir'] = cartopy.config['pre_existing_data_dir'] = sys.argv[1]
+    for name, (category, layer) in NATURAL_EARTH_LAYERS.items():
+        for scale in NATURAL_EARTH_SCALES:
+            path = shapereader.natural_earth(resolution=scale, category=category, name=layer)
+            print(f"  ✅ {name} {scale}: {path}")
+    print(f"🗺️  Natural Earth staged; set NATURAL_EARTH_DIR={sys.argv[1]}")
@@ -0,0 +1,249 @@
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import memory_budget
+import synthetic
+
+# Benchmarks for the plotting pipeline on synthetic inputs.
+#
+# Generates GFS-like GRIB2 files (1, 0.5, 0.25 degrees) and a WRF/MPASSIT-like
+# NetCDF file under <workdir>, then times each stage on its own: open/scan,
+# index, decode, lat/lon, basemap template, contour, savefig. The full scripts
+# run as end-to-end "pipeline" stages. Every stage is repeated and reported as
+# min/median seconds plus peak RSS. Results go to <workdir>/benchmark_<time>.json.
+# Pass an earlier result file to print a per-stage comparison.
+#
+# The basemap stages draw Natural Earth features. On machines without network
+# access, set BENCH_FEATURES=0 to benchmark without them. The pipeline stages
+# always draw features, so they are skipped in that case.
+
+REPEAT = 3
+FIELD = ('Temperature', 'isobaricInhPa', 500)
+NC_LEVELS = (0, 10, 20)
+
+
+def timed(results, case, stage, fn, repeat=REPEAT, **meta):
+    """Run fn `repeat` times, record min/median seconds and peak RSS; returns fn's last result."""
+    seconds = []
+    peak = 0.0
+    for _ in range(repeat):
+        memory_budget.reset_peak_rss()
+        t0 = time.perf_counter()
+        out = fn()
+        seconds.append(time.perf_counter() - t0)
+        peak = max(peak, memory_budget.peak_rss_mb())
+    results.append(dict(meta, case=case, stage=stage, repeat=repeat, min=min(seconds),
+                        median=statistics.median(seconds), peak_mb=round(peak, 1)))
+    print(f"  {case:<14} {stage:<18} {min(seconds):9.4f} s  (median {statistics.median(seconds):.4f}, "
+          f"peak {peak:.0f} MB)")
+    return out
+
+
+def _render_stages(results, case, lons, lats, data, extent, features, repeat, workdir):
+    import basemap
+
+    def build():
+        basemap._basemaps.clear()
+        return basemap.get_basemap(extent=extent, features=features)
+
+    bm = timed(results, case, 'basemap', build, repeat)
+    for engine in basemap.ENGINES:
+        stage = 'contour' if engine == 'contourf' else f"contour_{engine}"
+
+        def draw():
+            artists = basemap._draw_field(bm['fig'], bm, lons, lats, data, 'benchmark', 'viridis', None, 20, engine)
+            bm['fig'].canvas.draw()
+            return artists
+
+        def draw_and_clear():
+            for artist in draw():
+                basemap._remove_contours(artist)
+
+        timed(results, case, stage, draw_and_clear, repeat)
+
+    artists = draw()
+    path = os.path.join(workdir, f"benchmark_{case}.png")
+    timed(results, case, 'savefig', lambda: bm['fig'].savefig(path, dpi=150), repeat)
+    for artist in artists:
+        basemap._remove_contours(artist)
+
+
+def bench_grib(results, grib_file, case, features, repeat=REPEAT):
+    import grib_index
+    import grid_cache
+
+    timed(results, case, 'scan', lambda: grib_index.scan_messages(grib_file), repeat)
+    index = timed(results, case, 'index', lambda: grib_index.load_index(grib_file, rebuild=True), repeat)
+
+    def decode_all():
+        with open(grib_file, 'rb') as f:
+            for msg in index['messages']:
+                grib_index.read_message(f, msg).values
+
+    timed(results, case, 'decode', decode_all, repeat, messages=len(index['messages']))
+
+    varname, level_type, level = FIELD
+    msg = next(m for m in index['messages'] if m['name'] == varname and m['typeOfLevel'] == level_type
+               and m['level'] == level)
+    with open(grib_file, 'rb') as f:
+        grb = timed(results, case, 'decode_field', lambda: grib_index.read_message(f, msg), repeat)
+        data = grb.values
+    timed(results, case, 'latlons', grb.latlons, repeat)
+    grid_cache._grids.clear()
+    lats, lons = timed(results, case, 'latlons_cached', lambda: grid_cache.get_latlons(grb), repeat)
+
+    _render_stages(results, case, lons, lats, data, None, features, repeat, os.path.dirname(grib_file))
+
+
+def bench_netcdf(results, nc_file, case, features, repeat=REPEAT):
+    from netCDF4 import Dataset
+
+    def open_close():
+        Dataset(nc_file).close()
+
+    timed(results, case, 'open', open_close, repeat)
+    with Dataset(nc_file) as ds:
+        lats, lons = timed(results, case, 'latlons', lambda: (ds.variables['XLAT'][0], ds.variables['XLONG'][0]),
+                           repeat)
+        data = timed(results, case, 'decode_2d', lambda: ds.variables['T2'][0, :, :], repeat)
+        timed(results, case, 'decode_levels',
+              lambda: [ds.variables[name][0, lvl, :, :] for name in ('T', 'U', 'V', 'W') for lvl in NC_LEVELS],
+              repeat, fields=4 * len(NC_LEVELS))
+
+    import nc_access
+    nc = nc_access.open_file(nc_file)
+    try:
+        def latlons_shared():
+            nc_access._grids.clear()
+            return nc_access.coordinates(nc)
+
+        timed(results, case, 'latlons_nc_access', latlons_shared, repeat)
+        timed(results, case, 'decode_levels_nc_access',
+              lambda: [values for name in ('T', 'U', 'V', 'W')
+                       for _, values in nc_access.read_levels(nc, name, NC_LEVELS)],
+              repeat, fields=4 * len(NC_LEVELS))
+    finally:
+        nc_access.close_file(nc)
+
+    extent = [float(lons.min()), float(lons.max()), float(lats.min()), float(lats.max())]
+    _render_stages(results, case, lons, lats, data, extent, features, repeat, os.path.dirname(nc_file))
+
+
+def bench_pipelines(results, workdir, grib_files, nc_file, repeat=1):
+    """End-to-end runs of the plotting scripts, each in a fresh interpreter."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    levels = ','.join(str(lvl) for lvl in NC_LEVELS)
+
+    def run(args, cwd):
+        subprocess.run([sys.executable] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL,
+                       env=dict(os.environ, PLOT_FORCE='1'))
+
+    def pipeline(case, stage, args, cwd):
+        try:
+            timed(results, case, stage, lambda: run(args, cwd), repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"  ❌ {case} {stage} failed: {e}")
+
+    for case, grib_file in grib_files.items():
+        # plot_gfs_forecast.py looks for gfs.t00z.pgrb2.0p25.fXXX in its input directory
+        case_dir = os.path.join(workdir, case)
+        os.makedirs(case_dir, exist_ok=True)
+        link = os.path.join(case_dir, 'gfs.t00z.pgrb2.0p25.f000')
+        if not os.path.lexists(link):
+            os.symlink(os.path.abspath(grib_file), link)
+        pipeline(case, 'pipeline', [os.path.join(repo, 'plot_gfs_forecast.py'), '0', '500'], case_dir)
+
+    nc_dir = os.path.dirname(nc_file)
+    pipeline('mpassit', 'pipeline_fields', [os.path.join(repo, 'plot_nc_mpassit', 'plot_nc_fields.py'),
+                                            nc_file, '0', levels], nc_dir)
+    pipeline('mpassit', 'pipeline_multi', [os.path.join(repo, 'ncplot_multi.py'), nc_file, levels], nc_dir)
+
+
+def environment():
+    import matplotlib
+    versions = {'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__}
+    for module in ('pygrib', 'cartopy', 'netCDF4'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {'host': platform.node(), 'platform': platform.platform(), 'cpus': os.cpu_count(), 'versions': versions}
+
+
+def run(workdir, resolutions=tuple(synthetic.GFS_RESOLUTIONS), repeat=REPEAT, features=True):
+    import basemap
+
+    os.makedirs(workdir, exist_ok=True)
+    features = basemap.DEFAULT_FEATURES if features else ()
+    results = []
+
+    print("🧪 Generating synthetic inputs...")
+    grib_files = {}
+    for res_name in resolutions:
+        path = os.path.join(workdir, f"gfs.t00z.pgrb2.{res_name}.f000")
+        if not os.path.exists(path):
+            synthetic.write_gfs_grib(path, synthetic.GFS_RESOLUTIONS[res_name])
+        grib_files[f"gfs_{res_name}"] = path
+    nc_file = os.path.join(workdir, 'mpassit.f000.nc')
+    if not os.path.exists(nc_file):
+        synthetic.write_mpassit_nc(nc_file)
+
+    print("\n⏱️  Stage timings")
+    for case, path in grib_files.items():
+        bench_grib(results, path, case, features, repeat)
+    bench_netcdf(results, nc_file, 'mpassit', features, repeat)
+    if features:
+        bench_pipelines(results, workdir, grib_files, nc_file)
+    else:
+        print("  (pipeline stages skipped: BENCH_FEATURES=0)")
+
+    report = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'features': bool(features),
+              'environment': environment(), 'results': results}
+    path = os.path.join(workdir, f"benchmark_{datetime.datetime.now():%Y%m%dT%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"\n  ✅ Saved: {path}")
+    return report
+
+
+def compare(baseline, report):
+    """Print min seconds per (case, stage) against a baseline report."""
+    before = {(r['case'], r['stage']): r['min'] for r in baseline['results']}
+    print(f"\n{'Case':<14} {'Stage':<18} {'Before':>9} {'After':>9} {'Speedup':>8}")
+    print("=" * 62)
+    for r in report['results']:
+        old = before.get((r['case'], r['stage']))
+        speedup = f"{old / r['min']:7.2f}x" if old and r['min'] > 0 else '       -'
+        old = f"{old:9.4f}" if old is not None else '        -'
+        print(f"{r['case']:<14} {r['stage']:<18} {old} {r['min']:9.4f} {speedup}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark.py <workdir> [resolutions, e.g. 1p00,0p50,0p25] [repeat] [baseline.json]")
+        sys.exit(1)
+
+    workdir = sys.argv[1]
+    try:
+        resolutions = sys.argv[2].split(',') if len(sys.argv) >= 3 else list(synthetic.GFS_RESOLUTIONS)
+        unknown = [r for r in resolutions if r not in synthetic.GFS_RESOLUTIONS]
+        if unknown:
+            raise ValueError(f"unknown resolutions {unknown}")
+        repeat = int(sys.argv[3]) if len(sys.argv) >= 4 else REPEAT
+    except ValueError as e:
+        print(f"❌ Invalid arguments: {e}")
+        sys.exit(1)
+
+    report = run(workdir, resolutions, repeat,
+                 features=os.environ.get('BENCH_FEATURES', '1').lower() not in ('0', 'false', 'no'))
+    if len(sys.argv) >= 5:
+        with open(sys.argv[4]) as f:
+            compare(json.load(f), report)
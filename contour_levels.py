@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+import derived
+import grib_index
+import grid_cache
+import memory_budget
+import nc_access
+import regions
+
+# Fixed contour levels shared by every forecast hour.
+#
+# One sweep over all forecast hours decodes each (variable, level) field,
+# keeps a strided float32 subsample, and turns the pooled 1st-99th percentile
+# range into "nice" levels the same way contourf(levels=20) would. Derived
+# products are sampled from the same decodes. With a domain, fields are cut to
+# the region first, so the levels span only what the regional maps show. The
+# result is cached as contour_levels.json (contour_levels_<domain>.json) in the
+# output directory; plot_forecast_hour reuses it (as BoundaryNorm levels) so
+# colorbars match from f000 to f072. compute_nc_levels does the same sweep over
+# the MPASSIT/WRF NetCDF files that plot_nc_fields.py and ncplot_multi.py plot.
+
+LEVELS_FILE = 'contour_levels.json'
+NUM_LEVELS = 20
+PERCENTILES = (1, 99)
+MAX_SAMPLES = 50000
+
+
+def levels_key(varname, level_label):
+    return f"{varname}|{level_label}"
+
+
+def subsample(data, max_samples=MAX_SAMPLES):
+    flat = np.ma.filled(data, np.nan).ravel() if np.ma.isMaskedArray(data) else np.ravel(data)
+    stride = max(1, flat.size // max_samples)
+    return flat[::stride].astype(np.float32)
+
+
+def robust_levels(samples, num_levels=NUM_LEVELS, percentiles=PERCENTILES):
+    from matplotlib.ticker import MaxNLocator  # only needed when levels are computed
+
+    lo, hi = np.nanpercentile(np.concatenate(samples), percentiles)
+    if not np.isfinite(lo) or not np.isfinite(hi):
+        return None
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return [float(x) for x in MaxNLocator(num_levels + 1).tick_values(lo, hi)]
+
+
+def levels_path(output_dir, domain_label=None):
+    name = LEVELS_FILE if domain_label is None else LEVELS_FILE.replace('.json', f"_{domain_label}.json")
+    return os.path.join(output_dir, name)
+
+
+def load_levels(output_dir, domain_label=None):
+    try:
+        with open(levels_path(output_dir, domain_label)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_levels(output_dir, table, domain_label=None):
+    os.makedirs(output_dir, exist_ok=True)
+    path = levels_path(output_dir, domain_label)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(table, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    return path
+
+
+def compute_levels(grib_files, variables, pressure_levels, products=None, extent=None):
+    """Sweep grib_files once and return {'var|level': [levels...]} from pooled subsamples.
+
+    products are derived.plan specs (plot_gfs_forecast.derived_variables); extent
+    cuts every field to a domain before sampling.
+    """
+    samples = {}
+    for grib_file in grib_files:
+        index = grib_index.load_index(grib_file)
+        field_data = grib_index.select(index, variables)
+        items = derived.plan(products, field_data, pressure_levels) if products else []
+        # Derived-product inputs sampled below are kept raw (unconverted) by message offset
+        # until derived.evaluate takes them, so every message is decoded once per file
+        derived_inputs = {m['offset'] for *_, msgs in items for m in msgs}
+        kept = {}
+        with open(grib_file, 'rb') as f:
+            def decode(msg):
+                if msg['offset'] in kept:
+                    return kept.pop(msg['offset'])
+                grb = grib_index.read_message(f, msg)
+                data = memory_budget.field_values(grb, low_memory=True)
+                lats, lons = grid_cache.get_latlons(grb)
+                if extent is not None:
+                    index, lats, lons = regions.subset_grid(lats, lons, extent)
+                    data = regions.subset_field(data, index)
+                return grb, data, lats, lons
+
+            for varname, settings, level_label, msg in grib_index.field_messages(field_data, variables,
+                                                                                 pressure_levels):
+                grb, data, lats, lons = decode(msg)
+                if msg['offset'] in derived_inputs:
+                    kept[msg['offset']] = (grb, data, lats, lons)
+                    if 'convert' in settings:
+                        data = data.copy()  # conversions work in place
+                if 'convert' in settings:
+                    data = settings['convert'](data)
+                samples.setdefault(levels_key(varname, level_label), []).append(subsample(data))
+                del grb, data
+
+            if items:
+                for name, _, level_label, _, values, *_ in derived.evaluate(items, decode):
+                    samples.setdefault(levels_key(name, level_label), []).append(subsample(values))
+                    del values
+    return levels_table(samples)
+
+
+def levels_table(samples):
+    """{'var|level': [levels...]} from {'var|level': [subsamples...]}; all-missing fields are left out."""
+    table = {}
+    for key, parts in samples.items():
+        levels = robust_levels(parts)
+        if levels is not None:
+            table[key] = levels
+    return table
+
+
+def compute_nc_levels(nc_paths, variables, levels, use_mmap=False):
+    """Sweep NetCDF files once and return {'VAR|surface' or 'VAR|lvlN': [levels...]}.
+
+    (Time, y, x) variables are sampled as surface fields, (Time, level, y, x) ones
+    at each in-range index of levels.
+    """
+    samples = {}
+    for nc in nc_access.each_file(nc_paths, use_mmap):
+        for name in variables:
+            if name not in nc['ds'].variables:
+                continue
+            var = nc_access.variable(nc, name)
+            if var.ndim == 3:
+                samples.setdefault(levels_key(name, 'surface'), []).append(subsample(nc_access.read_field(nc, name)))
+            elif var.ndim == 4:
+                in_range = [level for level in levels if 0 <= level < var.shape[1]]
+                for level, values in nc_access.read_levels(nc, name, in_range):
+                    samples.setdefault(levels_key(name, f"lvl{level}"), []).append(subsample(values))
+    return levels_table(samples)
+
+
+def find_grib_files(input_dir, hours):
+    files = []
+    for forecast_hour in hours:
+        for fh_str in (f"{forecast_hour:03d}", f"{forecast_hour:02d}"):
+            path = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str}")
+            if os.path.exists(path):
+                files.append(path)
+                break
+    return files
+
+
+def precompute(input_dir, hours, pressure_levels, base_output_dir='level_plots', domain=None):
+    """Compute shared levels for the given hours and store them in each cycle's output directory."""
+    from plot_gfs_forecast import variables, derived_variables
+
+    domain_label, extent = regions.parse_domain(domain)
+
+    grib_files = find_grib_files(input_dir, hours)
+    if not grib_files:
+        print(f"❌ No GRIB files found in {input_dir} for hours {list(hours)}")
+        return None
+
+    print(f"📏 Computing shared contour levels from {len(grib_files)} files...")
+    table = compute_levels(grib_files, variables, pressure_levels, derived_variables, extent)
+    yyyymmdd = str(grib_index.load_index(grib_files[0])['messages'][0]['dataDate'])
+    path = save_levels(f"{yyyymmdd}_{base_output_dir}", table, domain_label)
+    print(f"  ✅ Saved: {path} ({len(table)} fields)")
+    return table
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python contour_levels.py <start_hr> <end_hr> <interval> [pressure_levels] [input_dir]")
+        sys.exit(1)
+
+    try:
+        start_hr, end_hr, interval = (int(x) for x in sys.argv[1:4])
+        pressure_levels = [int(x) for x in sys.argv[4].split(',')] if len(sys.argv) >= 5 else [500]
+    except ValueError as e:
+        print(f"❌ Invalid arguments: {e}")
+        sys.exit(1)
+
+    input_dir = sys.argv[5] if len(sys.argv) >= 6 else '.'
+    try:
+        # PLOT_DOMAIN: the region plot_gfs_forecast.py will be run with
+        table = precompute(input_dir, range(start_hr, end_hr + 1, interval), pressure_levels,
+                           domain=os.environ.get('PLOT_DOMAIN'))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if table is None:
+        sys.exit(1)
@@ -0,0 +1,126 @@
+from collections import Counter
+
+import numpy as np
+
+# Derived fields computed from decoded GRIB inputs.
+#
+# A derived variable is declared like a raw one (units, cmap, level_type) plus
+# 'inputs', the raw variables it is computed from, and 'compute', a function
+# called as compute(*inputs, grid) with grid = (lats, lons). An input is either a
+# variable name, taken at the product's own level, or a (variable name, level)
+# pair for fixed-level products such as thickness. All products of a forecast
+# hour are planned together and each input message is decoded once, then dropped
+# after the last product that needs it.
+
+EARTH_RADIUS = 6371229.0  # m, as used by GFS
+MS_TO_KNOTS = 1.943844
+BARBS_PER_AXIS = 30
+
+
+def wind_speed(u, v, grid):
+    return np.hypot(u, v)
+
+
+def thickness(z_bottom, z_top, grid):
+    return z_top - z_bottom
+
+
+def dewpoint(t, rh, grid):
+    """Dewpoint (°C) from temperature (K) and relative humidity (%), Magnus formula."""
+    b, c = 17.625, 243.04
+    tc = t - 273.15
+    gamma = np.log(np.clip(rh, 1e-3, None) / 100.0) + b * tc / (c + tc)
+    return c * gamma / (b - gamma)
+
+
+def relative_vorticity(u, v, grid):
+    """Relative vorticity (10⁻⁵ s⁻¹) on a regular lat/lon grid by centered differences.
+
+    zeta = (dv/dlambda - d(u cos phi)/dphi) / (a cos phi); periodic in longitude for
+    global grids, one-sided at the edges of regional ones, undefined at the poles.
+    """
+    lats, lons = grid
+    phi = np.deg2rad(np.asarray(lats[:, 0], dtype=np.float64))
+    lam = np.deg2rad(np.asarray(lons[0], dtype=np.float64))
+    coslat = np.cos(phi)[:, None]
+
+    dlam = lam[1] - lam[0]
+    if abs(dlam * lam.size - 2 * np.pi) < abs(dlam) / 2:
+        dv_dlam = (np.roll(v, -1, axis=1) - np.roll(v, 1, axis=1)) / (2 * dlam)
+    else:
+        dv_dlam = np.gradient(v, lam, axis=1)
+    ducos_dphi = np.gradient(u * coslat, phi, axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zeta = (dv_dlam - ducos_dphi) / (EARTH_RADIUS * coslat) * 1e5
+    zeta[np.abs(coslat[:, 0]) < 1e-6] = np.nan
+    return zeta
+
+
+def thin_barbs(lats, lons, u, v, per_axis=BARBS_PER_AXIS):
+    """Every n-th point of a wind field as small (lons, lats, u, v) arrays in knots for ax.barbs.
+
+    The stride gives about per_axis barbs along the longer side of the grid.
+    """
+    step = max(1, max(u.shape) // per_axis)
+    rows = cols = slice(None, None, step)
+    lons = (np.asarray(lons[rows, cols], dtype=np.float64) + 180) % 360 - 180
+    return (lons, np.array(lats[rows, cols], dtype=np.float64),
+            np.asarray(u[rows, cols]) * MS_TO_KNOTS, np.asarray(v[rows, cols]) * MS_TO_KNOTS)
+
+
+def _input_message(field_data, name, level):
+    msgs = field_data.get(name) or []
+    if level is None:
+        return msgs[0] if msgs else None
+    return next((m for m in msgs if m['level'] == level), None)
+
+
+def plan(products, field_data, pressure_levels):
+    """List (name, spec, level_label, msgs) for every product whose inputs are all in the file."""
+    items = []
+    for name, spec in products.items():
+        if 'level_label' in spec:
+            targets = [(spec['level_label'], None)]
+        elif spec['level_type'] == 'isobaricInhPa':
+            targets = [(f"{level}hPa", level) for level in pressure_levels]
+        else:
+            targets = [(None, None)]
+
+        for level_label, level in targets:
+            msgs = []
+            for inp in spec['inputs']:
+                inp_name, inp_level = inp if isinstance(inp, tuple) else (inp, level)
+                msgs.append(_input_message(field_data, inp_name, inp_level))
+            if None in msgs:
+                print(f"  ❌ {name} inputs not available" + (f" at {level_label}" if level_label else ""))
+                continue
+            if level_label is None:
+                level_label = f"{msgs[0]['level']}m" if spec['level_type'] == 'heightAboveGround' else "surface"
+            items.append((name, spec, level_label, msgs))
+    return items
+
+
+def evaluate(items, decode):
+    """Compute planned products, decoding each input message once.
+
+    decode(msg) returns (grb, values, lats, lons). Yields
+    (name, spec, level_label, msgs, values, inputs, grid, grb) in plan order.
+    """
+    remaining = Counter(m['offset'] for *_, msgs in items for m in msgs)
+    cache = {}
+    for name, spec, level_label, msgs in items:
+        for m in msgs:
+            if m['offset'] not in cache:
+                cache[m['offset']] = decode(m)
+        decoded = [cache[m['offset']] for m in msgs]
+        grb, _, lats, lons = decoded[0]
+        inputs = [d[1] for d in decoded]
+        values = spec['compute'](*inputs, (lats, lons))
+        yield name, spec, level_label, msgs, values, inputs, (lats, lons), grb
+
+        del decoded, inputs, values
+        for m in msgs:
+            remaining[m['offset']] -= 1
+            if remaining[m['offset']] == 0:
+                del cache[m['offset']]
@@ -0,0 +1,305 @@
+import datetime
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import grib_index
+import grid_cache
+import memory_budget
+import render_pool
+
+# Per-gridpoint statistics over many GRIB files.
+#
+# Every (variable, level) field of every file updates a running state, one
+# message at a time: count, mean and sum of squared deviations (Welford's online
+# update, in float64), min, max and the number of times each exceedance threshold
+# was passed. Only the state and the current field are in memory. Missing or
+# masked points are not counted, so the count is per grid point.
+#
+# Files are split among worker processes. Each worker keeps its own partial state
+# and the states are merged at the end (Chan et al.'s pairwise combination), so the
+# result does not depend on the split. A worker writes its state to
+# <stats_dir>/part_<n>.npz every STATS_CHECKPOINT_EVERY files, along with the list
+# of files it contains. A rerun loads the parts and only reads the files that are
+# not in any of them, so an interrupted run resumes where it stopped.
+#
+# The merged statistics are plotted with the regular map renderer: mean, standard
+# deviation, min, max and exceedance frequency (%) per field.
+
+CHECKPOINT_EVERY = int(os.environ.get('STATS_CHECKPOINT_EVERY', 10))
+
+# Exceedance thresholds per variable, in the plotted units (after 'convert')
+THRESHOLDS = {
+    'Convective available potential energy': (1000, 2500),
+    '2 metre temperature': (0, 30),
+    'Precipitation rate': (1e-4, 1e-3),
+}
+
+
+def new_state():
+    return {'files': [], 'fields': {}}
+
+
+def _new_field(shape, units, grid, thresholds):
+    return {
+        'units': units, 'grid': grid,
+        'count': np.zeros(shape, dtype=np.int32),
+        'mean': np.zeros(shape, dtype=np.float64),
+        'm2': np.zeros(shape, dtype=np.float64),
+        'min': np.full(shape, np.inf, dtype=np.float32),
+        'max': np.full(shape, -np.inf, dtype=np.float32),
+        'exceed': {float(t): np.zeros(shape, dtype=np.int32) for t in thresholds},
+    }
+
+
+def update(field, values):
+    """Add one 2-D field to a running state (Welford); NaN and masked points are skipped."""
+    x = np.ma.filled(values, np.nan) if np.ma.isMaskedArray(values) else np.asarray(values)
+    valid = np.isfinite(x)
+    field['count'] += valid
+    delta = np.where(valid, x - field['mean'], 0.0)
+    field['mean'] += np.divide(delta, field['count'], out=np.zeros_like(delta), where=valid)
+    field['m2'] += delta * np.where(valid, x - field['mean'], 0.0)
+    np.fmin(field['min'], x, out=field['min'])
+    np.fmax(field['max'], x, out=field['max'])
+    for threshold, count in field['exceed'].items():
+        count += x > threshold
+
+
+def merge_field(a, b):
+    """Combine two partial states of the same field into a (in place) and return it."""
+    total = a['count'] + b['count']
+    weight = np.divide(b['count'], total, out=np.zeros(total.shape), where=total > 0)
+    delta = b['mean'] - a['mean']
+    a['mean'] += delta * weight
+    a['m2'] += b['m2'] + delta ** 2 * a['count'] * weight
+    a['count'] = total
+    np.fmin(a['min'], b['min'], out=a['min'])
+    np.fmax(a['max'], b['max'], out=a['max'])
+    for threshold, count in b['exceed'].items():
+        a['exceed'].setdefault(threshold, np.zeros_like(count))
+        a['exceed'][threshold] += count
+    return a
+
+
+def merge(a, b):
+    a['files'] += b['files']
+    for label, field in b['fields'].items():
+        if label in a['fields']:
+            merge_field(a['fields'][label], field)
+        else:
+            a['fields'][label] = field
+    return a
+
+
+def results(field):
+    """{'mean', 'std', 'min', 'max', 'count', 'exceed': {threshold: % of samples}} as 2-D arrays."""
+    count = field['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = np.where(count > 1, field['m2'] / (count - 1), np.nan)
+        return {
+            'count': count,
+            'mean': np.where(count > 0, field['mean'], np.nan),
+            'std': np.sqrt(variance),
+            'min': np.where(count > 0, field['min'], np.nan),
+            'max': np.where(count > 0, field['max'], np.nan),
+            'exceed': {t: np.where(count > 0, 100.0 * n / count, np.nan) for t, n in field['exceed'].items()},
+        }
+
+
+def save_state(state, path):
+    """Write a state as one .npz (metadata included), replacing path atomically."""
+    meta = {'files': state['files'], 'fields': {}}
+    arrays = {}
+    for i, (label, field) in enumerate(state['fields'].items()):
+        meta['fields'][label] = {'key': i, 'units': field['units'], 'grid': field['grid'],
+                                 'thresholds': list(field['exceed'])}
+        for name in ('count', 'mean', 'm2', 'min', 'max'):
+            arrays[f"{i}_{name}"] = field[name]
+        for j, count in enumerate(field['exceed'].values()):
+            arrays[f"{i}_exceed{j}"] = count
+    arrays['meta'] = np.array(json.dumps(meta))
+    tmp = f"{path[:-len('.npz')]}.tmp{os.getpid()}.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_state(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        state = {'files': meta['files'], 'fields': {}}
+        for label, info in meta['fields'].items():
+            i = info['key']
+            field = {name: data[f"{i}_{name}"] for name in ('count', 'mean', 'm2', 'min', 'max')}
+            field.update(units=info['units'], grid=info['grid'],
+                         exceed={t: data[f"{i}_exceed{j}"] for j, t in enumerate(info['thresholds'])})
+            state['fields'][label] = field
+    return state
+
+
+def accumulate_file(state, grib_file, variables, pressure_levels, thresholds=THRESHOLDS):
+    """Add every configured (variable, level) field of one file to state."""
+    index = grib_index.load_index(grib_file)
+    field_data = grib_index.select(index, variables)
+    with open(grib_file, 'rb') as f:
+        for varname, settings, level_label, msg in grib_index.field_messages(field_data, variables, pressure_levels):
+            grb = grib_index.read_message(f, msg)
+            values = memory_budget.field_values(grb, low_memory=True)
+            if 'convert' in settings:
+                values = settings['convert'](values)
+            label = f"{varname}|{level_label}"
+            if label not in state['fields']:
+                # Registers the grid in the grid cache, where the plots find it again
+                grid_cache.get_latlons(grb)
+                key = grid_cache.grid_key(grb)
+                state['fields'][label] = _new_field(values.shape, settings['units'],
+                                                    grid_cache.grid_id(key) if key else None,
+                                                    thresholds.get(varname, ()))
+            field = state['fields'][label]
+            if field['count'].shape != values.shape:
+                print(f"⚠️ {label} in {os.path.basename(grib_file)} is on another grid; skipped")
+                continue
+            update(field, values)
+            del grb, values
+    state['files'].append(os.path.abspath(grib_file))
+
+
+def _accumulate_part(part_path, grib_files, variables, pressure_levels, every=CHECKPOINT_EVERY):
+    """Worker: add grib_files to the partial state at part_path, checkpointing as it goes."""
+    state = load_state(part_path) if os.path.exists(part_path) else new_state()
+    for n, grib_file in enumerate(grib_files, 1):
+        try:
+            grib_index.load_index(grib_file)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"❌ {grib_file}: {e}")
+            continue
+        # An error past this point stops the worker without a save, so no checkpoint holds part of a file
+        accumulate_file(state, grib_file, variables, pressure_levels)
+        print(f"  🧮 {os.path.basename(grib_file)} ({n}/{len(grib_files)} in {os.path.basename(part_path)})")
+        if n % every == 0:
+            save_state(state, part_path)
+    save_state(state, part_path)
+    return part_path
+
+
+def accumulate(grib_files, stats_dir, variables, pressure_levels, workers=1):
+    """Statistics of all grib_files, resuming from the parts already in stats_dir; returns the merged state."""
+    os.makedirs(stats_dir, exist_ok=True)
+    parts = sorted(glob.glob(os.path.join(stats_dir, 'part_*.npz')))
+    done = set()
+    for part in parts:
+        done.update(load_state(part)['files'])
+    todo = [path for path in grib_files if os.path.abspath(path) not in done]
+    print(f"🧮 {len(grib_files) - len(todo)} of {len(grib_files)} files already in {stats_dir}; "
+          f"{len(todo)} to read")
+
+    # New parts for the remaining files, one contiguous share per worker
+    first = max((int(os.path.basename(p)[5:-4]) for p in parts), default=-1) + 1
+    shares = [share for share in np.array_split(np.array(todo, dtype=object), max(1, min(workers, len(todo))))
+              if len(share)]
+    jobs = [(os.path.join(stats_dir, f"part_{first + i:03d}.npz"), list(share)) for i, share in enumerate(shares)]
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(len(jobs)) as executor:
+            parts += list(executor.map(_accumulate_part, *zip(*jobs), [variables] * len(jobs),
+                                       [pressure_levels] * len(jobs)))
+    else:
+        parts += [_accumulate_part(part, share, variables, pressure_levels) for part, share in jobs]
+
+    state = new_state()
+    for part in parts:
+        merge(state, load_state(part))
+    # Parts left by earlier runs over a different file list are merged as well
+    wanted = {os.path.abspath(path) for path in grib_files}
+    extra = set(state['files']) - wanted
+    if extra:
+        print(f"⚠️ {len(extra)} file(s) in {stats_dir} are not in this run's file list but are included")
+    return state
+
+
+def plot_stats(state, stats_dir, workers=1, engine='contourf'):
+    """Render mean, std, min, max and exceedance frequency of every field; returns the saved paths."""
+    n_files = len(state['files'])
+
+    def tasks():
+        for label, field in state['fields'].items():
+            if field['grid'] is None:
+                print(f"⚠️ {label}: grid not cached; not plotted")
+                continue
+            try:
+                lats, lons = grid_cache.load_grid(field['grid'])
+            except (OSError, ValueError):
+                print(f"⚠️ {label}: grid {field['grid']} missing from {grid_cache.GRID_CACHE_DIR}; not plotted")
+                continue
+            varname, level_label = label.split('|')
+            stem = f"{varname.replace(' ', '_').lower()}_{level_label}"
+            stats = results(field)
+            maps = [('mean', 'Mean', stats['mean'], field['units'], 'viridis'),
+                    ('std', 'Standard deviation', stats['std'], field['units'], 'magma'),
+                    ('min', 'Minimum', stats['min'], field['units'], 'viridis'),
+                    ('max', 'Maximum', stats['max'], field['units'], 'viridis')]
+            maps += [(f"exceed_{t:g}", f"Frequency > {t:g} {field['units']}", freq, '%', 'YlOrRd')
+                     for t, freq in stats['exceed'].items()]
+            for name, title, data, units, cmap in maps:
+                yield {'lons': lons, 'lats': lats, 'data': data, 'engine': engine,
+                       'title': f"{varname} at {level_label}: {title}\n{n_files} files",
+                       'filepath': os.path.join(stats_dir, f"{stem}_{name}.png"),
+                       'cmap': cmap, 'cbar_label': f"{varname} ({units})"}
+
+    return render_pool.render_fields(tasks(), workers=workers)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python field_stats.py <stats_dir> <pressure_levels> <grib_file|directory> [more...]")
+        print("       python field_stats.py <stats_dir> <pressure_levels> gdas <start YYYYMMDDHH> <end YYYYMMDDHH> "
+              "[gfs_anl_dir]")
+        sys.exit(1)
+
+    stats_dir = sys.argv[1]
+    try:
+        pressure_levels = [int(x) for x in sys.argv[2].split(',')]
+    except ValueError as e:
+        print(f"❌ Invalid pressure levels: {e}")
+        sys.exit(1)
+
+    if sys.argv[3] == 'gdas':
+        import plot_gfs_analysis
+        try:
+            start = datetime.datetime.strptime(sys.argv[4], '%Y%m%d%H')
+            end = datetime.datetime.strptime(sys.argv[5], '%Y%m%d%H')
+        except (IndexError, ValueError) as e:
+            print(f"❌ gdas needs a start and end time (YYYYMMDDHH): {e}")
+            sys.exit(1)
+        anl_dir = sys.argv[6] if len(sys.argv) >= 7 else plot_gfs_analysis.gfs_anl_dir
+        grib_files = [path for path in (plot_gfs_analysis.analysis_file(when, anl_dir)
+                                        for when in plot_gfs_analysis.analysis_times(start, end))
+                      if os.path.exists(path)]
+    else:
+        import inspect_grib
+        grib_files = inspect_grib.expand_paths(sys.argv[3:])
+        missing = [path for path in grib_files if not os.path.exists(path)]
+        if missing:
+            print(f"❌ GRIB file not found: {', '.join(missing)}")
+            sys.exit(1)
+
+    if not grib_files:
+        print("❌ No GRIB files to read")
+        sys.exit(1)
+
+    from plot_gfs_forecast import variables
+
+    # PLOT_WORKERS: processes for reading (one partial state each) and for rendering
+    # STATS_CHECKPOINT_EVERY: files between checkpoints of each partial state (default 10)
+    workers = render_pool.default_workers()
+    state = accumulate(grib_files, stats_dir, variables, pressure_levels, workers)
+    if not state['fields']:
+        print("❌ None of the configured variables were found")
+        sys.exit(1)
+    save_state(state, os.path.join(stats_dir, 'stats.npz'))
+    print(f"✅ Statistics of {len(state['files'])} files: {os.path.join(stats_dir, 'stats.npz')}")
+    plot_stats(state, stats_dir, workers, render_pool.default_engine())
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+# Persistent per-file GRIB message index.
+#
+# The index lives next to the GRIB file as "<grib_file>.pgidx" (JSON). When the
+# directory is not writable (e.g. shared archives) it falls back to
+# $GRIB_INDEX_DIR or ~/.cache/plot_gfs/grib_index. It is rebuilt whenever the
+# size or mtime of the GRIB file changes.
+#
+# Building an index only reads the section headers of each GRIB2 message: the
+# message is handed to pygrib with its bitmap and data sections (6, 7) replaced by
+# empty ones, so the packed values are never read from disk. GRIB1 messages are
+# read whole. load_indexes builds the indexes of many files in parallel.
+
+INDEX_SUFFIX = ".pgidx"
+INDEX_VERSION = 1
+FALLBACK_INDEX_DIR = os.environ.get(
+    "GRIB_INDEX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "plot_gfs", "grib_index")
+)
+# Processes for parallel index builds (load_indexes)
+INDEX_WORKERS = int(os.environ.get("GRIB_INDEX_WORKERS", min(8, os.cpu_count() or 1)))
+# Sections 0-5 of a GRIB2 message are expected within its first HEADER_READ bytes
+HEADER_READ = 64 * 1024
+
+
+def scan_messages(grib_file):
+    """Return [(offset, length), ...] for every GRIB message, reading only section 0."""
+    spans = []
+    with open(grib_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while True:
+            f.seek(pos)
+            head = f.read(16)
+            if len(head) < 16:
+                break
+            if head[:4] != b"GRIB":
+                # Skip padding between messages
+                skip = head.find(b"GRIB", 1)
+                pos += skip if skip > 0 else 13
+                continue
+            edition = head[7]
+            if edition == 2:
+                length = struct.unpack(">Q", head[8:16])[0]
+            elif edition == 1:
+                length = int.from_bytes(head[4:7], "big")
+            else:
+                raise ValueError(f"Unsupported GRIB edition {edition} at offset {pos} in {grib_file}")
+            if pos + length > size:
+                raise ValueError(f"Truncated GRIB message at offset {pos} in {grib_file}")
+            spans.append((pos, length))
+            pos += length
+    return spans
+
+
+def _index_paths(grib_file):
+    grib_file = os.path.abspath(grib_file)
+    digest = hashlib.sha1(grib_file.encode()).hexdigest()[:16]
+    fallback = os.path.join(FALLBACK_INDEX_DIR, f"{os.path.basename(grib_file)}.{digest}{INDEX_SUFFIX}")
+    return [grib_file + INDEX_SUFFIX, fallback]
+
+
+def _source_stamp(grib_file):
+    st = os.stat(grib_file)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def read_header_message(f, offset, length):
+    """Bytes of the message at offset with empty bitmap and data sections, or the whole message.
+
+    Only sections 0-5 are read for GRIB2; the result decodes to the same keys as
+    the full message, but has no values.
+    """
+    f.seek(offset)
+    head = f.read(min(length, HEADER_READ))
+    if head[7] == 2:
+        sections = []
+        pos = 16
+        while pos + 5 <= len(head):
+            size, number = struct.unpack_from(">IB", head, pos)
+            if number == 6:
+                body = b"".join(sections) + struct.pack(">IBB", 6, 6, 255) + struct.pack(">IB", 5, 7) + b"7777"
+                return head[:8] + struct.pack(">Q", 16 + len(body)) + body
+            if number not in (1, 2, 3, 4, 5) or pos + size > len(head):
+                break
+            sections.append(head[pos:pos + size])
+            pos += size
+    # GRIB1, or headers larger than HEADER_READ: the whole message
+    return head + f.read(length - len(head))
+
+
+def build_index(grib_file):
+    import pygrib
+
+    messages = []
+    with open(grib_file, "rb") as f:
+        for offset, length in scan_messages(grib_file):
+            grb = pygrib.fromstring(read_header_message(f, offset, length))
+            messages.append({
+                "name": grb.name,
+                "shortName": grb.shortName,
+                "typeOfLevel": grb.typeOfLevel,
+                "level": grb.level,
+                "dataDate": grb.dataDate,
+                "offset": offset,
+                "length": length,
+            })
+
+    return {"version": INDEX_VERSION, "source": _source_stamp(grib_file), "messages": messages}
+
+
+def _read_index(path, stamp):
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("source") != stamp:
+        return None
+    return index
+
+
+def _write_index(index, grib_file):
+    for path in _index_paths(grib_file):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp, path)
+            return path
+        except OSError:
+            continue
+    return None
+
+
+def load_index(grib_file, rebuild=False):
+    """Load the cached index for grib_file, building and storing it on first use."""
+    stamp = _source_stamp(grib_file)
+    if not rebuild:
+        for path in _index_paths(grib_file):
+            index = _read_index(path, stamp)
+            if index is not None:
+                return index
+
+    print(f"🗂️  Building GRIB index for {grib_file}")
+    index = build_index(grib_file)
+    if _write_index(index, grib_file) is None:
+        print(f"⚠️ Could not store GRIB index for {grib_file}; using it in memory only")
+    return index
+
+
+def _load_or_error(grib_file):
+    try:
+        return load_index(grib_file)
+    except (OSError, ValueError, RuntimeError) as e:
+        return e
+
+
+def load_indexes(grib_files, workers=INDEX_WORKERS):
+    """{grib_file: index, or the exception that stopped it} for many files, workers in parallel."""
+    if workers > 1 and len(grib_files) > 1:
+        with ProcessPoolExecutor(min(workers, len(grib_files))) as executor:
+            return dict(zip(grib_files, executor.map(_load_or_error, grib_files)))
+    return {grib_file: _load_or_error(grib_file) for grib_file in grib_files}
+
+
+def index_key(msg):
+    return (msg["shortName"], msg["typeOfLevel"], msg["level"])
+
+
+def lookup(index, shortName, typeOfLevel, level):
+    """Return the first message entry matching (shortName, typeOfLevel, level), or None."""
+    if "_by_key" not in index:
+        by_key = {}
+        for msg in index["messages"]:
+            by_key.setdefault(index_key(msg), msg)
+        index["_by_key"] = by_key
+    return index["_by_key"].get((shortName, typeOfLevel, level))
+
+
+def select(index, variables):
+    """Group index entries by variable name, keeping those on the configured level type."""
+    field_data = {var: [] for var in variables}
+    for msg in index["messages"]:
+        name = msg["name"]
+        if name in variables and msg["typeOfLevel"] == variables[name]["level_type"]:
+            field_data[name].append(msg)
+    return field_data
+
+
+def field_messages(field_data, variables, pressure_levels):
+    """Yield (varname, settings, level_label, msg) as plot_forecast_hour picks them."""
+    for varname, settings in variables.items():
+        msgs = field_data[varname]
+        if not msgs:
+            continue
+        if settings["level_type"] == "isobaricInhPa":
+            for level in pressure_levels:
+                msg = next((m for m in msgs if m["level"] == level), None)
+                if msg is not None:
+                    yield varname, settings, f"{level}hPa", msg
+        else:
+            msg = msgs[0]
+            level_label = f"{msg['level']}m" if settings["level_type"] == "heightAboveGround" else "surface"
+            yield varname, settings, level_label, msg
+
+
+def read_message(f, msg):
+    """Seek to one indexed message in an open binary file and decode it with pygrib."""
+    import pygrib
+
+    f.seek(msg["offset"])
+    return pygrib.fromstring(f.read(msg["length"]))
@@ -0,0 +1,187 @@
+import hashlib
+import http.client
+import json
+import os
+import urllib.error
+import urllib.request
+
+# Byte-range subsetting of GFS pgrb2 files from their NOAA ".idx" inventories.
+#
+# A source is either a local directory or an HTTP(S) base URL; "s3://bucket/prefix"
+# is rewritten to the bucket's public HTTPS endpoint. Only the messages needed for
+# the configured variables are fetched and concatenated into a small GRIB file.
+#
+# Next to the subset, a "<subset>.source.json" stamp records the remote file, a
+# digest of its .idx and the byte ranges taken. While they are unchanged the
+# subset is not fetched again, so it keeps its size and mtime and the render
+# manifest (keyed on them) still recognizes outputs drawn from it.
+
+IDX_SUFFIX = ".idx"
+# What fetching can raise: I/O and URL errors, a server ignoring Range, a broken response, a bad inventory
+FETCH_ERRORS = (OSError, ValueError, http.client.HTTPException)
+STAMP_SUFFIX = ".source.json"
+HTTP_TIMEOUT = 60
+
+
+def is_remote(source):
+    return source.startswith(("http://", "https://", "s3://"))
+
+
+def _s3_to_https(url):
+    bucket, _, key = url[len("s3://"):].partition("/")
+    return f"https://{bucket}.s3.amazonaws.com/{key}"
+
+
+def join_source(source, filename):
+    if is_remote(source):
+        if source.startswith("s3://"):
+            source = _s3_to_https(source)
+        return f"{source.rstrip('/')}/{filename}"
+    return os.path.join(source, filename)
+
+
+def read_bytes(path, start=0, end=None):
+    """Read bytes [start, end] (inclusive, end=None means EOF) from a local path or URL."""
+    if is_remote(path):
+        if path.startswith("s3://"):
+            path = _s3_to_https(path)
+        req = urllib.request.Request(path)
+        if start or end is not None:
+            req.add_header("Range", f"bytes={start}-{'' if end is None else end}")
+        with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+            if req.has_header("Range") and resp.status != 206:
+                raise IOError(f"Server ignored byte range request for {path} (HTTP {resp.status})")
+            return resp.read()
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read() if end is None else f.read(end - start + 1)
+
+
+def exists(path):
+    if not is_remote(path):
+        return os.path.exists(path)
+    try:
+        read_bytes(path, 0, 0)
+        return True
+    except (urllib.error.URLError, IOError):
+        return False
+
+
+def parse_idx(text):
+    """Parse a NOAA wgrib2-style inventory into entries with byte offsets and lengths."""
+    entries = []
+    for line in text.splitlines():
+        parts = line.strip().split(":")
+        if len(parts) < 6:
+            continue
+        entries.append({
+            "num": parts[0],
+            "offset": int(parts[1]),
+            "date": parts[2],
+            "var": parts[3],
+            "level": parts[4],
+            "forecast": parts[5],
+        })
+    for entry, nxt in zip(entries, entries[1:]):
+        entry["end"] = nxt["offset"] - 1
+    if entries:
+        entries[-1]["end"] = None
+    return entries
+
+
+def idx_level(level_type, level=None):
+    """Return the inventory level string for a GRIB typeOfLevel, e.g. 'isobaricInhPa', 500 -> '500 mb'."""
+    if level_type == "surface":
+        return "surface"
+    if level_type == "isobaricInhPa":
+        return f"{level} mb"
+    if level_type == "heightAboveGround":
+        return f"{level} m above ground"
+    raise ValueError(f"No .idx level mapping for level type '{level_type}'")
+
+
+def select_entries(entries, variables, pressure_levels, products=None):
+    """Pick the inventory entries needed to plot `variables` at `pressure_levels`.
+
+    products are derived-field specs (plot_gfs_forecast.derived_variables); their
+    fixed-level inputs, e.g. ('Geopotential height', 1000), are selected as well.
+    """
+    wanted = {}
+    for settings in variables.values():
+        var = settings["idx"]
+        level_type = settings["level_type"]
+        if level_type == "isobaricInhPa":
+            levels = {idx_level(level_type, lvl) for lvl in pressure_levels}
+            wanted.update((e["offset"], e) for e in entries if e["var"] == var and e["level"] in levels)
+        else:
+            # plot_forecast_hour uses the first message of a surface/near-surface field
+            level = idx_level(level_type, settings.get("level", 2))
+            match = next((e for e in entries if e["var"] == var and e["level"] == level), None)
+            if match is not None:
+                wanted[match["offset"]] = match
+
+    fixed = set()
+    for spec in (products or {}).values():
+        for inp in spec["inputs"]:
+            if isinstance(inp, tuple) and inp[0] in variables:
+                settings = variables[inp[0]]
+                fixed.add((settings["idx"], idx_level(settings["level_type"], inp[1])))
+    wanted.update((e["offset"], e) for e in entries if (e["var"], e["level"]) in fixed)
+    return sorted(wanted.values(), key=lambda e: e["offset"])
+
+
+def merge_ranges(entries):
+    """Coalesce entries with adjacent byte ranges into (start, end) requests."""
+    ranges = []
+    for e in entries:
+        if ranges and ranges[-1][1] is not None and ranges[-1][1] + 1 == e["offset"]:
+            ranges[-1] = (ranges[-1][0], e["end"])
+        else:
+            ranges.append((e["offset"], e["end"]))
+    return ranges
+
+
+def _read_stamp(dest):
+    try:
+        with open(dest + STAMP_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_subset(grib_path, variables, pressure_levels, dest, products=None):
+    """Write a GRIB file at dest containing only the messages needed from grib_path.
+
+    An existing subset fetched from the same inventory and byte ranges is kept as is.
+    """
+    idx = read_bytes(grib_path + IDX_SUFFIX)
+    entries = parse_idx(idx.decode())
+    selected = select_entries(entries, variables, pressure_levels, products)
+    if not selected:
+        raise ValueError(f"No requested fields listed in {grib_path}{IDX_SUFFIX}")
+
+    ranges = merge_ranges(selected)
+    stamp = {"source": grib_path, "idx": hashlib.sha1(idx).hexdigest(), "ranges": [list(r) for r in ranges]}
+    if os.path.exists(dest) and _read_stamp(dest) == stamp:
+        print(f"⏭️ Subset up to date: {os.path.basename(dest)} ({len(selected)} messages)")
+        return dest
+
+    if os.path.exists(dest + STAMP_SUFFIX):
+        os.remove(dest + STAMP_SUFFIX)  # the old stamp no longer describes dest once it is rewritten
+    total = 0
+    tmp = f"{dest}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as out:
+            for start, end in ranges:
+                chunk = read_bytes(grib_path, start, end)
+                out.write(chunk)
+                total += len(chunk)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    with open(dest + STAMP_SUFFIX, "w") as f:
+        json.dump(stamp, f)
+    print(f"📥 Subset {len(selected)} messages ({total / 1e6:.1f} MB) from {grib_path}")
+    return dest
@@ -0,0 +1,79 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Lat/lon grids keyed by GRIB grid definition.
+#
+# grb.latlons() builds two full float64 arrays every time it is called. Grids are
+# identified by their definition keys, computed once, stored as .npy files under
+# $GRID_CACHE_DIR (default ~/.cache/plot_gfs/grids) and memory-mapped back, so
+# every variable, level, forecast hour and script reuses the same arrays.
+
+GRID_KEYS = (
+    'gridType', 'Ni', 'Nj',
+    'latitudeOfFirstGridPointInDegrees', 'longitudeOfFirstGridPointInDegrees',
+    'latitudeOfLastGridPointInDegrees', 'longitudeOfLastGridPointInDegrees',
+    'iDirectionIncrementInDegrees', 'jDirectionIncrementInDegrees',
+)
+GRID_CACHE_DIR = os.environ.get(
+    'GRID_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'plot_gfs', 'grids')
+)
+
+_grids = {}
+
+
+def grid_key(grb):
+    """Return the grid-definition tuple for a message, or None if it cannot be identified."""
+    try:
+        return tuple(grb[key] for key in GRID_KEYS)
+    except (KeyError, RuntimeError):
+        return None
+
+
+def grid_id(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+
+
+def _load(path):
+    lats = np.load(os.path.join(path, 'lats.npy'), mmap_mode='r')
+    lons = np.load(os.path.join(path, 'lons.npy'), mmap_mode='r')
+    return lats, lons
+
+
+def load_grid(grid):
+    """Return the memory-mapped (lats, lons) cached under a grid_id; OSError if it is not cached."""
+    return _load(os.path.join(GRID_CACHE_DIR, grid))
+
+
+def _store(path, lats, lons):
+    os.makedirs(path, exist_ok=True)
+    for name, arr in (('lats', lats), ('lons', lons)):
+        tmp = os.path.join(path, f"{name}.tmp{os.getpid()}.npy")
+        np.save(tmp, np.ascontiguousarray(arr))
+        os.replace(tmp, os.path.join(path, f"{name}.npy"))
+
+
+def get_latlons(grb):
+    """Return (lats, lons) for the message's grid, from memory, disk or grb.latlons()."""
+    key = grid_key(grb)
+    if key is None:
+        return grb.latlons()
+    if key in _grids:
+        return _grids[key]
+
+    path = os.path.join(GRID_CACHE_DIR, grid_id(key))
+    try:
+        _grids[key] = _load(path)
+        return _grids[key]
+    except (OSError, ValueError):
+        pass
+
+    lats, lons = grb.latlons()
+    try:
+        _store(path, lats, lons)
+        _grids[key] = _load(path)
+    except OSError:
+        print(f"⚠️ Could not write grid cache under {GRID_CACHE_DIR}; keeping grid in memory only")
+        _grids[key] = (lats, lons)
+    return _grids[key]
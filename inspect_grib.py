@@ -1,40 +1,120 @@
-import pygrib
-import sys
+import datetime
 import os
+import sys
+
+# Inventory of one or many GRIB files.
+#
+# Files are listed through their cached message indexes (see grib_index.py): an
+# index is built from the message headers on first use, in parallel over
+# GRIB_INDEX_WORKERS processes, and reused until the file's size or mtime
+# changes. For more than one file, each field (name, level type, level) is
+# counted across files. Files lacking fields that other files have are reported,
+# as are files that are absent or cannot be read, e.g. gaps in a GDAS archive.
+
+
+def expand_paths(args):
+    """GRIB files named on the command line; directories contribute every GRIB file in them."""
+    paths = []
+    for arg in args:
+        if not os.path.isdir(arg):
+            paths.append(arg)
+            continue
+        for name in sorted(os.listdir(arg)):
+            path = os.path.join(arg, name)
+            if os.path.isfile(path) and not name.endswith('.pgidx'):
+                with open(path, 'rb') as f:
+                    if f.read(4) == b'GRIB':
+                        paths.append(path)
+    return paths
+
+
+def field_key(msg):
+    return (msg['name'], msg['shortName'], msg['typeOfLevel'], msg['level'])
+
+
+def inventory(grib_files, workers=None):
+    """({field key: [files with it]}, {file: index}, {file: reason it is unusable})."""
+    import grib_index
+
+    present = [path for path in grib_files if os.path.isfile(path)]
+    problems = {path: 'not found' for path in grib_files if not os.path.isfile(path)}
+    loaded = grib_index.load_indexes(present, workers or grib_index.INDEX_WORKERS)
 
-# --- Handle command-line argument ---
-if len(sys.argv) != 2:
-    print("Usage: python inspect_grib.py <grib_file>")
-    sys.exit(1)
+    indexes = {}
+    fields = {}
+    for path in present:
+        index = loaded[path]
+        if isinstance(index, Exception):
+            problems[path] = f"unreadable: {index}"
+            continue
+        indexes[path] = index
+        for key in {field_key(msg) for msg in index['messages']}:
+            fields.setdefault(key, []).append(path)
+    return fields, indexes, problems
 
-grib_file = sys.argv[1]
 
-if not os.path.isfile(grib_file):
-    print(f"Error: File '{grib_file}' not found.")
-    sys.exit(1)
+def print_inventory(fields, indexes, problems, limit=10):
+    n_files = len(indexes)
+    print(f"\n📦 Fields in {n_files} GRIB file{'s' if n_files != 1 else ''}\n")
+    print(f"{'Full Name':40} {'Short Name':10} {'Level Type':20} {'Level':>8} {'Files':>8}")
+    print("=" * 90)
+    for key in sorted(fields):
+        name, short, level_type, level = key
+        print(f"{name:40} {short:10} {level_type:20} {level:>8} {len(fields[key]):>8}")
 
-# --- Open GRIB file ---
-grbs = pygrib.open(grib_file)
+    if problems:
+        print(f"\n❌ {len(problems)} file(s) missing or unreadable:")
+        for path, reason in sorted(problems.items()):
+            print(f"  {os.path.basename(path)}: {reason}")
 
-# --- Collect unique variable entries ---
-variable_info = set()
+    if n_files > 1:
+        missing = {}
+        for key, paths in fields.items():
+            if len(paths) < n_files:
+                for path in set(indexes) - set(paths):
+                    missing.setdefault(path, []).append(key)
+        if missing:
+            print(f"\n⚠️  {len(missing)} file(s) lack fields found in other files:")
+            for path in sorted(missing):
+                keys = sorted(missing[path])
+                shown = ', '.join(f"{name} {level_type} {level}" for name, _, level_type, level in keys[:limit])
+                more = f" (+{len(keys) - limit} more)" if len(keys) > limit else ""
+                print(f"  {os.path.basename(path)}: {len(keys)} missing: {shown}{more}")
+        else:
+            print("\n✅ Every file has the same fields")
 
-for grb in grbs:
-    variable_info.add((
-        grb.name,          # Full descriptive name
-        grb.shortName,     # Short name (e.g. 't')
-        grb.parameterName, # Parameter ID name
-        grb.typeOfLevel,   # e.g. 'isobaricInhPa'
-        grb.level          # Pressure level or height
-    ))
 
-grbs.close()
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python inspect_grib.py <grib_file|directory> [more...]")
+        print("       python inspect_grib.py gdas [start YYYYMMDDHH] [end YYYYMMDDHH] [gfs_anl_dir]")
+        sys.exit(1)
 
-# --- Output table ---
-print(f"\n📦 Variables in GRIB file: {grib_file}\n")
-print(f"{'Full Name':40} {'Short Name':10} {'Parameter':30} {'Level Type':20} {'Level'}")
-print("=" * 120)
+    if sys.argv[1] == 'gdas':
+        # Defaults: the date range and archive of plot_gfs_analysis.py
+        import plot_gfs_analysis
+        try:
+            start = datetime.datetime.strptime(sys.argv[2], '%Y%m%d%H') if len(sys.argv) >= 3 \
+                else plot_gfs_analysis.start_date
+            end = datetime.datetime.strptime(sys.argv[3], '%Y%m%d%H') if len(sys.argv) >= 4 \
+                else plot_gfs_analysis.end_date
+        except ValueError as e:
+            print(f"❌ Invalid date: {e}")
+            sys.exit(1)
+        gfs_anl_dir = sys.argv[4] if len(sys.argv) >= 5 else plot_gfs_analysis.gfs_anl_dir
+        grib_files = [plot_gfs_analysis.analysis_file(when, gfs_anl_dir)
+                      for when in plot_gfs_analysis.analysis_times(start, end)]
+    else:
+        grib_files = expand_paths(sys.argv[1:])
 
-for name, short, param, level_type, level in sorted(variable_info):
-    print(f"{name:40} {short:10} {param:30} {level_type:20} {level}")
+    if not grib_files:
+        print("❌ No GRIB files given")
+        sys.exit(1)
 
+    fields, indexes, problems = inventory(grib_files)
+    if not indexes:
+        print(f"❌ None of the {len(grib_files)} GRIB files could be read")
+        for path, reason in sorted(problems.items()):
+            print(f"  {path}: {reason}")
+        sys.exit(1)
+    print_inventory(fields, indexes, problems)
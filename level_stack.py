@@ -0,0 +1,53 @@
+import numpy as np
+
+import grib_index
+import grid_cache
+
+# Decode all levels of one variable into a (level, lat, lon) array and reduce it
+# with batched NumPy operations (zonal/meridional means, area-weighted means).
+
+
+def decode_stack(f, msgs, dtype=np.float32):
+    """Decode indexed messages (one per level) from open file f into a preallocated stack.
+
+    Returns (levels, stack, lats, lons) with levels sorted ascending.
+    """
+    msgs = sorted(msgs, key=lambda m: m['level'])
+    levels = np.array([m['level'] for m in msgs])
+    stack = None
+    lats = lons = None
+    for i, msg in enumerate(msgs):
+        grb = grib_index.read_message(f, msg)
+        values = grb.values
+        if stack is None:
+            stack = np.empty((len(msgs),) + values.shape, dtype=dtype)
+            lats, lons = grid_cache.get_latlons(grb)
+        stack[i] = np.ma.filled(values, np.nan) if np.ma.isMaskedArray(values) else values
+        del grb, values
+    return levels, stack, lats, lons
+
+
+def zonal_mean(stack):
+    """Mean over longitude: (..., lat, lon) -> (..., lat)."""
+    return stack.mean(axis=-1, dtype=np.float64)
+
+
+def meridional_mean(stack, lats=None):
+    """Mean over latitude: (..., lat, lon) -> (..., lon); cos(lat)-weighted when lats is given."""
+    if lats is None:
+        return stack.mean(axis=-2, dtype=np.float64)
+    w = _lat_weights(lats)
+    return np.tensordot(stack, w, axes=([-2], [0])) / w.sum()
+
+
+def area_weighted_mean(stack, lats):
+    """cos(lat)-weighted global mean: (..., lat, lon) -> (...)."""
+    w = _lat_weights(lats)
+    return zonal_mean(stack) @ w / w.sum()
+
+
+def _lat_weights(lats):
+    lats = np.asarray(lats)
+    if lats.ndim == 2:
+        lats = lats[:, 0]
+    return np.cos(np.deg2rad(lats.astype(np.float64)))
@@ -0,0 +1,68 @@
+import os
+import resource
+
+import numpy as np
+
+# Low-memory decode helpers and peak-RSS reporting.
+#
+# In low-memory mode fields are converted to float32 right after decoding, unit
+# conversions run in place (see units.py) and each field is dropped as soon as
+# its figure is saved. Enable with low_memory=True or PLOT_LOW_MEMORY=1.
+
+
+def low_memory_enabled():
+    return os.environ.get('PLOT_LOW_MEMORY', '').lower() in ('1', 'true', 'yes')
+
+
+def field_values(grb, low_memory=False):
+    """Decode a message's values, as float32 in low-memory mode."""
+    values = grb.values
+    if low_memory:
+        values = values.astype(np.float32, copy=False)
+    return values
+
+
+# Peak seen before stage timers last cleared the kernel counter (see reset_stage_peak)
+_earlier_peak_mb = 0.0
+
+
+def _clear_kernel_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def reset_peak_rss():
+    """Start a new peak-RSS window for this process (Linux); no-op elsewhere."""
+    global _earlier_peak_mb
+    _earlier_peak_mb = 0.0
+    return _clear_kernel_peak()
+
+
+def reset_stage_peak():
+    """Clear the kernel counter for one timed stage without losing the window's peak."""
+    global _earlier_peak_mb
+    _earlier_peak_mb = max(_earlier_peak_mb, stage_peak_mb())
+    return _clear_kernel_peak()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB since reset_peak_rss (on Linux)."""
+    return max(_earlier_peak_mb, stage_peak_mb())
+
+
+def stage_peak_mb():
+    """Peak RSS in MB since the last reset of either kind."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if os.uname().sysname == 'Darwin' else maxrss / 1024
@@ -0,0 +1,262 @@
+import contextlib
+import datetime
+import os
+import struct
+
+import numpy as np
+
+# Shared NetCDF access for the MPASSIT/WRF plotting scripts.
+#
+# A file handle is a dict around a netCDF4 Dataset (used for metadata and, by
+# default, for reads). XLAT/XLONG are read once and shared by every file on the
+# same grid. Level slices of (Time, level, y, x) variables are read in level
+# order (see level_reads) with the variable's chunk cache sized to hold every chunk one level
+# touches, so a compressed chunk is inflated once rather than once per level
+# (the default cache is often smaller than one level's chunks on big domains).
+#
+# With use_mmap=True, uncompressed classic-format files (CDF-1/CDF-2) are memory
+# mapped instead: the header is parsed here and each 2-D slice is a view into
+# the mapping, so only the requested pages are read. _FillValue/missing_value
+# masking and scale_factor/add_offset are applied as netCDF4 would.
+#
+# NC_READ_BUDGET_MB caps the chunk cache of each variable.
+
+READ_BUDGET_MB = float(os.environ.get('NC_READ_BUDGET_MB', 512))
+
+HEADER_BYTES = 4 << 20
+
+_grids = {}
+
+# classic-format nc_type -> big-endian numpy dtype
+_NC_TYPES = {1: 'i1', 2: 'S1', 3: '>i2', 4: '>i4', 5: '>f4', 6: '>f8'}
+
+
+def mmap_enabled():
+    return os.environ.get('NC_MMAP', '').lower() in ('1', 'true', 'yes')
+
+
+def _classic_layout(path):
+    """Variable offsets of a CDF-1/CDF-2 file, or None for any other format."""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        if head not in (b'CDF\x01', b'CDF\x02'):
+            return None
+        header = head + f.read(HEADER_BYTES)
+    try:
+        return _parse_header(header)
+    except struct.error:
+        return None  # header larger than HEADER_BYTES
+
+
+def _parse_header(header):
+    offset_format = '>I' if header[3] == 1 else '>Q'
+
+    pos = 4
+
+    def take(fmt):
+        nonlocal pos
+        value, = struct.unpack_from(fmt, header, pos)
+        pos += struct.calcsize(fmt)
+        return value
+
+    def name():
+        nonlocal pos
+        n = take('>I')
+        value = header[pos:pos + n].decode()
+        pos += -(-n // 4) * 4
+        return value
+
+    def skip_attributes():
+        nonlocal pos
+        take('>I')  # NC_ATTRIBUTE or ABSENT
+        for _ in range(take('>I')):
+            name()
+            nc_type, nelems = take('>I'), take('>I')
+            pos += -(-nelems * np.dtype(_NC_TYPES[nc_type]).itemsize // 4) * 4
+
+    numrecs = take('>I')
+    if numrecs == 0xFFFFFFFF:
+        return None  # streaming file, record count unknown
+    take('>I')
+    dims = [(name(), take('>I')) for _ in range(take('>I'))]
+    skip_attributes()
+
+    variables = {}
+    take('>I')
+    for _ in range(take('>I')):
+        var_name = name()
+        dimids = [take('>I') for _ in range(take('>I'))]
+        skip_attributes()
+        dtype = np.dtype(_NC_TYPES[take('>I')])
+        take('>I')  # vsize, recomputed below (it overflows for large variables)
+        begin = take(offset_format)
+        record = bool(dimids) and dims[dimids[0]][1] == 0
+        shape = tuple(numrecs if (i == 0 and record) else dims[d][1] for i, d in enumerate(dimids))
+        variables[var_name] = {'dtype': dtype, 'shape': shape, 'begin': begin, 'record': record}
+
+    record_vars = [v for v in variables.values() if v['record']]
+    for v in record_vars:
+        v['slab'] = int(np.prod(v['shape'][1:], dtype=np.int64)) * v['dtype'].itemsize
+    # Record data of each variable is padded to 4 bytes, unless it is the only record variable
+    recsize = (record_vars[0]['slab'] if len(record_vars) == 1
+               else sum(-(-v['slab'] // 4) * 4 for v in record_vars))
+    return {'numrecs': numrecs, 'recsize': recsize, 'variables': variables}
+
+
+def open_file(path, use_mmap=False):
+    """Open a NetCDF file for reading; returns a handle for the functions below."""
+    from netCDF4 import Dataset
+
+    handle = {'path': path, 'ds': Dataset(path), 'layout': None, 'mm': None}
+    if use_mmap:
+        layout = _classic_layout(path)
+        if layout is None:
+            print(f"⚠️ {os.path.basename(path)} is not a classic-format file; reading without mmap")
+        else:
+            handle['layout'] = layout
+            handle['mm'] = np.memmap(path, dtype=np.uint8, mode='r')
+    return handle
+
+
+def close_file(handle):
+    handle['mm'] = None
+    handle['ds'].close()
+
+
+def each_file(paths, use_mmap=False):
+    """Yield an open handle per path; each file is closed before the next is opened."""
+    for path in paths:
+        handle = open_file(path, use_mmap)
+        try:
+            yield handle
+        finally:
+            close_file(handle)
+
+
+def variable(handle, name):
+    return handle['ds'].variables[name]
+
+
+def attribute(handle, name, attr, default=None):
+    var = variable(handle, name)
+    return var.getncattr(attr) if attr in var.ncattrs() else default
+
+
+def _unpack(values, var):
+    """Mask fill values and apply scale/offset, as netCDF4 does for its own reads."""
+    attrs = var.ncattrs()
+    for fill_attr in ('_FillValue', 'missing_value'):
+        if fill_attr in attrs:
+            values = np.ma.masked_equal(values, var.getncattr(fill_attr), copy=False)
+    if 'scale_factor' in attrs:
+        values = values * var.getncattr('scale_factor')
+    if 'add_offset' in attrs:
+        values = values + var.getncattr('add_offset')
+    return values
+
+
+def _mapped_slice(handle, name, lead):
+    """Copy of the trailing 2-D slice at leading indices `lead`, read through the memory map."""
+    info = handle['layout']['variables'][name]
+    shape, itemsize = info['shape'], info['dtype'].itemsize
+    offset = info['begin']
+    inner = shape
+    if info['record']:
+        offset += lead[0] * handle['layout']['recsize']
+        lead, inner = lead[1:], shape[1:]
+    strides = np.cumprod((1,) + inner[:0:-1])[::-1] * itemsize  # C-order byte strides
+    offset += int(sum(i * s for i, s in zip(lead, strides)))
+    view = np.ndarray(shape[-2:], dtype=info['dtype'], buffer=handle['mm'], offset=offset)
+    return _unpack(view.astype(info['dtype'].newbyteorder('='), copy=True), variable(handle, name))
+
+
+def read_field(handle, name, time=0):
+    """One 2-D field of a (Time, y, x) variable."""
+    if handle['layout'] is not None and name in handle['layout']['variables']:
+        return _mapped_slice(handle, name, (time,))
+    return variable(handle, name)[time, :, :]
+
+
+def coordinates(handle, lat_name='XLAT', lon_name='XLONG'):
+    """(lats, lons) 2-D arrays of the file's grid, shared by all files on the same grid.
+
+    A grid is recognized by its shape and corner coordinates, so the full arrays
+    are only read for the first file of a run.
+    """
+    lat_var, lon_var = variable(handle, lat_name), variable(handle, lon_name)
+    shape = lat_var.shape[-2:]
+    corner = (0,) * (lat_var.ndim - 2)
+    key = (shape,
+           tuple(np.ravel(lat_var[corner + ([0, -1], [0, -1])])),
+           tuple(np.ravel(lon_var[corner + ([0, -1], [0, -1])])))
+    if key not in _grids:
+        if lat_var.ndim == 3:
+            _grids[key] = (read_field(handle, lat_name), read_field(handle, lon_name))
+        else:
+            _grids[key] = (lat_var[:], lon_var[:])
+    return _grids[key]
+
+
+def valid_time(handle):
+    """Valid time of the first record, from XTIME (or Times when XTIME has no units)."""
+    from netCDF4 import num2date
+
+    ds = handle['ds']
+    if 'XTIME' in ds.variables and 'units' in ds.variables['XTIME'].ncattrs():
+        xtime = ds.variables['XTIME']
+        return num2date(xtime[0], xtime.units)
+    stamp = ds.variables['Times'][0].tobytes().decode().strip()
+    return datetime.datetime.strptime(stamp, '%Y-%m-%d_%H:%M:%S')
+
+
+def _size_chunk_cache(var):
+    """Let the chunk cache hold every chunk that one level slice touches, within the budget.
+
+    Returns the previous cache settings when they were changed, else None.
+    """
+    chunking = var.chunking()
+    if chunking in (None, 'contiguous'):
+        return None
+    n_chunks = 1
+    for size, chunk in zip(var.shape[-2:], chunking[-2:]):
+        n_chunks *= -(-size // chunk)
+    needed = n_chunks * int(np.prod(chunking, dtype=np.int64)) * var.dtype.itemsize
+    previous = var.get_var_chunk_cache()
+    size, nelems, preemption = previous
+    if not size < needed <= READ_BUDGET_MB * 2 ** 20:
+        return None
+    var.set_var_chunk_cache(size=needed, nelems=max(nelems, 4 * n_chunks + 1), preemption=preemption)
+    return previous
+
+
+@contextlib.contextmanager
+def level_reads(handle, name):
+    """Context for reading several levels of one variable with read_level.
+
+    Sizes the chunk cache to hold every chunk one level touches, so levels that
+    share a chunk are served from the cache, and gives the memory back afterwards.
+    """
+    mapped = handle['layout'] is not None and name in handle['layout']['variables']
+    previous = None if mapped else _size_chunk_cache(variable(handle, name))
+    try:
+        yield
+    finally:
+        if previous is not None:
+            variable(handle, name).set_var_chunk_cache(*previous)
+
+
+def read_level(handle, name, level, time=0):
+    """One 2-D level slice of a (Time, level, y, x) variable."""
+    if handle['layout'] is not None and name in handle['layout']['variables']:
+        return _mapped_slice(handle, name, (time, level))
+    return variable(handle, name)[time, level, :, :]
+
+
+def read_levels(handle, name, levels, time=0):
+    """Yield (level, 2-D field) for the requested level indices, in ascending order.
+
+    Out-of-range indices are the caller's to filter.
+    """
+    with level_reads(handle, name):
+        for level in sorted(set(levels)):
+            yield level, read_level(handle, name, level, time)
@@ -1,12 +1,10 @@
-from netCDF4 import Dataset
-import numpy as np
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import sys
 import os
 
 def main(ncfile):
+    # Heavy imports only once there is a file to plot
+    from netCDF4 import Dataset
+
     ds = Dataset(ncfile, "r")
 
     if "T2" not in ds.variables:
@@ -34,22 +32,13 @@ def main(ncfile):
         print("❌ Could not find XLAT/XLONG.")
         return
 
-    # Plot setup
-    plt.figure(figsize=(10, 6))
-    ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.set_title(f"2-metre Temperature (°C)\nValid: {time_str}")
-    ax.coastlines()
-    ax.add_feature(cfeature.BORDERS, linestyle=':')
-    ax.add_feature(cfeature.STATES, linestyle=':')
-
-    cf = ax.contourf(lons, lats, t2, levels=20, cmap="coolwarm", transform=ccrs.PlateCarree())
-    plt.colorbar(cf, orientation='horizontal', pad=0.05, label='Temperature (°C)')
-    plt.tight_layout()
+    # Map features come from basemap's Natural Earth cache (NATURAL_EARTH_DIR), never a download
+    import basemap
 
-    # Save file
     out_name = f"t2_temperature_{time_tag}.png"
-    plt.savefig(out_name, dpi=150)
-    plt.close()
+    extent = [float(lons.min()), float(lons.max()), float(lats.min()), float(lats.max())]
+    basemap.plot_on_basemap(lons, lats, t2, f"2-metre Temperature (°C)\nValid: {time_str}", out_name,
+                            cmap="coolwarm", cbar_label='Temperature (°C)', extent=extent)
     print(f"✅ Saved plot: {out_name}")
 
 if __name__ == "__main__":
@@ -1,63 +1,51 @@
 import sys
 import os
-import numpy as np
-from netCDF4 import Dataset
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 
-def plot_variable(ncfile, var_name, var_levels=None, level_indices=None):
-    desc = ncfile.variables[var_name].description if 'description' in ncfile.variables[var_name].ncattrs() else var_name
-    data = ncfile.variables[var_name]
-    coords = data.coordinates.split() if 'coordinates' in data.ncattrs() else []
+import contour_levels
+import nc_access
+
+def _plot(lon, lat, values, title, units, out_path, levels=20):
+    # Loaded on first use (after argument checks); map features come from basemap's
+    # Natural Earth cache (NATURAL_EARTH_DIR), so nothing is downloaded
+    import basemap
+
+    extent = [float(lon.min()), float(lon.max()), float(lat.min()), float(lat.max())]
+    basemap.plot_on_basemap(lon, lat, values, title, out_path, cmap='viridis', cbar_label=units, levels=levels,
+                            extent=extent, features=('coastlines', 'borders'), linestyle='-')
+    print(f"✅ Saved: {out_path}")
+
+def plot_variable(nc, var_name, level_indices=None, outdir="plots", shared_levels=None):
+    shared_levels = shared_levels or {}  # {'VAR|surface' or 'VAR|lvlN': levels} from contour_levels
+    data = nc_access.variable(nc, var_name)
+    desc = nc_access.attribute(nc, var_name, 'description', var_name)
+    units = nc_access.attribute(nc, var_name, 'units', '')
+    coords = data.coordinates.split() if 'coordinates' in data.ncattrs() else ['XLONG', 'XLAT']
+    # 2-D grid, read once and shared by every variable (and file) on it
+    lat, lon = nc_access.coordinates(nc, lat_name=coords[1], lon_name=coords[0])
 
     # Surface or 2D fields
     if data.ndim == 3:
-        lat = ncfile.variables[coords[1]][:]
-        lon = ncfile.variables[coords[0]][:]
-        values = data[0, :, :]
-
-        plt.figure(figsize=(10, 6))
-        ax = plt.axes(projection=ccrs.PlateCarree())
-        ax.coastlines()
-        ax.add_feature(cfeature.BORDERS)
-        ax.set_title(f"{desc} (surface)")
-        cf = ax.contourf(lon, lat, values, transform=ccrs.PlateCarree(), cmap='viridis')
-        plt.colorbar(cf, orientation='horizontal', pad=0.05, label=data.units)
-        out_path = f"plots/{var_name.lower()}_surface.png"
-        plt.savefig(out_path, dpi=150)
-        plt.close()
-        print(f"✅ Saved: {out_path}")
+        _plot(lon, lat, nc_access.read_field(nc, var_name), f"{desc} (surface)", units,
+              os.path.join(outdir, f"{var_name.lower()}_surface.png"),
+              shared_levels.get(contour_levels.levels_key(var_name, 'surface'), 20))
 
     # 4D fields (Time, Level, Lat, Lon)
     elif data.ndim == 4 and level_indices is not None:
-        lat = ncfile.variables[coords[1]][:]
-        lon = ncfile.variables[coords[0]][:]
-
         for level in level_indices:
             if level < 0 or level >= data.shape[1]:
                 print(f"⚠️ Skipping {var_name} at level {level} (out of range)")
-                continue
-
-            values = data[0, level, :, :]
-            plt.figure(figsize=(10, 6))
-            ax = plt.axes(projection=ccrs.PlateCarree())
-            ax.coastlines()
-            ax.add_feature(cfeature.BORDERS)
-            ax.set_title(f"{desc} (level {level})")
-            cf = ax.contourf(lon, lat, values, transform=ccrs.PlateCarree(), cmap='viridis')
-            plt.colorbar(cf, orientation='horizontal', pad=0.05, label=data.units)
-            out_path = f"plots/{var_name.lower()}_level{level}.png"
-            plt.savefig(out_path, dpi=150)
-            plt.close()
-            print(f"✅ Saved: {out_path}")
+        in_range = [level for level in level_indices if 0 <= level < data.shape[1]]
+        for level, values in nc_access.read_levels(nc, var_name, in_range):
+            _plot(lon, lat, values, f"{desc} (level {level})", units,
+                  os.path.join(outdir, f"{var_name.lower()}_level{level}.png"),
+                  shared_levels.get(contour_levels.levels_key(var_name, f"lvl{level}"), 20))
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python script.py file.nc [level1,level2,...]")
+        print("Usage: python script.py file.nc[,file2.nc,...] [level1,level2,...]")
         sys.exit(1)
 
-    nc_path = sys.argv[1]
+    nc_paths = sys.argv[1].split(',')
     levels = []
     if len(sys.argv) == 3:
         try:
@@ -66,21 +54,34 @@ def main():
             print("❌ Invalid level specification.")
             sys.exit(1)
 
-    os.makedirs("plots", exist_ok=True)
+    surface_vars = ['RAINNC', 'U10', 'V10', 'Q2', 'T2']
+    level_vars = ['T', 'U', 'V', 'W']
+    levels = levels or [1]  # Default to level 1
+
+    # PLOT_SHARED_LEVELS=1: one sweep over all files first, so every file uses the same color levels
+    shared_levels = {}
+    if os.environ.get('PLOT_SHARED_LEVELS', '').lower() in ('1', 'true', 'yes'):
+        print(f"📏 Computing shared contour levels from {len(nc_paths)} files...")
+        shared_levels = contour_levels.compute_nc_levels(nc_paths, surface_vars + level_vars, levels,
+                                                         nc_access.mmap_enabled())
+
+    # NC_MMAP=1: memory-map uncompressed classic-format files
+    for nc in nc_access.each_file(nc_paths, nc_access.mmap_enabled()):
+        # Several files: one subdirectory per file so the plot names do not collide
+        outdir = "plots"
+        if len(nc_paths) > 1:
+            outdir = os.path.join(outdir, os.path.splitext(os.path.basename(nc['path']))[0])
+        os.makedirs(outdir, exist_ok=True)
 
-    with Dataset(nc_path) as nc:
         # Surface/2D variables
-        surface_vars = ['RAINNC', 'U10', 'V10', 'Q2', 'T2']
         for var in surface_vars:
-            if var in nc.variables:
-                plot_variable(nc, var)
+            if var in nc['ds'].variables:
+                plot_variable(nc, var, outdir=outdir, shared_levels=shared_levels)
 
         # 3D variables (use specified levels)
-        level_vars = ['T', 'U', 'V', 'W']
         for var in level_vars:
-            if var in nc.variables:
-                plot_variable(nc, var, level_indices=levels if levels else [1])  # Default to level 1
+            if var in nc['ds'].variables:
+                plot_variable(nc, var, level_indices=levels, outdir=outdir, shared_levels=shared_levels)
 
 if __name__ == "__main__":
     main()
-
@@ -1,40 +1,79 @@
-import pygrib
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from cartopy.util import add_cyclic_point
-import numpy as np
 import os
 import sys
+import units
+import render_manifest
+import render_pool
+import grib_index
+import grid_cache
+import memory_budget
+import level_stack
 import datetime
+from concurrent.futures import as_completed
+
+import numpy as np
 
 # ==== CONFIGURATION ====
 start_date = datetime.datetime(2025, 4, 1, 0)
 end_date = datetime.datetime(2025, 4, 15, 23)
 gfs_anl_dir = "/scratch1/NCEPDEV/global/glopara/data/metplus.data/archive/gfs/"
 base_output_dir = "gfs_anl"
-
-def plot_forecast_hour(forecast_hour, pressure_levels=[500]):
-    forecast_datetime = start_date + datetime.timedelta(hours=forecast_hour)
-
-    if forecast_datetime > end_date:
-        print(f"❌ Forecast datetime {forecast_datetime} exceeds end_date {end_date}")
+cycle_step = 6  # hours between analyses in batch mode
+
+def analysis_file(when, anl_dir=gfs_anl_dir):
+    return os.path.join(anl_dir, f"pgbanl.gdas.{when:%Y%m%d%H}")
+
+def analysis_times(start, end, step=cycle_step):
+    times = []
+    when = start
+    while when <= end:
+        times.append(when)
+        when += datetime.timedelta(hours=step)
+    return times
+
+def plot_zonal_mean(latitudes, levels, values, title, cmap, label, filepath, contour_levels=20):
+    """Latitude-pressure section of a zonal mean; returns filepath."""
+    # Plain Agg figure: no pyplot state or backend selection
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    cf = ax.contourf(latitudes, levels, values, levels=contour_levels, cmap=cmap)
+    ax.invert_yaxis()
+    fig.colorbar(cf, ax=ax, orientation='horizontal', pad=0.05, label=label)
+    ax.set_title(title)
+    ax.set_xlabel("Latitude")
+    ax.set_ylabel("Pressure Level (hPa)")
+
+    fig.savefig(filepath, dpi=150)
+    return filepath
+
+def plot_forecast_hour(forecast_hour, pressure_levels=[500], workers=1, executor=None, low_memory=False, force=False,
+                       engine='contourf', start=start_date, end=end_date, anl_dir=gfs_anl_dir, zonal=None):
+    # zonal: optional dict, filled with {component: {levels, latitudes, values, units, cmap}} even if the plots
+    # are current
+    forecast_datetime = start + datetime.timedelta(hours=forecast_hour)
+
+    if forecast_datetime > end:
+        print(f"❌ Forecast datetime {forecast_datetime} exceeds end_date {end}")
         return
 
     yyyymmddhh = forecast_datetime.strftime('%Y%m%d%H')
-    grib_file = os.path.join(gfs_anl_dir, f"pgbanl.gdas.{yyyymmddhh}")
+    grib_file = analysis_file(forecast_datetime, anl_dir)
 
     if not os.path.exists(grib_file):
         print(f"❌ GRIB file not found: {grib_file}")
         return
 
     print(f"\n📂 Processing: {grib_file}")
+    from cartopy.util import add_cyclic_point  # after the early returns: cartopy is slow to import
+    if low_memory:
+        memory_budget.reset_peak_rss()
 
-    grbs = pygrib.open(grib_file)
+    index = grib_index.load_index(grib_file)
 
     try:
-        first_msg = grbs.message(1)
-        yyyymmdd = str(first_msg.dataDate)
+        yyyymmdd = str(index['messages'][0]['dataDate'])
     except:
         yyyymmdd = forecast_datetime.strftime('%Y%m%d')
 
@@ -43,7 +82,7 @@ def plot_forecast_hour(forecast_hour, pressure_levels=[500]):
 
     variables = {
         'Precipitation rate': {'units': 'kg/m^2/s', 'cmap': 'Blues', 'level_type': 'surface'},
-        'Temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': lambda x: x - 273.15, 'level_type': 'isobaricInhPa'},
+        'Temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': units.kelvin_to_celsius, 'level_type': 'isobaricInhPa'},
         'Relative humidity': {'units': '%', 'cmap': 'BrBG', 'level_type': 'isobaricInhPa'},
         'Geopotential height': {'units': 'm', 'cmap': 'viridis', 'level_type': 'isobaricInhPa'},
         'U component of wind': {'units': 'm/s', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa'},
@@ -51,142 +90,273 @@ def plot_forecast_hour(forecast_hour, pressure_levels=[500]):
         'Vertical velocity': {'units': 'Pa/s', 'cmap': 'bwr', 'level_type': 'isobaricInhPa'},
     }
 
-    field_data = {var: [] for var in variables}
-    latlon_cache = {}
+    field_data = grib_index.select(index, variables)
 
-    for grb in grbs:
-        name = grb.name
-        if name in variables and grb.typeOfLevel == variables[name]['level_type']:
-            field_data[name].append(grb)
+    def get_grb(grbs_list, level):
+        return next((msg for msg in grbs_list if msg['level'] == level), None)
 
-    print("\n📍 Plotting surface fields...")
-    for varname, settings in variables.items():
-        if settings['level_type'] != 'surface':
-            continue
+    temperature_grbs = field_data['Temperature']
+    available_levels = sorted({msg['level'] for msg in temperature_grbs})
+
+    # Outputs whose inputs are unchanged since the last run are skipped
+    manifest = render_manifest.load_manifest(os.path.join(output_dir, f".render_manifest.{yyyymmddhh}.json"))
+    digests = {}
+
+    def up_to_date(filepath, msgs, settings, level, style=None):
+        digest = render_manifest.input_digest(grib_file, index['source'], msgs, settings, level, style)
+        if not force and render_manifest.is_current(manifest, filepath, digest):
+            print(f"  ⏭️ Up to date: {os.path.basename(filepath)}")
+            return True
+        digests[filepath] = digest
+        return False
+
+    def on_saved(filepath):
+        render_manifest.record(manifest, filepath, digests.pop(filepath))
+        print(f"  ✅ Saved: {os.path.basename(filepath)}")
+
+    # Decode each needed field once and hand it to the renderer (serial or process pool)
+    def field_tasks():
+        print("\n📍 Plotting surface fields...")
+        for varname, settings in variables.items():
+            if settings['level_type'] != 'surface':
+                continue
 
-        grbs_list = field_data[varname]
-        if not grbs_list:
-            print(f"  ❌ {varname} not available at expected level")
-            continue
+            grbs_list = field_data[varname]
+            if not grbs_list:
+                print(f"  ❌ {varname} not available at expected level")
+                continue
 
-        grb = grbs_list[0]
-        level_label = "surface"
-        data = settings.get('convert', lambda x: x)(grb.values)
+            level_label = "surface"
+            fname = f"{varname.replace(' ', '_').lower()}_{level_label}_f{forecast_hour:03d}.png"
+            filepath = os.path.join(output_dir, fname)
+            if up_to_date(filepath, grbs_list[:1], settings, level_label, {'engine': engine}):
+                continue
 
-        if varname not in latlon_cache:
-            latlon_cache[varname] = grb.latlons()
-        lats, lons = latlon_cache[varname]
+            grb = grib_index.read_message(grbs, grbs_list[0])
+            data = settings.get('convert', lambda x: x)(memory_budget.field_values(grb, low_memory))
 
-        data_cyclic, lon_cyclic = add_cyclic_point(data, coord=lons[0])
+            lats, lons = grid_cache.get_latlons(grb)
 
-        plt.figure(figsize=(10, 6))
-        ax = plt.axes(projection=ccrs.PlateCarree())
-        ax.set_title(f"{varname} at {level_label}\nValid: {grb.validDate}")
-        ax.coastlines()
-        ax.add_feature(cfeature.BORDERS, linestyle=':')
-        ax.add_feature(cfeature.STATES, linestyle=':')
+            data_cyclic, lon_cyclic = add_cyclic_point(data, coord=lons[0])
 
-        cf = plt.contourf(lon_cyclic, lats[:, 0], data_cyclic, levels=20, cmap=settings['cmap'], transform=ccrs.PlateCarree())
-        plt.colorbar(cf, orientation='horizontal', pad=0.05, label=f"{varname} ({settings['units']})")
+            yield {'lons': lon_cyclic, 'lats': lats[:, 0], 'data': data_cyclic,
+                   'title': f"{varname} at {level_label}\nValid: {grb.validDate}",
+                   'filepath': filepath,
+                   'cmap': settings['cmap'], 'cbar_label': f"{varname} ({settings['units']})", 'engine': engine}
+            del data, data_cyclic, grb  # free the field before decoding the next one
 
-        fname = f"{varname.replace(' ', '_').lower()}_{level_label}_f{forecast_hour:03d}.png"
-        plt.savefig(os.path.join(output_dir, fname), dpi=150)
-        plt.close()
-        print(f"  ✅ Saved: {fname}")
+        if not available_levels:
+            return
 
-    def get_grb(grbs_list, level):
-        return next((grb for grb in grbs_list if grb.level == level), None)
+        missing_levels = [lvl for lvl in pressure_levels if lvl not in available_levels]
+        if missing_levels:
+            print(f"⚠️ Some requested pressure levels not found: {missing_levels}")
 
-    temperature_grbs = field_data['Temperature']
-    available_levels = sorted({grb.level for grb in temperature_grbs})
-    if not available_levels:
-        print("⚠️ No temperature fields found on isobaric levels.")
-        grbs.close()
-        return
+        for level in pressure_levels:
+            if level not in available_levels:
+                continue
+            print(f"\n📍 Plotting isobaric fields at {level} hPa...")
+            for varname, settings in variables.items():
+                if settings['level_type'] != 'isobaricInhPa':
+                    continue
+                msg = get_grb(field_data[varname], level)
+                if msg is None:
+                    print(f"  ❌ {varname} not available at {level} hPa")
+                    continue
+
+                fname = f"{varname.replace(' ', '_').lower()}_{level}hPa_f{forecast_hour:03d}.png"
+                filepath = os.path.join(output_dir, fname)
+                if up_to_date(filepath, [msg], settings, level, {'engine': engine}):
+                    continue
+
+                grb = grib_index.read_message(grbs, msg)
+                data = settings.get('convert', lambda x: x)(memory_budget.field_values(grb, low_memory))
+
+                lats, lons = grid_cache.get_latlons(grb)
+
+                data_cyclic, lon_cyclic = add_cyclic_point(data, coord=lons[0])
+
+                yield {'lons': lon_cyclic, 'lats': lats[:, 0], 'data': data_cyclic,
+                       'title': f"{varname} at {level} hPa\nValid: {grb.validDate}",
+                       'filepath': filepath,
+                       'cmap': settings['cmap'], 'cbar_label': f"{varname} ({settings['units']})", 'engine': engine}
+                del data, data_cyclic, grb  # free the field before decoding the next one
+
+    # Closed on every path, so one failed analysis in a batch leaks no handle
+    grbs = open(grib_file, 'rb')
+    try:
+        render_pool.render_fields(field_tasks(), workers=workers, executor=executor, on_saved=on_saved)
 
-    missing_levels = [lvl for lvl in pressure_levels if lvl not in available_levels]
-    if missing_levels:
-        print(f"⚠️ Some requested pressure levels not found: {missing_levels}")
+        if not available_levels:
+            print("⚠️ No temperature fields found on isobaric levels.")
+            return
 
-    for level in pressure_levels:
-        if level not in available_levels:
-            continue
-        print(f"\n📍 Plotting isobaric fields at {level} hPa...")
-        for varname, settings in variables.items():
-            if settings['level_type'] != 'isobaricInhPa':
+        # === ZONAL MEAN WIND PLOTS ===
+        print("\n📍 Plotting zonal mean winds...")
+        for comp in ['U component of wind', 'V component of wind']:
+            if not field_data[comp]:
+                print(f"  ❌ No zonal means available for {comp}")
                 continue
-            grb = get_grb(field_data[varname], level)
-            if grb is None:
-                print(f"  ❌ {varname} not available at {level} hPa")
+
+            fname = f"zonal_mean_{comp.split()[0].lower()}_f{forecast_hour:03d}.png"
+            filepath = os.path.join(output_dir, fname)
+            current = up_to_date(filepath, field_data[comp], variables[comp], 'zonal_mean')
+            if current and zonal is None:
                 continue
 
-            data = settings.get('convert', lambda x: x)(grb.values)
+            # All isobaric levels decoded into one (level, lat, lon) float32 stack
+            levels, stack, lats, _ = level_stack.decode_stack(grbs, field_data[comp])
+            zonal_means = level_stack.zonal_mean(stack)
+            latitudes = lats[:, 0]
+            del stack
+            if zonal is not None:
+                zonal[comp] = {'levels': levels, 'latitudes': np.array(latitudes), 'values': zonal_means,
+                               'units': variables[comp]['units'], 'cmap': variables[comp]['cmap']}
+            if current:
+                continue
 
-            if varname not in latlon_cache:
-                latlon_cache[varname] = grb.latlons()
-            lats, lons = latlon_cache[varname]
+            plot_zonal_mean(latitudes, levels, zonal_means, f"Zonal Mean {comp}\nValid: {forecast_datetime}",
+                            variables[comp]['cmap'], f"{comp} ({variables[comp]['units']})", filepath)
+            on_saved(filepath)
+    finally:
+        grbs.close()
 
-            data_cyclic, lon_cyclic = add_cyclic_point(data, coord=lons[0])
+    if low_memory:
+        print(f"🧠 Peak RSS for {yyyymmddhh}: {memory_budget.peak_rss_mb():.0f} MB")
 
-            plt.figure(figsize=(10, 6))
-            ax = plt.axes(projection=ccrs.PlateCarree())
-            ax.set_title(f"{varname} at {level} hPa\nValid: {grb.validDate}")
-            ax.coastlines()
-            ax.add_feature(cfeature.BORDERS, linestyle=':')
-            ax.add_feature(cfeature.STATES, linestyle=':')
-
-            cf = plt.contourf(lon_cyclic, lats[:, 0], data_cyclic, levels=20, cmap=settings['cmap'], transform=ccrs.PlateCarree())
-            plt.colorbar(cf, orientation='horizontal', pad=0.05, label=f"{varname} ({settings['units']})")
-
-            fname = f"{varname.replace(' ', '_').lower()}_{level}hPa_f{forecast_hour:03d}.png"
-            plt.savefig(os.path.join(output_dir, fname), dpi=150)
-            plt.close()
-            print(f"  ✅ Saved: {fname}")
-
-    # === ZONAL MEAN WIND PLOTS ===
-    print("\n📍 Plotting zonal mean winds...")
-    for comp in ['U component of wind', 'V component of wind']:
-        levels = []
-        latitudes = None
-        zonal_means = []
-
-        for grb in sorted(field_data[comp], key=lambda g: g.level):
-            data = grb.values
-            lats, _ = grb.latlons()
-            zonal_mean = np.mean(data, axis=1)  # mean over longitude
-            zonal_means.append(zonal_mean)
-            levels.append(grb.level)
-            if latitudes is None:
-                latitudes = lats[:, 0]
-
-        if not zonal_means:
-            print(f"  ❌ No zonal means available for {comp}")
-            continue
-
-        zonal_means = np.array(zonal_means)
-        levels = np.array(levels)
-
-        plt.figure(figsize=(10, 6))
-        cf = plt.contourf(latitudes, levels, zonal_means, levels=20, cmap=variables[comp]['cmap'])
-        plt.gca().invert_yaxis()
-        plt.colorbar(cf, orientation='horizontal', pad=0.05, label=f"{comp} ({variables[comp]['units']})")
-        plt.title(f"Zonal Mean {comp}\nValid: {forecast_datetime}")
-        plt.xlabel("Latitude")
-        plt.ylabel("Pressure Level (hPa)")
-
-        fname = f"zonal_mean_{comp.split()[0].lower()}_f{forecast_hour:03d}.png"
-        plt.savefig(os.path.join(output_dir, fname), dpi=150)
-        plt.close()
-        print(f"  ✅ Saved: {fname}")
-
-    grbs.close()
+# ==== BATCH MODE ====
+def _analysis_cycle(forecast_hour, pressure_levels, low_memory, force, engine, start, end, anl_dir):
+    """One analysis, rendered in the calling process; returns its zonal means."""
+    zonal = {}
+    try:
+        plot_forecast_hour(forecast_hour, pressure_levels, low_memory=low_memory, force=force, engine=engine,
+                           start=start, end=end, anl_dir=anl_dir, zonal=zonal)
+    except (OSError, ValueError, RuntimeError) as e:
+        # One bad analysis should not stop a batch of hundreds
+        print(f"❌ {analysis_file(start + datetime.timedelta(hours=forecast_hour), anl_dir)}: {e}")
+        return {}
+    return zonal
+
+def plot_analysis_range(start, end, step=cycle_step, pressure_levels=[500], anl_dir=gfs_anl_dir, workers=1,
+                        low_memory=False, force=False, engine='contourf'):
+    """Plot every available analysis from start to end, then the period zonal-mean aggregates.
+
+    With workers > 1 whole analyses run in parallel in a render pool, so each worker
+    keeps its basemap templates and grids across analyses. Only the small
+    (level, latitude) zonal means come back to this process, so no full field of
+    the period is held in memory.
+    """
+    times = analysis_times(start, end, step)
+    available = [when for when in times if os.path.exists(analysis_file(when, anl_dir))]
+    missing = [when for when in times if when not in available]
+    print(f"🗂️  {len(available)} of {len(times)} analyses found in {anl_dir}")
+    if missing:
+        shown = ', '.join(f"{when:%Y%m%d%H}" for when in missing[:10])
+        print(f"⚠️ Missing: {shown}" + (f" (+{len(missing) - 10} more)" if len(missing) > 10 else ""))
+    if not available:
+        return None
+
+    period = {}  # component -> units, cmap and {analysis time: zonal-mean section}
+
+    def accumulate(when, zonal):
+        for comp, section in zonal.items():
+            period.setdefault(comp, {'units': section['units'], 'cmap': section['cmap'], 'cycles': {}})
+            period[comp]['cycles'][when] = section
+
+    args = (pressure_levels, low_memory, force, engine, start, end, anl_dir)
+    hours = [int((when - start).total_seconds() // 3600) for when in available]
+    executor = render_pool.make_executor(workers) if workers > 1 else None
+    try:
+        if executor is None:
+            for hour, when in zip(hours, available):
+                accumulate(when, _analysis_cycle(hour, *args))
+        else:
+            futures = {executor.submit(_analysis_cycle, hour, *args): when for hour, when in zip(hours, available)}
+            for future in as_completed(futures):
+                accumulate(futures[future], future.result())
+
+        if period:
+            plot_period(period, start, end, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return period
+
+def plot_period(period, start, end, executor=None):
+    """Period-mean zonal means and each analysis's anomaly from them, plus an .npz of the numbers."""
+    output_dir = f"{base_output_dir}_period_{start:%Y%m%d%H}_{end:%Y%m%d%H}"
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"\n📍 Plotting period aggregates in {output_dir}...")
+
+    jobs = []
+    arrays = {}
+    for comp, agg in period.items():
+        name = comp.split()[0].lower()
+        units = agg['units']
+        # Analyses on other levels or grids than most of the period are left out
+        groups = {}
+        for when, section in agg['cycles'].items():
+            groups.setdefault((tuple(section['levels']), section['values'].shape), []).append(when)
+        cycles = sorted(max(groups.values(), key=len))
+        for when in sorted(set(agg['cycles']) - set(cycles)):
+            print(f"⚠️ {comp} at {when:%Y%m%d%H} is on other levels or grid; left out of the period mean")
+        levels, latitudes = agg['cycles'][cycles[0]]['levels'], agg['cycles'][cycles[0]]['latitudes']
+        sections = np.stack([agg['cycles'][c]['values'] for c in cycles])
+        mean = sections.mean(axis=0)
+        arrays.update({f"{name}_levels": levels, f"{name}_latitudes": latitudes, f"{name}_mean": mean,
+                       f"{name}_cycles": sections, f"{name}_times": np.array([f"{c:%Y%m%d%H}" for c in cycles])})
+
+        jobs.append((latitudes, levels, mean,
+                     f"Zonal Mean {comp}\nMean of {len(cycles)} analyses {start:%Y-%m-%d %HZ} to {end:%Y-%m-%d %HZ}",
+                     agg['cmap'], f"{comp} ({units})", os.path.join(output_dir, f"zonal_mean_{name}_period.png")))
+
+        # One symmetric scale for every anomaly of this component
+        anomalies = sections - mean
+        limit = float(np.nanmax(np.abs(anomalies))) or 1.0
+        anomaly_levels = np.linspace(-limit, limit, 21)
+        for c, anomaly in zip(cycles, anomalies):
+            jobs.append((latitudes, levels, anomaly, f"Zonal Mean {comp} Anomaly from Period Mean\nValid: {c}",
+                         'RdBu_r', f"{comp} anomaly ({units})",
+                         os.path.join(output_dir, f"zonal_mean_{name}_anomaly_{c:%Y%m%d%H}.png"), anomaly_levels))
+
+    path = os.path.join(output_dir, 'zonal_means.npz')
+    np.savez(path, **arrays)
+    print(f"  ✅ Saved: {os.path.basename(path)}")
+
+    if executor is None:
+        saved = (plot_zonal_mean(*job) for job in jobs)
+    else:
+        saved = (future.result() for future in [executor.submit(plot_zonal_mean, *job) for job in jobs])
+    for filepath in saved:
+        print(f"  ✅ Saved: {os.path.basename(filepath)}")
 
 # ==== ENTRY POINT ====
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python plot_gfs_analysis.py <forecast_hour> [pressure_levels]")
+        print("       python plot_gfs_analysis.py batch <start YYYYMMDDHH> <end YYYYMMDDHH> [step_hours] "
+              "[pressure_levels] [gfs_anl_dir]")
         sys.exit(1)
 
+    if sys.argv[1] == 'batch':
+        if len(sys.argv) < 4:
+            print("❌ Batch mode needs a start and end time (YYYYMMDDHH)")
+            sys.exit(1)
+        try:
+            start = datetime.datetime.strptime(sys.argv[2], '%Y%m%d%H')
+            end = datetime.datetime.strptime(sys.argv[3], '%Y%m%d%H')
+            step = int(sys.argv[4]) if len(sys.argv) >= 5 else cycle_step
+            pressure_levels = [int(x) for x in sys.argv[5].split(',')] if len(sys.argv) >= 6 else [500]
+        except ValueError as e:
+            print(f"❌ Invalid batch arguments: {e}")
+            sys.exit(1)
+        anl_dir = sys.argv[6] if len(sys.argv) >= 7 else gfs_anl_dir
+        if plot_analysis_range(start, end, step, pressure_levels, anl_dir, workers=render_pool.default_workers(),
+                               low_memory=memory_budget.low_memory_enabled(), force=render_manifest.force_enabled(),
+                               engine=render_pool.default_engine()) is None:
+            sys.exit(1)
+        sys.exit(0)
+
     forecast_hour = int(sys.argv[1])
     if len(sys.argv) >= 3:
         try:
@@ -197,5 +367,11 @@ if __name__ == "__main__":
     else:
         pressure_levels = [500]
 
-    plot_forecast_hour(forecast_hour, pressure_levels)
+    # PLOT_WORKERS: number of rendering processes (defaults to SLURM_CPUS_PER_TASK, else 1)
+    # PLOT_LOW_MEMORY=1: float32 decode, in-place conversions, peak RSS report
+    # PLOT_FORCE=1: re-render outputs even if the manifest says they are up to date
+    # PLOT_ENGINE=image: draw the maps as binned images instead of contourf
+    plot_forecast_hour(forecast_hour, pressure_levels, workers=render_pool.default_workers(),
+                       low_memory=memory_budget.low_memory_enabled(), force=render_manifest.force_enabled(),
+                       engine=render_pool.default_engine())
 
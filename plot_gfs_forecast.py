@@ -1,152 +1,362 @@
-import pygrib
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
+import itertools
 import os
 import sys
+import units
+import render_manifest
+import render_pool
+import contour_levels
+import grib_index
+import grid_cache
+import memory_budget
+import grib_subset
+import regions
+import level_stack
+import derived
+import tiles
+import timings
+
+# ==== CONFIGURATION ====
+# 'idx' is the variable abbreviation used in NOAA .idx inventories (byte-range subsetting)
+variables = {
+    'Convective available potential energy': {'units': 'J/kg', 'cmap': 'YlGnBu', 'level_type': 'surface', 'idx': 'CAPE'},
+    '2 metre temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': units.kelvin_to_celsius, 'level_type': 'heightAboveGround', 'idx': 'TMP'},
+    '2 metre relative humidity': {'units': '%', 'cmap': 'BrBG', 'level_type': 'heightAboveGround', 'idx': 'RH'},
+    'Precipitation rate': {'units': 'kg/m^2/s', 'cmap': 'Blues', 'level_type': 'surface', 'idx': 'PRATE'},
+    'Temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': units.kelvin_to_celsius, 'level_type': 'isobaricInhPa', 'idx': 'TMP'},
+    'Geopotential height': {'units': 'm', 'cmap': 'viridis', 'level_type': 'isobaricInhPa', 'idx': 'HGT'},
+    'U component of wind': {'units': 'm/s', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa', 'idx': 'UGRD'},
+    'V component of wind': {'units': 'm/s', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa', 'idx': 'VGRD'},
+    'Vertical velocity': {'units': 'Pa/s', 'cmap': 'bwr', 'level_type': 'isobaricInhPa', 'idx': 'VVEL'},
+}
+
+# Derived fields: 'inputs' name entries of `variables` (at the product's level unless a
+# (name, level) pair is given); 'compute' is called as compute(*inputs, (lats, lons)).
+derived_variables = {
+    '2 metre dewpoint': {'units': '°C', 'cmap': 'BrBG', 'level_type': 'heightAboveGround',
+                         'inputs': ('2 metre temperature', '2 metre relative humidity'), 'compute': derived.dewpoint},
+    'Thickness': {'units': 'm', 'cmap': 'viridis', 'level_type': 'isobaricInhPa', 'level_label': '1000-500hPa',
+                  'inputs': (('Geopotential height', 1000), ('Geopotential height', 500)), 'compute': derived.thickness},
+    'Wind speed': {'units': 'm/s', 'cmap': 'YlOrRd', 'level_type': 'isobaricInhPa', 'barbs': True,
+                   'inputs': ('U component of wind', 'V component of wind'), 'compute': derived.wind_speed},
+    'Relative vorticity': {'units': '10⁻⁵ s⁻¹', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa',
+                           'inputs': ('U component of wind', 'V component of wind'),
+                           'compute': derived.relative_vorticity},
+}
+
+def plot_forecast_hour(forecast_hour, pressure_levels=[500], input_dir='.', base_output_dir='level_plots', source=None,
+                       workers=1, executor=None, low_memory=False, force=False, engine='contourf',
+                       domain=None, panels=None, on_frame=None, output='png', zooms=None):
+    # Named region or lon/lat box; None plots the globe
+    domain_label, extent = regions.parse_domain(domain)
+    suffix = f"_{domain_label}" if domain_label else ""
 
-def plot_forecast_hour(forecast_hour, pressure_levels=[500], input_dir='.', base_output_dir='level_plots'):
     # Try both 3-digit and 2-digit forecast hour file formats
     fh_str_3 = f"{forecast_hour:03d}"
     fh_str_2 = f"{forecast_hour:02d}"
 
-    grib_file = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str_3}")
-    if not os.path.exists(grib_file):
-        alt_file = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str_2}")
-        if os.path.exists(alt_file):
-            print(f"🔁 Fallback: Using alternative file {alt_file}")
-            grib_file = alt_file
-            fh_str = fh_str_2
-        else:
-            print(f"❌ GRIB file not found: tried {grib_file} and {alt_file}")
+    if source is not None:
+        # Pull only the needed messages from the .idx inventory into a local subset file
+        grib_file = None
+        for fh_str in (fh_str_3, fh_str_2):
+            remote_file = grib_subset.join_source(source, f"gfs.t00z.pgrb2.0p25.f{fh_str}")
+            if grib_subset.exists(remote_file + grib_subset.IDX_SUFFIX):
+                os.makedirs(input_dir, exist_ok=True)
+                subset_file = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str}.subset")
+                try:
+                    with timings.stage('fetch', file=remote_file):
+                        grib_file = grib_subset.fetch_subset(remote_file, variables, pressure_levels, subset_file,
+                                                             derived_variables)
+                except grib_subset.FETCH_ERRORS as e:
+                    print(f"❌ Could not fetch GRIB subset from {remote_file}: {e}")
+                    return
+                break
+        if grib_file is None:
+            print(f"❌ GRIB inventory not found under {source} for forecast hour {forecast_hour}")
             return
     else:
-        fh_str = fh_str_3
+        grib_file = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str_3}")
+        if not os.path.exists(grib_file):
+            alt_file = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{fh_str_2}")
+            if os.path.exists(alt_file):
+                print(f"🔁 Fallback: Using alternative file {alt_file}")
+                grib_file = alt_file
+                fh_str = fh_str_2
+            else:
+                print(f"❌ GRIB file not found: tried {grib_file} and {alt_file}")
+                return
+        else:
+            fh_str = fh_str_3
 
     print(f"\nProcessing forecast hour: {forecast_hour} (file: {grib_file})")
+    if low_memory:
+        memory_budget.reset_peak_rss()
+    hour = timings.start('forecast_hour', file=grib_file, forecast_hour=forecast_hour)
 
-    grbs = pygrib.open(grib_file)
+    with timings.stage('scan', file=grib_file):
+        index = grib_index.load_index(grib_file)
+    with timings.stage('open', file=grib_file):
+        grbs = open(grib_file, 'rb')
 
     try:
-        first_msg = grbs.message(1)
-        yyyymmdd = str(first_msg.dataDate)
+        yyyymmdd = str(index['messages'][0]['dataDate'])
     except:
         yyyymmdd = "unknown"
 
     output_dir = f"{yyyymmdd}_{base_output_dir}"
     os.makedirs(output_dir, exist_ok=True)
 
-    variables = {
-        'Convective available potential energy': {'units': 'J/kg', 'cmap': 'YlGnBu', 'level_type': 'surface'},
-        '2 metre temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': lambda x: x - 273.15, 'level_type': 'heightAboveGround'},
-        '2 metre relative humidity': {'units': '%', 'cmap': 'BrBG', 'level_type': 'heightAboveGround'},
-        'Precipitation rate': {'units': 'kg/m^2/s', 'cmap': 'Blues', 'level_type': 'surface'},
-        'Temperature': {'units': '°C', 'cmap': 'coolwarm', 'convert': lambda x: x - 273.15, 'level_type': 'isobaricInhPa'},
-        'Geopotential height': {'units': 'm', 'cmap': 'viridis', 'level_type': 'isobaricInhPa'},
-        'U component of wind': {'units': 'm/s', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa'},
-        'V component of wind': {'units': 'm/s', 'cmap': 'RdBu_r', 'level_type': 'isobaricInhPa'},
-        'Vertical velocity': {'units': 'Pa/s', 'cmap': 'bwr', 'level_type': 'isobaricInhPa'},
-    }
-
-    field_data = {var: [] for var in variables}
-    latlon_cache = {}
-
-    for grb in grbs:
-        name = grb.name
-        if name in variables:
-            if grb.typeOfLevel == variables[name]['level_type']:
-                field_data[name].append(grb)
-
-    print("\n📍 Plotting surface and near-surface fields...")
-    for varname, settings in variables.items():
-        if settings['level_type'] not in ['surface', 'heightAboveGround']:
-            continue
-
-        grbs_list = field_data[varname]
-        if not grbs_list:
-            print(f"  ❌ {varname} not available at expected level")
-            continue
-
-        grb = grbs_list[0]
-        level_label = f"{grb.level}m" if settings['level_type'] == 'heightAboveGround' else "surface"
-        data = grb.values
-        if 'convert' in settings:
-            data = settings['convert'](data)
+    field_data = grib_index.select(index, variables)
 
-        if varname not in latlon_cache:
-            latlon_cache[varname] = grb.latlons()
-        lats, lons = latlon_cache[varname]
+    def get_grb(grbs_list, level):
+        for msg in grbs_list:
+            if msg['level'] == level:
+                return msg
+        return None
 
-        plt.figure(figsize=(10, 6))
-        ax = plt.axes(projection=ccrs.PlateCarree())
-        ax.set_title(f"{varname} at {level_label}\nValid: {grb.validDate}")
-        ax.coastlines()
-        ax.add_feature(cfeature.BORDERS, linestyle=':')
-        ax.add_feature(cfeature.STATES, linestyle=':')
+    # Outputs whose inputs are unchanged since the last run are skipped
+    manifest = render_manifest.load_manifest(os.path.join(output_dir, f".render_manifest.f{fh_str}.json"))
+    digests = {}
 
-        cf = plt.contourf(lons, lats, data, levels=20, cmap=settings['cmap'], transform=ccrs.PlateCarree())
-        plt.colorbar(cf, orientation='horizontal', pad=0.05, label=f"{varname} ({settings['units']})")
+    # Shared contour levels from contour_levels.py, if they were precomputed for this cycle
+    levels_table = contour_levels.load_levels(output_dir, domain_label)
 
-        fname = f"{varname.replace(' ', '_').lower()}_{level_label}_f{fh_str}.png"
-        filepath = os.path.join(output_dir, fname)
-        plt.savefig(filepath, dpi=150)
-        plt.close()
-        print(f"  ✅ Saved: {fname}")
+    # Tiles and COGs stand in for single-field PNGs; panel composites stay PNGs
+    zooms = tiles.default_zooms() if zooms is None and output == 'tiles' else zooms
 
-    def get_grb(grbs_list, level):
-        for grb in grbs_list:
-            if grb.level == level:
-                return grb
-        return None
+    def up_to_date(filepath, msgs, settings, level, style=None):
+        if output != 'png' and 'panels' not in (style or {}):
+            filepath = tiles.output_path(filepath, output)
+            style = dict(style, output=output, zooms=zooms)
+        digest = render_manifest.input_digest(grib_file, index['source'], msgs, settings, level, style)
+        if not force and render_manifest.is_current(manifest, filepath, digest):
+            print(f"  ⏭️ Up to date: {os.path.basename(filepath)}")
+            if on_frame is not None:
+                on_frame(filepath)
+            return True
+        digests[filepath] = digest
+        return False
 
-    temperature_grbs = field_data['Temperature']
-    available_levels = sorted({grb.level for grb in temperature_grbs})
-    if not available_levels:
-        print("No temperature fields found on isobaric levels.")
-        grbs.close()
-        return
+    # Derived-product inputs decoded for a raw plot, kept raw (unconverted) by message
+    # offset until derived.evaluate takes them, so no message is decoded twice per hour
+    derived_inputs = set()
+    kept = {}
 
-    missing_levels = [lvl for lvl in pressure_levels if lvl not in available_levels]
-    if missing_levels:
-        print(f"Warning: Some requested pressure levels not found in file: {missing_levels}")
+    def decode(msg, settings=None):
+        if msg['offset'] in kept:
+            return kept.pop(msg['offset'])
+        with timings.stage('decode', var=msg['name'], level=msg['level']):
+            grb = grib_index.read_message(grbs, msg)
+            data = memory_budget.field_values(grb, low_memory)
+            with timings.stage('latlons', var=msg['name']):
+                lats, lons = grid_cache.get_latlons(grb)
+            if extent is not None:
+                # Cut the domain out before converting and contouring
+                index, lats, lons = regions.subset_grid(lats, lons, extent)
+                data = regions.subset_field(data, index)
+            if msg['offset'] in derived_inputs and settings is not None:
+                kept[msg['offset']] = (grb, data, lats, lons)
+                if 'convert' in settings:
+                    data = data.copy()  # conversions work in place
+            if settings and 'convert' in settings:
+                data = settings['convert'](data)
+        return grb, data, lats, lons
+
+    def variable_panels(name, title, members):
+        """One composite image of several (varname, settings, msg, level_label) fields."""
+        filepath = os.path.join(output_dir, f"{name}_panel{suffix}_f{fh_str}.png")
+        levels = [levels_table.get(contour_levels.levels_key(varname, label), 20) for varname, _, _, label in members]
+        style = {'panels': 'variables', 'levels': levels, 'engine': engine, 'extent': extent}
+        if up_to_date(filepath, [m[2] for m in members], {m[0]: m[1] for m in members}, name, style):
+            return
+
+        fields = []
+        for (varname, settings, msg, _), field_levels in zip(members, levels):
+            grb, data, lats, lons = decode(msg, settings)
+            fields.append({'lons': lons, 'lats': lats, 'data': data, 'title': varname,
+                           'cmap': settings['cmap'], 'cbar_label': settings['units'], 'levels': field_levels})
+        yield {'panels': fields, 'title': f"{title}\nValid: {grb.validDate}", 'filepath': filepath,
+               'engine': engine, 'extent': extent}
+
+    def level_panels(varname, settings, msgs):
+        """One composite image of a variable on all requested levels, decoded as one stack."""
+        filepath = os.path.join(output_dir, f"{varname.replace(' ', '_').lower()}_levels_panel{suffix}_f{fh_str}.png")
+        msgs = sorted(msgs, key=lambda m: m['level'])
+        levels = [levels_table.get(contour_levels.levels_key(varname, f"{m['level']}hPa"), 20) for m in msgs]
+        style = {'panels': 'levels', 'levels': levels, 'engine': engine, 'extent': extent}
+        if up_to_date(filepath, msgs, settings, 'levels', style):
+            return
 
-    for level in pressure_levels:
-        if level not in available_levels:
-            continue
-        print(f"\n📍 Plotting isobaric fields at {level} hPa...")
+        with timings.stage('decode', var=varname, levels=len(msgs)):
+            plevels, stack, lats, lons = level_stack.decode_stack(grbs, msgs)
+        if extent is not None:
+            index, lats, lons = regions.subset_grid(lats, lons, extent)
+            stack = regions.subset_field(stack, (slice(None),) + tuple(index))
+        for i, msg in enumerate(msgs):
+            if msg['offset'] in derived_inputs:
+                kept[msg['offset']] = (grib_index.read_message(grbs, msg), stack[i].copy(), lats, lons)
+        if 'convert' in settings:
+            stack = settings['convert'](stack)
+        valid = grib_index.read_message(grbs, msgs[0]).validDate
+
+        fields = [{'lons': lons, 'lats': lats, 'data': stack[i], 'title': f"{level} hPa",
+                   'cmap': settings['cmap'], 'cbar_label': settings['units'], 'levels': field_levels}
+                  for i, (level, field_levels) in enumerate(zip(plevels, levels))]
+        yield {'panels': fields, 'title': f"{varname}\nValid: {valid}", 'filepath': filepath,
+               'engine': engine, 'extent': extent}
+
+    def on_saved(filepath):
+        render_manifest.record(manifest, filepath, digests.pop(filepath))
+        print(f"  ✅ Saved: {os.path.basename(filepath)}")
+        if on_frame is not None:
+            on_frame(filepath)
+
+    # Decode each needed field once and hand it to the renderer (serial or process pool)
+    def field_tasks():
+        print("\n📍 Plotting surface and near-surface fields...")
+        surface_members = []
         for varname, settings in variables.items():
-            if settings['level_type'] != 'isobaricInhPa':
+            if settings['level_type'] not in ['surface', 'heightAboveGround']:
                 continue
-            grb = get_grb(field_data[varname], level)
-            if grb is None:
-                print(f"  ❌ {varname} not available at {level} hPa")
+
+            grbs_list = field_data[varname]
+            if not grbs_list:
+                print(f"  ❌ {varname} not available at expected level")
                 continue
 
-            data = grb.values
-            if 'convert' in settings:
-                data = settings['convert'](data)
+            msg = grbs_list[0]
+            level_label = f"{msg['level']}m" if settings['level_type'] == 'heightAboveGround' else "surface"
+            if panels == 'variables':
+                surface_members.append((varname, settings, msg, level_label))
+                continue
+            fname = f"{varname.replace(' ', '_').lower()}_{level_label}{suffix}_f{fh_str}.png"
+            filepath = os.path.join(output_dir, fname)
+            levels = levels_table.get(contour_levels.levels_key(varname, level_label), 20)
+            style = {'levels': levels, 'engine': engine, 'extent': extent}
+            if up_to_date(filepath, [msg], settings, level_label, style):
+                continue
+
+            grb, data, lats, lons = decode(msg, settings)
 
-            if varname not in latlon_cache:
-                latlon_cache[varname] = grb.latlons()
-            lats, lons = latlon_cache[varname]
+            yield {'lons': lons, 'lats': lats, 'data': data,
+                   'title': f"{varname} at {level_label}\nValid: {grb.validDate}",
+                   'filepath': filepath,
+                   'cmap': settings['cmap'], 'cbar_label': f"{varname} ({settings['units']})", 'levels': levels,
+                   'engine': engine, 'extent': extent}
+            del data, grb  # free the field before decoding the next one
 
-            plt.figure(figsize=(10, 6))
-            ax = plt.axes(projection=ccrs.PlateCarree())
-            ax.set_title(f"{varname} at {level} hPa\nValid: {grb.validDate}")
-            ax.coastlines()
-            ax.add_feature(cfeature.BORDERS, linestyle=':')
-            ax.add_feature(cfeature.STATES, linestyle=':')
+        if surface_members:
+            yield from variable_panels("surface", "Surface and near-surface fields", surface_members)
 
-            cf = plt.contourf(lons, lats, data, levels=20, cmap=settings['cmap'], transform=ccrs.PlateCarree())
-            plt.colorbar(cf, orientation='horizontal', pad=0.05, label=f"{varname} ({settings['units']})")
+        temperature_grbs = field_data['Temperature']
+        available_levels = sorted({msg['level'] for msg in temperature_grbs})
+        if not available_levels:
+            print("No temperature fields found on isobaric levels.")
+            return
+
+        missing_levels = [lvl for lvl in pressure_levels if lvl not in available_levels]
+        if missing_levels:
+            print(f"Warning: Some requested pressure levels not found in file: {missing_levels}")
+
+        if panels == 'levels':
+            print("\n📍 Plotting isobaric fields on all levels...")
+            for varname, settings in variables.items():
+                if settings['level_type'] != 'isobaricInhPa':
+                    continue
+                msgs = [msg for msg in (get_grb(field_data[varname], level) for level in pressure_levels
+                                        if level in available_levels) if msg is not None]
+                if not msgs:
+                    print(f"  ❌ {varname} not available on requested levels")
+                    continue
+                yield from level_panels(varname, settings, msgs)
+            return
+
+        for level in pressure_levels:
+            if level not in available_levels:
+                continue
+            print(f"\n📍 Plotting isobaric fields at {level} hPa...")
+            level_members = []
+            for varname, settings in variables.items():
+                if settings['level_type'] != 'isobaricInhPa':
+                    continue
+                msg = get_grb(field_data[varname], level)
+                if msg is None:
+                    print(f"  ❌ {varname} not available at {level} hPa")
+                    continue
+                if panels == 'variables':
+                    level_members.append((varname, settings, msg, f"{level}hPa"))
+                    continue
 
-            fname = f"{varname.replace(' ', '_').lower()}_{level}hPa_f{fh_str}.png"
+                fname = f"{varname.replace(' ', '_').lower()}_{level}hPa{suffix}_f{fh_str}.png"
+                filepath = os.path.join(output_dir, fname)
+                levels = levels_table.get(contour_levels.levels_key(varname, f"{level}hPa"), 20)
+                style = {'levels': levels, 'engine': engine, 'extent': extent}
+                if up_to_date(filepath, [msg], settings, level, style):
+                    continue
+
+                grb, data, lats, lons = decode(msg, settings)
+
+                yield {'lons': lons, 'lats': lats, 'data': data,
+                       'title': f"{varname} at {level} hPa\nValid: {grb.validDate}",
+                       'filepath': filepath,
+                       'cmap': settings['cmap'], 'cbar_label': f"{varname} ({settings['units']})", 'levels': levels,
+                       'engine': engine, 'extent': extent}
+                del data, grb  # free the field before decoding the next one
+
+            if level_members:
+                yield from variable_panels(f"isobaric_{level}hPa", f"Isobaric fields at {level} hPa", level_members)
+
+    # Derived products still to draw; planned up front so the raw plots know which decodes to keep
+    def derived_todo():
+        todo = []
+        for name, spec, level_label, msgs in derived.plan(derived_variables, field_data, pressure_levels):
+            fname = f"{name.replace(' ', '_').lower()}_{level_label}{suffix}_f{fh_str}.png"
             filepath = os.path.join(output_dir, fname)
-            plt.savefig(filepath, dpi=150)
-            plt.close()
-            print(f"  ✅ Saved: {fname}")
+            levels = levels_table.get(contour_levels.levels_key(name, level_label), 20)
+            style = {'levels': levels, 'engine': engine, 'extent': extent}
+            if not up_to_date(filepath, msgs, spec, level_label, style):
+                todo.append((name, spec, level_label, msgs, filepath, levels))
+                derived_inputs.update(m['offset'] for m in msgs)
+        return todo
+
+    # Derived products; each input comes from the raw plots' decodes or is decoded (raw) once here
+    def derived_tasks(todo):
+        print("\n📍 Plotting derived fields...")
+        items = [item[:4] for item in todo]
+        results = derived.evaluate(items, decode)
+        for (name, spec, level_label, msgs, filepath, levels), result in zip(todo, results):
+            values, inputs, (lats, lons), grb = result[4:]
+            task = {'lons': lons, 'lats': lats, 'data': values,
+                    'title': f"{name} at {level_label.replace('hPa', ' hPa')}\nValid: {grb.validDate}",
+                    'filepath': filepath,
+                    'cmap': spec['cmap'], 'cbar_label': f"{name} ({spec['units']})", 'levels': levels,
+                    'engine': engine, 'extent': extent}
+            if spec.get('barbs'):
+                task['barbs'] = derived.thin_barbs(lats, lons, *inputs[:2])
+            yield task
+            del task, values, inputs
 
-    grbs.close()
+    def all_tasks():
+        tasks = field_tasks()
+        if derived_variables:
+            tasks = itertools.chain(tasks, derived_tasks(derived_todo()))
+        for task in tasks:
+            if output != 'png' and 'panels' not in task:
+                task.update(output=output, zooms=zooms)
+            yield task
+
+    try:
+        # Low memory: no more decoded fields waiting in shared memory than there are workers
+        saved = render_pool.render_fields(all_tasks(), workers=workers, executor=executor, on_saved=on_saved,
+                                          max_pending=workers if low_memory else None)
+    finally:
+        grbs.close()
+        timings.stop(hour)
+
+    if low_memory:
+        # Timed stages reset the peak counter; the forecast_hour stage keeps the overall peak
+        peak = hour['peak_mb'] if hour else memory_budget.peak_rss_mb()
+        print(f"🧠 Peak RSS for forecast hour {forecast_hour}: {peak:.0f} MB")
+    return saved
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -163,5 +373,23 @@ if __name__ == "__main__":
     else:
         pressure_levels = [500]
 
-    plot_forecast_hour(forecast_hour, pressure_levels)
+    # GFS_SOURCE: directory or http(s)/s3 base URL holding pgrb2 files with .idx inventories
+    # PLOT_WORKERS: number of rendering processes (defaults to SLURM_CPUS_PER_TASK, else 1)
+    # PLOT_LOW_MEMORY=1: float32 decode, in-place conversions, peak RSS report
+    # PLOT_FORCE=1: re-render outputs even if the manifest says they are up to date
+    # PLOT_ENGINE=image: draw regular lat/lon grids as binned images instead of contourf
+    # PLOT_DOMAIN: region name (conus, europe, ...) or lon_min,lon_max,lat_min,lat_max box
+    # PLOT_PANELS=variables|levels: composite images per level (all variables) or per variable (all levels)
+    # PLOT_TIMINGS=<log.jsonl>: per-stage time/memory records; PLOT_TIMINGS_SUMMARY=1 prints a table at the end
+    # PLOT_OUTPUT=tiles|cog: XYZ tile pyramids (TILE_ZOOMS, default 0-4) or Cloud-Optimized GeoTIFFs instead of PNGs
+    output = tiles.default_output()
+    if output not in tiles.OUTPUTS:
+        print(f"❌ Unknown PLOT_OUTPUT {output!r}; choose from {', '.join(tiles.OUTPUTS)}")
+        sys.exit(1)
+    plot_forecast_hour(forecast_hour, pressure_levels, source=os.environ.get('GFS_SOURCE'),
+                       workers=render_pool.default_workers(), low_memory=memory_budget.low_memory_enabled(),
+                       force=render_manifest.force_enabled(), engine=render_pool.default_engine(),
+                       domain=os.environ.get('PLOT_DOMAIN'), panels=os.environ.get('PLOT_PANELS') or None,
+                       output=output)
+    timings.summary()
 
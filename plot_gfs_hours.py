@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import contour_levels
+import memory_budget
+import render_manifest
+import render_pool
+import tiles
+import timings
+from plot_gfs_forecast import plot_forecast_hour
+
+# Plot a whole range of forecast hours in one process.
+#
+# Imports, the basemap template, lat/lon grids and (with PLOT_WORKERS > 1) the
+# rendering pool stay warm across hours, instead of paying them once per
+# Slurm array task. With animate='gif' or 'mp4', every frame is handed to its
+# loop as soon as it is saved (straight from the figure canvas when rendered in
+# this process), so loops are finished together with the last hour.
+
+def plot_forecast_hours(start_hr, end_hr, interval, pressure_levels=[500], input_dir='.',
+                        base_output_dir='level_plots', source=None, workers=1, low_memory=False,
+                        force=False, shared_levels=False, engine='contourf',
+                        domain=None, panels=None, animate_format=None, output='png', zooms=None):
+    if shared_levels and source is None:
+        # One sweep over all hours so every frame uses the same color scale
+        contour_levels.precompute(input_dir, range(start_hr, end_hr + 1, interval), pressure_levels,
+                                  base_output_dir=base_output_dir, domain=domain)
+
+    loops = None
+    if animate_format:
+        import animate
+        import basemap
+        loops = animate.new_loops(animate_format)
+
+    def on_frame(filepath):
+        animate.add_frame(loops, filepath, basemap.last_frame(filepath))
+
+    executor = render_pool.make_executor(workers) if workers > 1 else None
+    hour_timings = []
+    try:
+        for forecast_hour in range(start_hr, end_hr + 1, interval):
+            t0 = time.perf_counter()
+            memory_budget.reset_peak_rss()
+            saved = plot_forecast_hour(forecast_hour, pressure_levels, input_dir=input_dir,
+                                       base_output_dir=base_output_dir, source=source,
+                                       workers=workers, executor=executor, low_memory=low_memory,
+                                       force=force, engine=engine, domain=domain,
+                                       panels=panels, on_frame=on_frame if loops else None,
+                                       output=output, zooms=zooms)
+            hour_timings.append((forecast_hour, len(saved or []), time.perf_counter() - t0,
+                                 memory_budget.peak_rss_mb()))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if loops is not None:
+            animate.close_loops(loops)
+
+    print_timing_summary(hour_timings)
+    return hour_timings
+
+
+def print_timing_summary(timings):
+    print("\n⏱️  Per-hour timing summary")
+    print(f"{'Hour':>6} {'Plots':>6} {'Seconds':>9} {'Peak MB':>9}")
+    print("=" * 33)
+    for forecast_hour, nplots, seconds, peak_mb in timings:
+        print(f"{forecast_hour:>6} {nplots:>6} {seconds:>9.1f} {peak_mb:>9.0f}")
+    total = sum(t[2] for t in timings)
+    peak = max((t[3] for t in timings), default=0)
+    print("=" * 33)
+    print(f"{'Total':>6} {sum(t[1] for t in timings):>6} {total:>9.1f} {peak:>9.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python plot_gfs_hours.py <start_hr> <end_hr> <interval> [pressure_levels]")
+        sys.exit(1)
+
+    try:
+        start_hr, end_hr, interval = (int(x) for x in sys.argv[1:4])
+    except ValueError as e:
+        print(f"❌ Invalid forecast hour range: {e}")
+        sys.exit(1)
+
+    if len(sys.argv) >= 5:
+        try:
+            pressure_levels = [int(x) for x in sys.argv[4].split(',')]
+        except Exception as e:
+            print(f"❌ Invalid pressure levels: {e}")
+            sys.exit(1)
+    else:
+        pressure_levels = [500]
+
+    output = tiles.default_output()
+    if output not in tiles.OUTPUTS:
+        print(f"❌ Unknown PLOT_OUTPUT {output!r}; choose from {', '.join(tiles.OUTPUTS)}")
+        sys.exit(1)
+    if output != 'png' and os.environ.get('PLOT_ANIMATE'):
+        print(f"⚠️ PLOT_OUTPUT={output} writes no PNG frames; only panel images are animated")
+
+    plot_forecast_hours(start_hr, end_hr, interval, pressure_levels, source=os.environ.get('GFS_SOURCE'),
+                        workers=render_pool.default_workers(), low_memory=memory_budget.low_memory_enabled(),
+                        force=render_manifest.force_enabled(),
+                        shared_levels=os.environ.get('PLOT_SHARED_LEVELS', '').lower() in ('1', 'true', 'yes'),
+                        engine=render_pool.default_engine(), domain=os.environ.get('PLOT_DOMAIN'),
+                        panels=os.environ.get('PLOT_PANELS') or None,
+                        animate_format=os.environ.get('PLOT_ANIMATE') or None, output=output)
+    timings.summary()
@@ -1,27 +1,32 @@
 #!/usr/bin/env python3
 import os
 import sys
-import numpy as np
-from netCDF4 import Dataset, num2date
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 
 # --- Handle command-line arguments ---
+# (before the heavy imports, so a usage error returns immediately)
 if len(sys.argv) < 4:
-    print("Usage: python plot_nc_fields.py <netcdf_file> <forecast_hour> <level1,level2,...>")
+    print("Usage: python plot_nc_fields.py <netcdf_file[,file2,...]> <forecast_hour[,hour2,...]> <level1,level2,...>")
     sys.exit(1)
 
-nc_file = sys.argv[1]
-forecast_hour = sys.argv[2]
+nc_files = sys.argv[1].split(',')
+forecast_hours = sys.argv[2].split(',')
 levels = [int(lvl) for lvl in sys.argv[3].split(',')]
+if len(forecast_hours) != len(nc_files):
+    print(f"❌ Got {len(nc_files)} files but {len(forecast_hours)} forecast hours")
+    sys.exit(1)
 
-# --- Load Dataset ---
-ds = Dataset(nc_file)
+# Shared helpers (basemap.py, nc_access.py, ...) live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import contour_levels
+import nc_access
+import tiles
+import timings
 
-# --- Extract valid time ---
-time_var = ds.variables['XTIME']
-valid_time = num2date(time_var[:], time_var.units)[0]
+# PLOT_OUTPUT=tiles|cog: XYZ tile pyramids (TILE_ZOOMS, default 0-4) or Cloud-Optimized GeoTIFFs instead of PNGs
+output = tiles.default_output()
+if output not in tiles.OUTPUTS:
+    print(f"❌ Unknown PLOT_OUTPUT {output!r}; choose from {', '.join(tiles.OUTPUTS)}")
+    sys.exit(1)
 
 # --- Setup output directory ---
 start_date = "20250401"
@@ -44,47 +49,79 @@ level_vars = {
     'W': 'w'
 }
 
-def plot_field(data, lats, lons, title, filename):
-    plt.figure(figsize=(10, 6))
-    ax = plt.axes(projection=ccrs.PlateCarree())
-    ax.coastlines()
-    ax.add_feature(cfeature.BORDERS, linestyle=':')
-    ax.add_feature(cfeature.STATES, linestyle=':')
-    cf = ax.contourf(lons, lats, data, levels=20, cmap='viridis', transform=ccrs.PlateCarree())
-    plt.title(title)
-    plt.colorbar(cf, orientation='horizontal', pad=0.05)
-    plt.savefig(filename, dpi=150)
-    plt.close()
+def plot_field(data, lats, lons, title, filename, key):
+    """Plot one field; returns the path written (a tile directory or .tif with PLOT_OUTPUT)."""
+    field_levels = shared_levels.get(key, 20)
+    if output != 'png':
+        with timings.stage('render', file=filename):
+            return tiles.render_field(lons, lats, data, title, filename, cmap='viridis', levels=field_levels,
+                                      output=output)
+    # Regional domain: fix the map extent to the grid bounds so the basemap can be reused
+    extent = [float(lons.min()), float(lons.max()), float(lats.min()), float(lats.max())]
+    with timings.stage('render', file=filename):
+        basemap.plot_on_basemap(lons, lats, data, title, filename, cmap='viridis', levels=field_levels,
+                                extent=extent)
+    return filename
+
+def plot_file(nc, forecast_hour):
+    valid_time = nc_access.valid_time(nc)
+
+    # Read once per run for all files on the same grid
+    with timings.stage('latlons', file=nc['path']):
+        lats, lons = nc_access.coordinates(nc)
 
-# --- Coordinate variables ---
-lats = ds.variables['XLAT'][0]
-lons = ds.variables['XLONG'][0]
+    # --- Plot fixed-height variables ---
+    for varname in fixed_vars:
+        if varname in nc['ds'].variables:
+            desc = nc_access.attribute(nc, varname, 'description', varname)
+            with timings.stage('decode', var=varname):
+                data = nc_access.read_field(nc, varname)
+            fname = os.path.join(outdir, f"{fixed_vars[varname]}_F{int(forecast_hour):03d}.png")
+            title = f"{desc}\nValid: {valid_time.strftime('%Y-%m-%d %H:%M:%S')}"
+            key = contour_levels.levels_key(varname, 'surface')
+            print(f"✅ Saved: {plot_field(data, lats, lons, title, fname, key)}")
 
-# --- Plot fixed-height variables ---
-for varname in fixed_vars:
-    if varname in ds.variables:
-        var = ds.variables[varname]
-        desc = var.description if 'description' in var.ncattrs() else varname
-        data = var[0, :, :]
-        fname = os.path.join(outdir, f"{fixed_vars[varname]}_F{int(forecast_hour):03d}.png")
-        title = f"{desc}\nValid: {valid_time.strftime('%Y-%m-%d %H:%M:%S')}"
-        plot_field(data, lats, lons, title, fname)
-        print(f"✅ Saved: {fname}")
+    # --- Plot variable-height variables ---
+    for varname in level_vars:
+        if varname in nc['ds'].variables:
+            desc = nc_access.attribute(nc, varname, 'description', varname)
+            n_levels = nc_access.variable(nc, varname).shape[1]
+            for lvl in levels:
+                if lvl >= n_levels:
+                    print(f"⚠️  Skipping {varname} level {lvl}: out of bounds")
+            with nc_access.level_reads(nc, varname):
+                for lvl in sorted({lvl for lvl in levels if lvl < n_levels}):
+                    with timings.stage('decode', var=varname, level=lvl):
+                        data = nc_access.read_level(nc, varname, lvl)
+                    fname = os.path.join(outdir, f"{level_vars[varname]}_lvl{lvl}_F{int(forecast_hour):03d}.png")
+                    title = f"{desc} at MPAS lvl {lvl}\nValid: {valid_time.strftime('%Y-%m-%d %H:%M:%S')}"
+                    key = contour_levels.levels_key(varname, f"lvl{lvl}")
+                    print(f"✅ Saved: {plot_field(data, lats, lons, title, fname, key)}")
 
-# --- Plot variable-height variables ---
-for varname in level_vars:
-    if varname in ds.variables:
-        var = ds.variables[varname]
-        desc = var.description if 'description' in var.ncattrs() else varname
-        for lvl in levels:
-            if lvl >= var.shape[1]:
-                print(f"⚠️  Skipping {varname} level {lvl}: out of bounds")
-                continue
-            data = var[0, lvl, :, :]
-            fname = os.path.join(outdir, f"{level_vars[varname]}_lvl{lvl}_F{int(forecast_hour):03d}.png")
-            title = f"{desc} at MPAS lvl {lvl}\nValid: {valid_time.strftime('%Y-%m-%d %H:%M:%S')}"
-            plot_field(data, lats, lons, title, fname)
-            print(f"✅ Saved: {fname}")
+# PLOT_TIMINGS=<log.jsonl>: per-stage time/memory records; PLOT_TIMINGS_SUMMARY=1 prints a table at the end
+# NC_MMAP=1: memory-map uncompressed classic-format files instead of reading through netCDF4
+# PLOT_SHARED_LEVELS=1: one sweep over all files first, so every time step uses the same color levels
+shared_levels = {}
+if os.environ.get('PLOT_SHARED_LEVELS', '').lower() in ('1', 'true', 'yes'):
+    print(f"📏 Computing shared contour levels from {len(nc_files)} files...")
+    with timings.stage('shared_levels', files=len(nc_files)):
+        shared_levels = contour_levels.compute_nc_levels(nc_files, list(fixed_vars) + list(level_vars), levels,
+                                                         nc_access.mmap_enabled())
 
-ds.close()
+for nc_file, forecast_hour in zip(nc_files, forecast_hours):
+    run = timings.start('nc_file', file=nc_file, forecast_hour=forecast_hour)
+    try:
+        with timings.stage('open', file=nc_file):
+            nc = nc_access.open_file(nc_file, nc_access.mmap_enabled())
+        # matplotlib/cartopy only once the first file has opened, and only for PNGs
+        if output == 'png':
+            import basemap
+        try:
+            plot_file(nc, forecast_hour)
+        finally:
+            nc_access.close_file(nc)
+    finally:
+        # A file that fails still gets its record in the timings log
+        timings.stop(run)
 
+timings.summary()
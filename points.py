@@ -0,0 +1,361 @@
+import csv
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+
+import numpy as np
+
+import contour_levels
+import grib_index
+import grid_cache
+import memory_budget
+import timings
+
+# Station time series and meteograms.
+#
+# Stations come from a CSV file with id, lat and lon columns (name is optional).
+# A station index is built once per grid definition and station list. It holds
+# the flat grid index of the nearest point, or of the four surrounding points
+# with bilinear weights. It is stored next to the cached lat/lon grid (see
+# grid_cache.py), so every field, forecast hour and later run reuses it. Each
+# decoded field is reduced to its station values by one vectorized gather into
+# an (hours, stations) array per field, then dropped; nothing is contoured.
+# Several cycles (input directories) can be read in one run, and their series
+# are kept side by side. Output is one CSV per station, or one Parquet table
+# when pyarrow is installed, plus a meteogram per station.
+#
+# Regular lat/lon and Gaussian grids are indexed from their 1-D axes; any other
+# grid falls back to the nearest point by great-circle distance.
+
+METHODS = ('nearest', 'bilinear')
+FORMATS = ('csv', 'parquet')
+REGULAR_GRIDS = ('regular_ll', 'regular_gg')
+
+_indexes = {}
+
+
+def load_stations(path):
+    """{'id': [...], 'name': [...], 'lat': array, 'lon': array} from a station CSV."""
+    with open(path, newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row.get('id')]
+    if not rows:
+        raise ValueError(f"No stations in {path}")
+    missing = {'id', 'lat', 'lon'} - set(rows[0])
+    if missing:
+        raise ValueError(f"Station file {path} has no {', '.join(sorted(missing))} column")
+    ids = [row['id'].strip() for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate station ids in {path}")
+    return {
+        'id': ids,
+        'name': [(row.get('name') or row['id']).strip() for row in rows],
+        'lat': np.array([float(row['lat']) for row in rows]),
+        'lon': np.array([float(row['lon']) for row in rows]),
+    }
+
+
+def _positions(axis, values, periodic):
+    """Fractional index of each value along a monotonic 1-D axis, and a mask of values off the axis."""
+    idx = np.arange(axis.size, dtype=np.float64)
+    if periodic:
+        # Wrap into [first, first + 360) and let the last interval run back to index 0
+        values = (values - axis[0]) % 360 + axis[0]
+        axis, idx = np.append(axis, axis[0] + 360), np.append(idx, axis.size)
+    if axis[0] > axis[-1]:
+        axis, idx = axis[::-1], idx[::-1]
+    outside = (values < axis[0]) | (values > axis[-1])
+    return np.interp(values, axis, idx), outside
+
+
+def _regular_index(lats, lons, stations, method):
+    lat_axis = np.asarray(lats[:, 0], dtype=np.float64)
+    lon_axis = np.asarray(lons[0], dtype=np.float64)
+    nj, ni = lat_axis.size, lon_axis.size
+    dlon = abs(lon_axis[1] - lon_axis[0])
+    periodic = abs(ni * dlon - 360) < dlon / 2
+
+    y, y_out = _positions(lat_axis, stations['lat'], False)
+    # Station longitudes in the grid's convention (0..360 for GFS)
+    x, x_out = _positions(lon_axis, (stations['lon'] - lon_axis.min()) % 360 + lon_axis.min(), periodic)
+
+    if method == 'nearest':
+        flat = (np.rint(y).astype(np.int64) * ni + np.rint(x).astype(np.int64) % ni)[:, None]
+        weights = np.ones(flat.shape)
+    else:
+        y0 = np.minimum(np.floor(y).astype(np.int64), nj - 2)
+        x0 = np.floor(x).astype(np.int64)
+        if not periodic:
+            x0 = np.minimum(x0, ni - 2)
+        fy, fx = y - y0, x - x0
+        x0, x1 = x0 % ni, (x0 + 1) % ni
+        flat = np.stack([y0 * ni + x0, y0 * ni + x1, (y0 + 1) * ni + x0, (y0 + 1) * ni + x1], axis=1)
+        weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+    weights[y_out | x_out] = np.nan
+    return {'flat': flat, 'weights': weights}
+
+
+def _nearest_index(lats, lons, stations):
+    """Nearest grid point by great-circle distance, for grids without 1-D axes."""
+    def unit_vectors(lat, lon):
+        lat, lon = np.deg2rad(lat), np.deg2rad(lon)
+        return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+    grid = unit_vectors(np.ravel(lats), np.ravel(lons)).astype(np.float32)
+    points = unit_vectors(stations['lat'], stations['lon']).astype(np.float32)
+    # The largest dot product is the smallest angular distance
+    flat = np.array([np.argmax(grid @ point) for point in points], dtype=np.int64)[:, None]
+    return {'flat': flat, 'weights': np.ones(flat.shape)}
+
+
+def build_index(lats, lons, stations, method='bilinear', grid_type='regular_ll'):
+    if grid_type in REGULAR_GRIDS:
+        return _regular_index(lats, lons, stations, method)
+    if method != 'nearest':
+        print(f"⚠️ {method} interpolation needs a regular grid; using nearest points on {grid_type}")
+    return _nearest_index(lats, lons, stations)
+
+
+def _stations_digest(stations, method):
+    digest = hashlib.sha1(method.encode())
+    digest.update(np.ascontiguousarray(stations['lat']).tobytes())
+    digest.update(np.ascontiguousarray(stations['lon']).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def station_index(grb, lats, lons, stations, method='bilinear'):
+    """Index of the stations on the message's grid, from memory, the grid cache or built now."""
+    key = grid_cache.grid_key(grb)
+    if key is None:
+        return build_index(lats, lons, stations, method, grid_type=None)
+
+    digest = _stations_digest(stations, method)
+    if (key, digest) in _indexes:
+        return _indexes[(key, digest)]
+
+    path = os.path.join(grid_cache.GRID_CACHE_DIR, grid_cache.grid_id(key), f"points_{digest}.npz")
+    try:
+        with np.load(path) as cached:
+            _indexes[(key, digest)] = {'flat': cached['flat'], 'weights': cached['weights']}
+        return _indexes[(key, digest)]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = build_index(lats, lons, stations, method, grid_type=key[0])
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path[:-len('.npz')]}.tmp{os.getpid()}.npz"
+        np.savez(tmp, **index)
+        os.replace(tmp, path)
+    except OSError:
+        print(f"⚠️ Could not write station index under {grid_cache.GRID_CACHE_DIR}; keeping it in memory only")
+    _indexes[(key, digest)] = index
+    return index
+
+
+def extract(data, index):
+    """Station values of one 2-D field; NaN for stations off the grid or on masked points."""
+    flat = np.ma.filled(data, np.nan).ravel() if np.ma.isMaskedArray(data) else np.ravel(data)
+    return (flat[index['flat']] * index['weights']).sum(axis=1)
+
+
+def extract_series(grib_files, stations, variables, pressure_levels, method='bilinear'):
+    """Station series of every (variable, level) in grib_files, one row per file.
+
+    Returns {'init': [...], 'valid': [...], 'fields': {label: {'units', 'values'}}}
+    where values is a (files, stations) array; rows of files without any of the
+    fields keep init/valid None and NaN values.
+    """
+    n_times, n_stations = len(grib_files), len(stations['id'])
+    series = {'init': [None] * n_times, 'valid': [None] * n_times, 'fields': {}}
+    for t, grib_file in enumerate(grib_files):
+        with timings.stage('forecast_hour', file=grib_file):
+            index = grib_index.load_index(grib_file)
+            field_data = grib_index.select(index, variables)
+            with open(grib_file, 'rb') as f:
+                for varname, settings, level_label, msg in grib_index.field_messages(field_data, variables,
+                                                                                     pressure_levels):
+                    with timings.stage('decode', var=varname, level=msg['level']):
+                        grb = grib_index.read_message(f, msg)
+                        data = memory_budget.field_values(grb, low_memory=True)
+                        lats, lons = grid_cache.get_latlons(grb)
+                    if series['valid'][t] is None:
+                        series['init'][t], series['valid'][t] = grb.analDate, grb.validDate
+                    values = extract(data, station_index(grb, lats, lons, stations, method))
+                    del grb, data
+                    if 'convert' in settings:
+                        values = settings['convert'](values)
+                    field = series['fields'].setdefault(f"{varname} {level_label}", {
+                        'units': settings['units'], 'values': np.full((n_times, n_stations), np.nan)})
+                    field['values'][t] = values
+    return series
+
+
+def _rows(series):
+    """Indices of the times that were read, ordered by cycle then valid time."""
+    rows = [t for t, valid in enumerate(series['valid']) if valid is not None]
+    return sorted(rows, key=lambda t: (series['init'][t], series['valid'][t]))
+
+
+def _forecast_hour(series, t):
+    return int(round((series['valid'][t] - series['init'][t]).total_seconds() / 3600))
+
+
+def _file_name(station_id):
+    return re.sub(r'[^\w.-]', '_', station_id)
+
+
+def write_csv(series, stations, output_dir):
+    """One <station id>.csv per station: init/valid time, forecast hour and a column per field."""
+    rows = _rows(series)
+    labels = list(series['fields'])
+    header = ['init_time', 'valid_time', 'forecast_hour'] + [
+        f"{label} ({series['fields'][label]['units']})" for label in labels]
+    paths = []
+    for s, station_id in enumerate(stations['id']):
+        path = os.path.join(output_dir, f"{_file_name(station_id)}.csv")
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for t in rows:
+                writer.writerow([series['init'][t].isoformat(), series['valid'][t].isoformat(),
+                                 _forecast_hour(series, t)]
+                                + [f"{series['fields'][label]['values'][t, s]:.6g}" for label in labels])
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def write_parquet(series, stations, path):
+    """One table with a row per station and time (station columns first, then one column per field)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = _rows(series)
+    n_stations = len(stations['id'])
+    columns = {
+        'station': np.repeat(stations['id'], len(rows)),
+        'name': np.repeat(stations['name'], len(rows)),
+        'lat': np.repeat(stations['lat'], len(rows)),
+        'lon': np.repeat(stations['lon'], len(rows)),
+        'init_time': [series['init'][t] for t in rows] * n_stations,
+        'valid_time': [series['valid'][t] for t in rows] * n_stations,
+        'forecast_hour': [_forecast_hour(series, t) for t in rows] * n_stations,
+    }
+    for label, field in series['fields'].items():
+        columns[f"{label} ({field['units']})"] = field['values'][rows].T.ravel()
+    tmp = f"{path}.tmp{os.getpid()}"
+    pq.write_table(pa.table(columns), tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def plot_meteogram(series, stations, s, filepath):
+    """One panel per field with a line per cycle, on an Agg canvas."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    rows = _rows(series)
+    cycles = {}
+    for t in rows:
+        cycles.setdefault(series['init'][t], []).append(t)
+
+    labels = list(series['fields'])
+    fig = Figure(figsize=(10, 1.0 + 2.0 * len(labels)), layout='constrained')
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(len(labels), 1, sharex=True, squeeze=False)[:, 0]
+    for ax, label in zip(axes, labels):
+        field = series['fields'][label]
+        for init, times in cycles.items():
+            ax.plot([series['valid'][t] for t in times], field['values'][times, s], marker='o', markersize=3,
+                    label=f"{init:%Y-%m-%d %HZ}")
+        ax.set_title(label, loc='left', fontsize=9)
+        ax.set_ylabel(field['units'])
+        ax.grid(alpha=0.3)
+    if len(cycles) > 1:
+        axes[0].legend(fontsize=8, ncol=min(len(cycles), 4))
+    fig.suptitle(f"{stations['name'][s]} ({stations['id'][s]})  "
+                 f"{stations['lat'][s]:.2f}°N {stations['lon'][s]:.2f}°E")
+    fig.autofmt_xdate()
+    fig.savefig(filepath, dpi=100)
+    return filepath
+
+
+def extract_points(station_file, input_dirs, hours, pressure_levels, method='bilinear', fmt='csv',
+                   meteograms=True, base_output_dir='points'):
+    """Write station series (and meteograms) for the given cycles and hours; returns the output directory."""
+    from plot_gfs_forecast import variables
+
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise RuntimeError("pyarrow is needed for Parquet output; use csv or install pyarrow")
+    stations = load_stations(station_file)
+    grib_files = []
+    for input_dir in input_dirs:
+        grib_files += contour_levels.find_grib_files(input_dir, hours)
+    if not grib_files:
+        print(f"❌ No GRIB files found in {', '.join(input_dirs)} for hours {list(hours)}")
+        return None
+
+    print(f"📍 Extracting {len(stations['id'])} stations from {len(grib_files)} files ({method})...")
+    series = extract_series(grib_files, stations, variables, pressure_levels, method)
+    if not series['fields']:
+        print("❌ None of the configured variables were found")
+        return None
+
+    yyyymmdd = f"{min(init for init in series['init'] if init is not None):%Y%m%d}"
+    output_dir = f"{yyyymmdd}_{base_output_dir}"
+    os.makedirs(output_dir, exist_ok=True)
+
+    if fmt == 'parquet':
+        path = write_parquet(series, stations, os.path.join(output_dir, 'points.parquet'))
+        print(f"  ✅ Saved: {path}")
+    else:
+        paths = write_csv(series, stations, output_dir)
+        print(f"  ✅ Saved: {len(paths)} station series in {output_dir}")
+
+    if meteograms:
+        for s, station_id in enumerate(stations['id']):
+            filepath = os.path.join(output_dir, f"meteogram_{_file_name(station_id)}.png")
+            with timings.stage('render', file=filepath):
+                plot_meteogram(series, stations, s, filepath)
+        print(f"  ✅ Saved: {len(stations['id'])} meteograms in {output_dir}")
+    return output_dir
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print("Usage: python points.py <stations.csv> <start_hr> <end_hr> <interval> [pressure_levels] "
+              "[input_dir[,input_dir2,...]] [csv|parquet]")
+        sys.exit(1)
+
+    station_file = sys.argv[1]
+    try:
+        start_hr, end_hr, interval = (int(x) for x in sys.argv[2:5])
+        pressure_levels = [int(x) for x in sys.argv[5].split(',')] if len(sys.argv) >= 6 else [500]
+    except ValueError as e:
+        print(f"❌ Invalid arguments: {e}")
+        sys.exit(1)
+    input_dirs = sys.argv[6].split(',') if len(sys.argv) >= 7 else ['.']
+    fmt = sys.argv[7] if len(sys.argv) >= 8 else 'csv'
+    # POINTS_METHOD=nearest|bilinear (default bilinear); POINTS_METEOGRAMS=0 writes the series only
+    method = os.environ.get('POINTS_METHOD', 'bilinear')
+    if fmt not in FORMATS or method not in METHODS:
+        print(f"❌ Unknown format {fmt!r} or method {method!r}: use one of {FORMATS} and {METHODS}")
+        sys.exit(1)
+    if not os.path.exists(station_file):
+        print(f"❌ Station file not found: {station_file}")
+        sys.exit(1)
+
+    try:
+        output_dir = extract_points(station_file, input_dirs, range(start_hr, end_hr + 1, interval),
+                                    pressure_levels, method, fmt,
+                                    meteograms=os.environ.get('POINTS_METEOGRAMS', '1').lower()
+                                    not in ('0', 'false', 'no'))
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if output_dir is None:
+        sys.exit(1)
+    timings.summary()
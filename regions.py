@@ -0,0 +1,84 @@
+import numpy as np
+
+# Regional domains.
+#
+# A domain is a named region from REGIONS or a "lon_min,lon_max,lat_min,lat_max"
+# box (degrees east/north, -180..180). Fields are cut to the domain right after
+# decoding, with an index slice on the cached lat/lon grid, so conversion,
+# contouring and saving only touch the region. The same extent is used for the map
+# axes, so Natural Earth features outside the region are never drawn.
+
+REGIONS = {
+    'conus': (-130.0, -60.0, 20.0, 55.0),
+    'alaska': (-180.0, -125.0, 50.0, 75.0),
+    'hawaii': (-165.0, -150.0, 15.0, 25.0),
+    'north_america': (-170.0, -50.0, 10.0, 75.0),
+    'europe': (-25.0, 45.0, 30.0, 72.0),
+}
+
+_subsets = {}
+
+
+def parse_domain(spec):
+    """Return (label, extent) for a region name or a lon/lat box; (None, None) for the globe."""
+    if spec is None or spec.strip().lower() in ('', 'global'):
+        return None, None
+    name = spec.strip().lower()
+    if name in REGIONS:
+        return name, REGIONS[name]
+    try:
+        lon_min, lon_max, lat_min, lat_max = (float(x) for x in spec.split(','))
+    except ValueError:
+        raise ValueError(f"Unknown domain {spec!r}: use one of {sorted(REGIONS)} or lon_min,lon_max,lat_min,lat_max")
+    if not (-180 <= lon_min < lon_max <= 180 and -90 <= lat_min < lat_max <= 90):
+        raise ValueError(f"Invalid domain box {spec!r}")
+    label = f"{lon_min:g}_{lon_max:g}_{lat_min:g}_{lat_max:g}".replace('-', 'm')
+    return label, (lon_min, lon_max, lat_min, lat_max)
+
+
+def _indices(lat, lon, extent):
+    lon_min, lon_max, lat_min, lat_max = extent
+    # Keep one extra row/column on each side so contours reach the map edges
+    rows = np.flatnonzero((lat >= lat_min) & (lat <= lat_max))
+    rows = np.arange(max(rows[0] - 1, 0), min(rows[-1] + 2, lat.size)) if rows.size else rows
+    # Columns are taken west to east in -180..180, so a box across 0° on a 0..360 grid
+    # is one run and its neighbours across 0° are padded too
+    wrapped = (lon + 180) % 360 - 180
+    order = np.argsort(wrapped, kind='stable')
+    inside = np.flatnonzero((wrapped[order] >= lon_min) & (wrapped[order] <= lon_max))
+    if not rows.size or not inside.size:
+        raise ValueError(f"Domain {extent} does not overlap the grid")
+    cols = order[max(inside[0] - 1, 0):min(inside[-1] + 2, lon.size)]
+    return rows, cols
+
+
+def _as_slice(idx):
+    if idx.size > 1 and np.all(np.diff(idx) == 1):
+        return slice(int(idx[0]), int(idx[-1]) + 1)
+    return idx
+
+
+def subset_grid(lats, lons, extent):
+    """Return (index, sub_lats, sub_lons) for a regular 2-D grid; index cuts fields the same way.
+
+    Cached per grid and extent, so every field on the same grid shares one set of
+    sub-grid arrays.
+    """
+    key = (id(lats), id(lons), tuple(extent))
+    if key not in _subsets:
+        rows, cols = _indices(np.asarray(lats[:, 0]), np.asarray(lons[0]), extent)
+        row_index, col_index = _as_slice(rows), _as_slice(cols)
+        if isinstance(row_index, slice) and isinstance(col_index, slice):
+            index = (row_index, col_index)
+        else:
+            index = np.ix_(rows, cols)
+        sub_lons = np.ascontiguousarray(lons[index])
+        sub_lons = (sub_lons + 180) % 360 - 180
+        # lats/lons are kept alive with the entry so their ids cannot be reused
+        _subsets[key] = (index, np.ascontiguousarray(lats[index]), sub_lons, lats, lons)
+    return _subsets[key][:3]
+
+
+def subset_field(data, index):
+    """Copy the domain out of a decoded field so the global array can be freed."""
+    return data[index].copy()
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+
+# Skip-if-unchanged rendering.
+#
+# Each output PNG is recorded in a JSON manifest together with a digest of
+# everything that went into it: the source GRIB file identity (path, size, mtime),
+# the message's byte offset/length, the variable's settings, the level and the
+# plot style. Outputs whose digest is unchanged and whose file still exists are
+# not rendered again. Bump STYLE_VERSION when the rendering code changes look.
+
+STYLE_VERSION = 1
+
+
+def _jsonable(obj):
+    if callable(obj):
+        return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}"
+    return repr(obj)
+
+
+def input_digest(grib_file, source, msgs, settings, level, style=None):
+    """Digest of one output's inputs; msgs is the list of index entries it is drawn from."""
+    parts = {
+        'grib_file': os.path.abspath(grib_file),
+        'source': source,
+        'messages': [{'offset': m['offset'], 'length': m['length']} for m in msgs],
+        'settings': settings,
+        'level': level,
+        'style': dict(style or {}, version=STYLE_VERSION),
+    }
+    blob = json.dumps(parts, sort_keys=True, default=_jsonable)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    return {'path': path, 'entries': entries}
+
+
+def is_current(manifest, filepath, digest):
+    return manifest['entries'].get(os.path.basename(filepath)) == digest and os.path.exists(filepath)
+
+
+def record(manifest, filepath, digest):
+    # Written after every output so a killed job keeps what it already finished
+    manifest['entries'][os.path.basename(filepath)] = digest
+    tmp = f"{manifest['path']}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(manifest['entries'], f, indent=1, sort_keys=True)
+    os.replace(tmp, manifest['path'])
+
+
+def force_enabled():
+    return os.environ.get('PLOT_FORCE', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import timings
+
+# Fan field rendering out to a process pool.
+#
+# A render task is a dict with the arrays 'lons', 'lats' and 'data' plus the
+# keyword arguments of basemap.plot_on_basemap (title, filepath, cmap, ...).
+# With workers > 1 the arrays are copied once into shared memory and workers
+# attach to them by name, so nothing large is pickled. Grids shared by several
+# tasks (same array object) are only copied once per call. Tasks are pulled from
+# the generator only as render slots free up, so a whole forecast hour never sits
+# decoded in /dev/shm at once.
+#
+# A panel task has a 'panels' list of such field dicts instead of the arrays and
+# is drawn with basemap.plot_panels as one composite image. A field task with an
+# 'output' of 'tiles' or 'cog' is written by tiles.render_field instead, with no
+# figure; the path it returns (not the PNG's) is what on_saved receives.
+#
+# basemap (matplotlib + cartopy) is only imported by the process that renders,
+# so usage errors, missing files and fully up-to-date runs never pay for it.
+# Pool workers are started as soon as the pool is made and import it while the
+# parent is still scanning and decoding.
+
+ARRAY_KEYS = ('lons', 'lats', 'data')
+
+
+def default_workers():
+    return int(os.environ.get('PLOT_WORKERS', os.environ.get('SLURM_CPUS_PER_TASK', 1)))
+
+
+def default_engine():
+    return os.environ.get('PLOT_ENGINE', 'contourf')
+
+
+def _preload():
+    import basemap  # noqa: F401
+
+
+def make_executor(workers):
+    # Workers must share the parent's tracker for the shared-memory blocks created later
+    resource_tracker.ensure_running()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_preload)
+    executor.submit(int)  # start the workers now rather than at the first render
+    return executor
+
+
+def _share(arr):
+    arr = np.ascontiguousarray(np.ma.filled(arr, np.nan) if np.ma.isMaskedArray(arr) else arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, {'shm': shm.name, 'shape': arr.shape, 'dtype': arr.dtype.str}
+
+
+def _attach(spec, handles):
+    shm = shared_memory.SharedMemory(name=spec['shm'])
+    handles.append(shm)
+    return np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=shm.buf)
+
+
+def _draw(lons, lats, data, kwargs):
+    """Render one field task; returns the path written."""
+    if kwargs.get('output', 'png') != 'png':
+        import tiles
+        return tiles.render_field(lons, lats, data, **kwargs)
+    import basemap
+    basemap.plot_on_basemap(lons, lats, data, **kwargs)
+    return kwargs['filepath']
+
+
+def _render_shared(desc):
+    handles = []
+    render = timings.start('render', file=desc['kwargs']['filepath'])
+    try:
+        if 'panels' in desc:
+            import basemap
+            panels = [dict(panel['kwargs'], **{key: _attach(panel[key], handles) for key in ARRAY_KEYS})
+                      for panel in desc['panels']]
+            basemap.plot_panels(panels, **desc['kwargs'])
+            panels.clear()
+        else:
+            arrays = {key: _attach(desc[key], handles) for key in ARRAY_KEYS}
+            filepath = _draw(arrays['lons'], arrays['lats'], arrays['data'], desc['kwargs'])
+            arrays.clear()
+            return filepath
+        return desc['kwargs']['filepath']
+    finally:
+        for shm in handles:
+            shm.close()
+        timings.stop(render)
+
+
+def _render(task):
+    kwargs = {k: v for k, v in task.items() if k not in ARRAY_KEYS}
+    with timings.stage('render', file=kwargs['filepath']):
+        if 'panels' in task:
+            import basemap
+            basemap.plot_panels(**kwargs)
+            return kwargs['filepath']
+        return _draw(task['lons'], task['lats'], task['data'], kwargs)
+
+
+def _release(handles):
+    for shm in handles:
+        shm.close()
+        shm.unlink()
+
+
+def render_fields(tasks, workers=None, executor=None, on_saved=None, max_pending=None):
+    """Render every task; returns the saved file paths in task order.
+
+    With a pool, at most max_pending tasks (default 2 x workers) are in shared
+    memory at once; the next task is only taken from `tasks` (and decoded) once
+    a render has finished.
+    """
+    on_saved = on_saved or (lambda path: print(f"  ✅ Saved: {os.path.basename(path)}"))
+    workers = default_workers() if workers is None else workers
+
+    if executor is None and workers <= 1:
+        saved = []
+        for task in tasks:
+            filepath = _render(task)
+            task.clear()
+            on_saved(filepath)
+            saved.append(filepath)
+        return saved
+
+    own_executor = executor is None
+    executor = executor or make_executor(workers)
+    max_pending = max_pending or 2 * max(workers, 1)
+    shared = {}      # id(array) -> (array, shm, spec) for arrays reused across tasks
+    pending = {}     # future -> shm handles owned by that task only
+    order = []
+    try:
+        def collect(return_when):
+            done, _ = wait(list(pending), return_when=return_when)
+            for future in done:
+                _release(pending.pop(future))
+                on_saved(future.result())
+
+        def describe(field, owned):
+            desc = {'kwargs': {k: v for k, v in field.items() if k not in ARRAY_KEYS}}
+            for key in ('lons', 'lats'):
+                arr = field[key]
+                if id(arr) not in shared:
+                    shm, spec = _share(arr)
+                    shared[id(arr)] = (arr, shm, spec)
+                desc[key] = shared[id(arr)][2]
+            shm, desc['data'] = _share(field['data'])
+            owned.append(shm)
+            return desc
+
+        for task in tasks:
+            owned = []
+            if 'panels' in task:
+                desc = {'kwargs': {k: v for k, v in task.items() if k != 'panels'},
+                        'panels': [describe(panel, owned) for panel in task['panels']]}
+            else:
+                desc = describe(task, owned)
+            task.clear()  # drop the decoded fields as soon as they live in shared memory
+
+            future = executor.submit(_render_shared, desc)
+            pending[future] = owned
+            order.append(future)
+            # Backpressure: hold off decoding the next field until a render slot frees up
+            while len(pending) >= max_pending:
+                collect(FIRST_COMPLETED)
+
+        while pending:
+            collect(FIRST_COMPLETED)
+        return [future.result() for future in order]
+    finally:
+        for owned in pending.values():
+            _release(owned)
+        _release(shm for _, shm, _ in shared.values())
+        if own_executor:
+            executor.shutdown()
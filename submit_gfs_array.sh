@@ -15,7 +15,7 @@ echo "   This will create $NUM_JOBS tasks (array 0-$MAX_TASK_ID)"
 echo "📋 Pressure levels: $PRESSURE_LEVELS"
 
 # Export environment and submit job with computed array range and pressure levels
-sbatch --export=START_HR=${START_HR},END_HR=${END_HR},INTERVAL=${INTERVAL},PRESSURE_LEVELS=${PRESSURE_LEVELS} \
+sbatch --export=ALL,START_HR=${START_HR},END_HR=${END_HR},INTERVAL=${INTERVAL},PRESSURE_LEVELS=${PRESSURE_LEVELS} \
        --array=0-${MAX_TASK_ID} \
        plot_gfs_array.sbatch
 
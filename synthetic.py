@@ -0,0 +1,182 @@
+import datetime
+import os
+import struct
+import sys
+
+import numpy as np
+
+# Synthetic input files for benchmarks, generated offline.
+#
+# write_gfs_grib writes a GFS-like pgrb2 file: regular lat/lon grid (template 3.0)
+# at 1, 0.5 or 0.25 degrees, analysis/forecast product (4.0) and 16-bit simple
+# packing (5.0), with the variables and levels plot_gfs_forecast.py reads.
+# write_mpassit_nc writes a WRF/MPASSIT-like NetCDF file with XLAT, XLONG, XTIME,
+# Times, 2-D surface fields (T2, U10, V10, Q2, RAINNC) and 4-D T/U/V/W on a curvilinear
+# grid. Fields are smooth analytic patterns so contouring does realistic work.
+
+GFS_RESOLUTIONS = {'1p00': 1.0, '0p50': 0.5, '0p25': 0.25}
+PRESSURE_LEVELS = (1000, 925, 850, 700, 500, 300, 250, 200)
+
+# idx name -> (discipline 0 parameter category, number)
+_PARAMETERS = {
+    'TMP': (0, 0), 'RH': (1, 1), 'PRATE': (1, 7), 'UGRD': (2, 2), 'VGRD': (2, 3),
+    'VVEL': (2, 8), 'HGT': (3, 5), 'CAPE': (7, 6),
+}
+# level_type -> GRIB2 type of first fixed surface
+_SURFACES = {'surface': 1, 'isobaricInhPa': 100, 'heightAboveGround': 103}
+
+
+def _signed(value):
+    # GRIB2 stores negative integers as sign bit + magnitude
+    return (0x80000000 | -value) if value < 0 else value
+
+
+def grib_message(idx, level_type, level, data, date, forecast_hour, lat1=90.0, lon1=0.0):
+    """Encode one field on a global lat/lon grid (north to south, from lon1 eastwards)."""
+    nj, ni = data.shape
+    dlon = 360.0 / ni
+    dlat = 180.0 / (nj - 1)
+    category, number = _PARAMETERS[idx]
+    micro = lambda deg: int(round(deg * 1e6))
+
+    sec1 = struct.pack('>IBHHBBBHBBBBBBB', 21, 1, 7, 0, 2, 1, 1,
+                       date.year, date.month, date.day, date.hour, 0, 0, 0, 1)
+    sec3 = (struct.pack('>IBBIBBH', 72, 3, 0, ni * nj, 0, 0, 0)
+            + struct.pack('>BBIBIBIIIIIIIBIIIIB', 6, 0, 0, 0, 0, 0, 0, ni, nj, 0, 0,
+                          _signed(micro(lat1)), _signed(micro(lon1)), 48,
+                          _signed(micro(lat1 - (nj - 1) * dlat)), _signed(micro(lon1 + (ni - 1) * dlon)),
+                          micro(dlon), micro(dlat), 0))
+    surface_value = level * 100 if level_type == 'isobaricInhPa' else level
+    sec4 = (struct.pack('>IBHH', 34, 4, 0, 0)
+            + struct.pack('>BBBBBHBBIBBIBBI', category, number, 2, 0, 96, 0, 0, 1, forecast_hour,
+                          _SURFACES[level_type], 0, surface_value, 255, 0, 0))
+
+    values = np.asarray(data, dtype=np.float64).ravel()
+    reference = float(np.float32(values.min()))
+    span = values.max() - reference
+    scale = int(np.ceil(np.log2(span / 65535))) if span > 0 else 0
+    packed = np.round((values - reference) / 2.0 ** scale).clip(0, 65535).astype('>u2').tobytes()
+    sec5 = (struct.pack('>IBIH', 21, 5, ni * nj, 0)
+            + struct.pack('>fHHBB', reference, (0x8000 | -scale) if scale < 0 else scale, 0, 16, 0))
+    sec6 = struct.pack('>IBB', 6, 6, 255)
+    sec7 = struct.pack('>IB', 5 + len(packed), 7) + packed
+
+    body = sec1 + sec3 + sec4 + sec5 + sec6 + sec7 + b'7777'
+    return b'GRIB' + struct.pack('>HBBQ', 0, 0, 2, 16 + len(body)) + body
+
+
+def gfs_fields(resolution, forecast_hour=0, pressure_levels=PRESSURE_LEVELS):
+    """Yield (idx, level_type, level, data) for a GFS-like forecast hour."""
+    lat = np.linspace(90, -90, int(round(180 / resolution)) + 1)
+    lon = np.arange(0, 360, resolution)
+    lons, lats = np.meshgrid(np.deg2rad(lon), np.deg2rad(lat))
+    phase = forecast_hour * 0.05
+    wave = np.sin(3 * lons + phase) * np.cos(lats)
+
+    yield 'CAPE', 'surface', 0, np.clip(2000 * np.cos(lats) ** 4 * (1 + wave), 0, None)
+    yield 'TMP', 'heightAboveGround', 2, 288 - 40 * np.sin(lats) ** 2 + 5 * wave
+    yield 'RH', 'heightAboveGround', 2, np.clip(60 + 35 * np.cos(5 * lats) * np.sin(2 * lons + phase), 0, 100)
+    yield 'PRATE', 'surface', 0, 1e-4 * np.clip(wave, 0, None) ** 2
+    for level in pressure_levels:
+        depth = level / 1000
+        yield 'TMP', 'isobaricInhPa', level, 200 + 80 * depth - 30 * np.sin(lats) ** 2 + 3 * wave
+        yield 'HGT', 'isobaricInhPa', level, 7.4e3 * np.log(1000 / level) + 150 * np.cos(2 * lats) + 60 * wave
+        yield 'UGRD', 'isobaricInhPa', level, 35 * (1.2 - depth) * np.cos(2 * lats) ** 2 + 8 * wave
+        yield 'VGRD', 'isobaricInhPa', level, 12 * np.sin(4 * lons + phase) * np.cos(lats)
+        yield 'VVEL', 'isobaricInhPa', level, 0.5 * np.sin(6 * lons - phase) * np.cos(3 * lats)
+
+
+def write_gfs_grib(path, resolution=0.25, forecast_hour=0, date=datetime.datetime(2025, 4, 1),
+                   pressure_levels=PRESSURE_LEVELS):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        for idx, level_type, level, data in gfs_fields(resolution, forecast_hour, pressure_levels):
+            f.write(grib_message(idx, level_type, level, data, date, forecast_hour))
+    os.replace(tmp, path)
+    return path
+
+
+def write_mpassit_nc(path, nx=400, ny=250, nz=30, valid=datetime.datetime(2025, 4, 1), forecast_hour=0,
+                     fmt='NETCDF4', compress=False):
+    """WRF/MPASSIT-style file: dims Time, bottom_top, south_north, west_east.
+
+    fmt is a netCDF4 format ('NETCDF3_64BIT_OFFSET' for classic); compress deflates
+    the fields (NETCDF4 only).
+    """
+    from netCDF4 import Dataset
+
+    # Curvilinear CONUS-like grid, slightly rotated like a Lambert conformal domain
+    j, i = np.meshgrid(np.linspace(0, 1, ny), np.linspace(0, 1, nx), indexing='ij')
+    xlat = 22 + 30 * j + 3 * np.sin(np.pi * i)
+    xlong = -125 + 58 * i - 4 * (j - 0.5) * (i - 0.5)
+    lat_r, lon_r = np.deg2rad(xlat), np.deg2rad(xlong)
+    wave = np.sin(4 * lon_r + 0.1 * forecast_hour) * np.cos(3 * lat_r)
+
+    with Dataset(path, 'w', format=fmt) as ds:
+        ds.createDimension('Time', None)
+        ds.createDimension('bottom_top', nz)
+        ds.createDimension('south_north', ny)
+        ds.createDimension('west_east', nx)
+        ds.createDimension('DateStrLen', 19)
+
+        times = ds.createVariable('Times', 'S1', ('Time', 'DateStrLen'))
+        times[0] = np.array(list(f"{valid:%Y-%m-%d_%H:%M:%S}"), dtype='S1')
+
+        xtime = ds.createVariable('XTIME', 'f4', ('Time',))
+        xtime.units = f"minutes since {valid - datetime.timedelta(hours=forecast_hour):%Y-%m-%d %H:%M:%S}"
+        xtime.description = 'minutes since simulation start'
+        xtime[0] = forecast_hour * 60
+
+        for name, values, desc in (('XLAT', xlat, 'LATITUDE, SOUTH IS NEGATIVE'),
+                                   ('XLONG', xlong, 'LONGITUDE, WEST IS NEGATIVE')):
+            var = ds.createVariable(name, 'f4', ('Time', 'south_north', 'west_east'))
+            var.units = 'degree_north' if name == 'XLAT' else 'degree_east'
+            var.description = desc
+            var[0] = values
+
+        def field(name, dims, units, desc, values):
+            var = ds.createVariable(name, 'f4', dims, zlib=compress)
+            var.units = units
+            var.description = desc
+            var.coordinates = 'XLONG XLAT XTIME'
+            var[0] = values
+
+        surface = ('Time', 'south_north', 'west_east')
+        field('T2', surface, 'K', 'TEMP at 2 M', 300 - 30 * (xlat - 22) / 30 + 4 * wave)
+        field('U10', surface, 'm s-1', 'U at 10 M', 8 * wave)
+        field('V10', surface, 'm s-1', 'V at 10 M', 6 * np.cos(5 * lon_r))
+        field('Q2', surface, 'kg kg-1', 'QV at 2 M', 0.012 * np.cos(lat_r) ** 2)
+        field('RAINNC', surface, 'mm', 'ACCUMULATED TOTAL GRID SCALE PRECIPITATION',
+              np.clip(20 * wave, 0, None))
+
+        volume = ('Time', 'bottom_top', 'south_north', 'west_east')
+        height = np.linspace(0, 1, nz)[:, None, None]
+        field('T', volume, 'K', 'temperature', 295 - 70 * height + 3 * wave)
+        field('U', volume, 'm s-1', 'x-wind component', 10 + 30 * height + 5 * wave)
+        field('V', volume, 'm s-1', 'y-wind component', 8 * np.sin(3 * lat_r) * (1 + height))
+        field('W', volume, 'm s-1', 'z-wind component', 0.2 * wave * np.sin(np.pi * height))
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python synthetic.py <output_dir> [forecast_hours] [resolution: 1p00|0p50|0p25]")
+        sys.exit(1)
+
+    output_dir = sys.argv[1]
+    try:
+        hours = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) >= 3 else [0]
+        res_name = sys.argv[3] if len(sys.argv) >= 4 else '0p25'
+        resolution = GFS_RESOLUTIONS[res_name]
+    except (ValueError, KeyError) as e:
+        print(f"❌ Invalid arguments: {e}")
+        sys.exit(1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for forecast_hour in hours:
+        path = write_gfs_grib(os.path.join(output_dir, f"gfs.t00z.pgrb2.{res_name}.f{forecast_hour:03d}"),
+                              resolution, forecast_hour)
+        print(f"  ✅ Saved: {path}")
+        path = write_mpassit_nc(os.path.join(output_dir, f"mpassit.f{forecast_hour:03d}.nc"),
+                                forecast_hour=forecast_hour)
+        print(f"  ✅ Saved: {path}")
@@ -0,0 +1,113 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import grib_subset
+
+# A fake pgrb2 file: six "messages" of distinct bytes and their inventory
+MESSAGES = [(b'A' * 10, 'CAPE', 'surface'), (b'B' * 20, 'TMP', '2 m above ground'),
+            (b'C' * 30, 'RH', '2 m above ground'), (b'D' * 40, 'TMP', '500 mb'), (b'E' * 50, 'HGT', '500 mb'),
+            (b'F' * 60, 'HGT', '1000 mb')]
+PAYLOAD = b''.join(m[0] for m in MESSAGES)
+
+VARIABLES = {
+    'Convective available potential energy': {'idx': 'CAPE', 'level_type': 'surface'},
+    '2 metre temperature': {'idx': 'TMP', 'level_type': 'heightAboveGround'},
+    'Geopotential height': {'idx': 'HGT', 'level_type': 'isobaricInhPa'},
+}
+
+# A derived product with fixed-level inputs, like Thickness in plot_gfs_forecast
+PRODUCTS = {
+    'Thickness': {'level_type': 'isobaricInhPa', 'level_label': '1000-500hPa',
+                  'inputs': (('Geopotential height', 1000), ('Geopotential height', 500))},
+}
+
+
+def _inventory():
+    lines, offset = [], 0
+    for n, (data, var, level) in enumerate(MESSAGES, 1):
+        lines.append(f"{n}:{offset}:d=2025040100:{var}:{level}:6 hour fcst:")
+        offset += len(data)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@pytest.fixture
+def server():
+    """Local HTTP server with Range support; records the ranges asked for."""
+    files = {'/gfs.f006': PAYLOAD, '/gfs.f006.idx': _inventory()}
+    state = {'ranges': [], 'honor_range': True}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            m = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if m and state['honor_range']:
+                start = int(m.group(1))
+                end = int(m.group(2)) if m.group(2) else len(body) - 1
+                state['ranges'].append((self.path, start, end))
+                body = body[start:end + 1]
+                self.send_response(206)
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_subset_merges_adjacent_ranges(server, tmp_path):
+    dest = tmp_path / 'gfs.f006.subset'
+    grib_subset.fetch_subset(f"{server['url']}/gfs.f006", VARIABLES, [500], str(dest))
+
+    # CAPE and 2 m TMP are adjacent (one request), then 500 mb HGT
+    assert [r for r in server['ranges'] if r[0] == '/gfs.f006'] == [('/gfs.f006', 0, 29), ('/gfs.f006', 100, 149)]
+    assert dest.read_bytes() == b'A' * 10 + b'B' * 20 + b'E' * 50
+
+
+def test_fetch_subset_adds_fixed_level_inputs(server, tmp_path):
+    dest = tmp_path / 'gfs.f006.subset'
+    grib_subset.fetch_subset(f"{server['url']}/gfs.f006", VARIABLES, [500], str(dest), PRODUCTS)
+
+    # 1000 mb HGT is fetched for Thickness although only 500 hPa was asked for; 500 mb HGT only once
+    assert [r for r in server['ranges'] if r[0] == '/gfs.f006'] == [('/gfs.f006', 0, 29), ('/gfs.f006', 100, 209)]
+    assert dest.read_bytes() == b'A' * 10 + b'B' * 20 + b'E' * 50 + b'F' * 60
+
+
+def test_fetch_subset_reuses_unchanged_subset(server, tmp_path):
+    dest = tmp_path / 'gfs.f006.subset'
+    grib_subset.fetch_subset(f"{server['url']}/gfs.f006", VARIABLES, [500], str(dest))
+    mtime = dest.stat().st_mtime_ns
+    server['ranges'].clear()
+
+    grib_subset.fetch_subset(f"{server['url']}/gfs.f006", VARIABLES, [500], str(dest))
+    assert not [r for r in server['ranges'] if r[0] == '/gfs.f006']
+    assert dest.stat().st_mtime_ns == mtime
+
+
+def test_ignored_range_is_an_error(server, tmp_path):
+    server['honor_range'] = False
+    dest = tmp_path / 'gfs.f006.subset'
+    with pytest.raises(grib_subset.FETCH_ERRORS, match='ignored byte range'):
+        grib_subset.fetch_subset(f"{server['url']}/gfs.f006", VARIABLES, [500], str(dest))
+    assert not dest.exists()
+    assert not list(tmp_path.iterdir())  # no partial file left behind
+
+
+def test_missing_inventory(server):
+    assert not grib_subset.exists(f"{server['url']}/gfs.f012.idx")
+    assert grib_subset.exists(f"{server['url']}/gfs.f006.idx")
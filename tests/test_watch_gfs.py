@@ -0,0 +1,82 @@
+import os
+import re
+import threading
+import time
+
+import watch_gfs
+
+
+def _grib(input_dir, forecast_hour, complete=True, age=0):
+    path = os.path.join(input_dir, f"gfs.t00z.pgrb2.0p25.f{forecast_hour:03d}")
+    with open(path, 'wb') as f:
+        f.write(b'GRIB' + b'\0' * 100 + (b'7777' if complete else b''))
+    if age:
+        then = time.time() - age
+        os.utime(path, (then, then))
+    return path
+
+
+def fake_plot(forecast_hour, pressure_levels, input_dir='.'):
+    """Stands in for plot_forecast_hour in the pool; leaves a marker per plotted hour."""
+    time.sleep(0.2)
+    with open(os.path.join(input_dir, f"plotted.{forecast_hour}"), 'w') as f:
+        f.write(','.join(map(str, pressure_levels)))
+
+
+def _watch(input_dir, **kwargs):
+    options = dict(max_workers=1, poll_seconds=0.05, settle_seconds=0.2, idle_timeout=5, plot=fake_plot)
+    options.update(kwargs)
+    return watch_gfs.watch(str(input_dir), [500], **options)
+
+
+def test_find_ready_skips_partial_and_unsettled_files(tmp_path):
+    _grib(tmp_path, 0, age=10)
+    _grib(tmp_path, 6, complete=False, age=10)  # no end marker yet
+    _grib(tmp_path, 12)                           # just written
+    (tmp_path / 'gfs.t00z.pgrb2.0p25.f018.idx').write_text('')
+    assert watch_gfs.find_ready(str(tmp_path), set(), settle_seconds=5) == [0]
+    assert watch_gfs.find_ready(str(tmp_path), {0}, settle_seconds=5) == []
+
+
+def test_partial_file_is_plotted_once_complete(tmp_path):
+    _grib(tmp_path, 0, age=10)
+    partial = _grib(tmp_path, 6, complete=False, age=10)
+
+    def finish_later():
+        time.sleep(0.5)
+        assert not (tmp_path / 'plotted.6').exists()
+        with open(partial, 'ab') as f:
+            f.write(b'7777')
+
+    writer = threading.Thread(target=finish_later)
+    writer.start()
+    status = _watch(tmp_path, hours=[0, 6])
+    writer.join()
+
+    assert status == {0: 'done', 6: 'done'}
+    assert (tmp_path / 'plotted.6').read_text() == '500'
+
+
+def test_queue_is_bounded(tmp_path, capsys):
+    for forecast_hour in range(0, 36, 6):
+        _grib(tmp_path, forecast_hour, age=10)
+    status = _watch(tmp_path, hours=range(0, 36, 6), max_pending=2)
+    assert set(status.values()) == {'done'} and len(status) == 6
+
+    # Replay the log: never more than max_pending hours queued but not finished
+    in_flight = peak = 0
+    for line in capsys.readouterr().out.splitlines():
+        if re.match(r"📥 Queued", line):
+            in_flight += 1
+        elif re.match(r"✅ Finished", line):
+            in_flight -= 1
+        peak = max(peak, in_flight)
+    assert peak == 2
+
+
+def test_idle_timeout_stops_waiting_for_missing_hours(tmp_path):
+    _grib(tmp_path, 0, age=10)
+    t0 = time.time()
+    status = _watch(tmp_path, hours=[0, 6], idle_timeout=0.5)
+    assert status == {0: 'done'}
+    assert time.time() - t0 < 5
@@ -0,0 +1,370 @@
+import json
+import math
+import os
+import shutil
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import timings
+
+# Map outputs for web viewers, drawn straight from the field array.
+#
+# output='tiles' writes an XYZ pyramid (Web Mercator, 256 px PNG tiles at
+# <dir>/<z>/<x>/<y>.png) for the requested zoom levels only, with a tiles.json
+# holding the title, color levels and band colors for the legend. Tiles that
+# would be fully transparent (outside a regional domain) are not written.
+# output='cog' writes a Cloud-Optimized GeoTIFF: RGBA, 256 px deflated tiles,
+# EPSG:4326, with overviews halving the size down to one tile, and every IFD
+# ahead of the pixel data so a viewer can range-read only what it shows.
+#
+# No figure is involved. The grid is first laid on a regular lat/lon raster,
+# built once per grid: a regular grid is its own raster (north up, cyclic
+# column dropped), and a curvilinear grid (MPASSIT) is binned onto cells of its
+# own spacing, with cells between points filled from their neighbours. Each
+# field is then binned into color bands exactly as basemap's image engine does
+# and every tile pixel looks up its band. Tiles are encoded by TILE_THREADS
+# threads.
+#
+# A pyramid replaces the PNG's path without the extension, a COG its path with
+# .tif, so both sit next to where the PNG would be.
+
+OUTPUTS = ('png', 'tiles', 'cog')
+
+TILE_SIZE = 256
+TILE_THREADS = int(os.environ.get('TILE_THREADS', 4))
+
+# Web Mercator stops at the latitude where the map is square
+MAX_LATITUDE = math.degrees(math.atan(math.sinh(math.pi)))
+
+# Passes of neighbour filling for curvilinear grids (cells reached from the nearest binned point)
+FILL_PASSES = 2
+
+_rasters = {}
+
+
+def default_output():
+    return os.environ.get('PLOT_OUTPUT', 'png')
+
+
+def default_zooms():
+    """Zoom levels from TILE_ZOOMS: a range '0-4' (the default) or a list '3,5,7'."""
+    spec = os.environ.get('TILE_ZOOMS', '0-4')
+    if '-' in spec:
+        first, last = (int(x) for x in spec.split('-'))
+        return list(range(first, last + 1))
+    return sorted({int(x) for x in spec.split(',')})
+
+
+def output_path(filepath, output):
+    """Where an output replacing the PNG at filepath is written."""
+    stem = os.path.splitext(filepath)[0]
+    return {'png': filepath, 'tiles': stem, 'cog': f"{stem}.tif"}[output]
+
+
+def _grid_key(lons, lats):
+    # Shape plus corner and center coordinates, as nc_access recognizes grids
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    probe = lambda a: tuple(np.ravel(a)[[0, a.size // 2, -1]].tolist())
+    return lons.shape, lats.shape, probe(lons), probe(lats)
+
+
+def _regular_raster(lon, lat, shape):
+    """Raster of a regular lat/lon grid: its own cells, north up and without a cyclic column."""
+    dlon, dlat = lon[1] - lon[0], lat[1] - lat[0]
+    ny, nx = shape
+    flat = np.arange(ny * nx, dtype=np.int64).reshape(ny, nx)
+    if lon[-1] - lon[0] >= 360 - dlon / 2:
+        flat = flat[:, :-1]
+    if dlat > 0:
+        flat = flat[::-1]
+    north = max(lat[0], lat[-1]) + abs(dlat) / 2
+    return {'west': lon[0] - dlon / 2, 'north': north, 'dlon': dlon, 'dlat': abs(dlat), 'flat': flat}
+
+
+def _binned_raster(lons, lats):
+    """Raster of a curvilinear grid: each cell holds a grid point falling in it, else one from a neighbour."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    coslat = np.cos(np.deg2rad(lats))
+    # Typical distance between neighbouring points, in degrees of latitude
+    along_x = np.hypot(np.diff(lons, axis=1) * coslat[:, 1:], np.diff(lats, axis=1))
+    along_y = np.hypot(np.diff(lons, axis=0) * coslat[1:], np.diff(lats, axis=0))
+    step = min(np.median(along_x), np.median(along_y))
+    dlat = step
+    dlon = step / max(np.cos(np.deg2rad(np.median(lats))), 0.2)
+
+    west, north = lons.min() - dlon / 2, lats.max() + dlat / 2
+    cols = ((lons - west) // dlon).astype(np.int64)
+    rows = ((north - lats) // dlat).astype(np.int64)
+    flat = np.full((rows.max() + 1, cols.max() + 1), -1, dtype=np.int64)
+    flat[rows.ravel(), cols.ravel()] = np.arange(lons.size)
+
+    for _ in range(FILL_PASSES):
+        empty = flat < 0
+        if not empty.any():
+            break
+        filled = flat.copy()
+        for shift, axis in ((1, 0), (-1, 0), (1, 1), (-1, 1)):
+            neighbour = np.roll(flat, shift, axis=axis)
+            edge = [slice(None), slice(None)]
+            edge[axis] = 0 if shift == 1 else -1
+            neighbour[tuple(edge)] = -1  # no wrap-around at the raster edges
+            take = (filled < 0) & (neighbour >= 0)
+            filled[take] = neighbour[take]
+        flat = filled
+    return {'west': west, 'north': north, 'dlon': dlon, 'dlat': dlat, 'flat': flat}
+
+
+def _regular_axes(lons, lats):
+    """The 1-D axes of a regular lat/lon grid (as basemap.regular_axes), else None."""
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    if lons.ndim == 2:
+        if not (np.array_equal(lons[0], lons[-1]) and np.array_equal(lats[:, 0], lats[:, -1])):
+            return None
+        lons, lats = lons[0], lats[:, 0]
+    lon, lat = lons.astype(np.float64), lats.astype(np.float64)
+    if lon.size < 2 or lat.size < 2:
+        return None
+    dlon, dlat = np.diff(lon), np.diff(lat)
+    if dlon[0] <= 0 or dlat[0] == 0 or not (np.allclose(dlon, dlon[0]) and np.allclose(dlat, dlat[0])):
+        return None
+    return lon, lat
+
+
+def grid_raster(lons, lats):
+    """The lat/lon raster of a grid, built once per grid and process.
+
+    A dict with the raster's west and north edges, its cell size (dlon, dlat)
+    and 'flat': for each cell, the index into the flattened field (-1 for none).
+    """
+    key = _grid_key(lons, lats)
+    if key not in _rasters:
+        axes = _regular_axes(lons, lats)
+        if axes is not None:
+            shape = np.shape(lats) if np.ndim(lats) == 2 else (len(axes[1]), len(axes[0]))
+            _rasters[key] = _regular_raster(*axes, shape)
+        else:
+            _rasters[key] = _binned_raster(lons, lats)
+    return _rasters[key]
+
+
+def color_table(data, levels, cmap):
+    """(levels, RGBA uint8 table) for binning data: [below, band 1..n, above, missing].
+
+    The same bands basemap draws: an int picks that many "nice" levels across the
+    field; a list is a fixed scale whose out-of-range values get the end colors.
+    """
+    from matplotlib import colormaps
+    from matplotlib.colors import BoundaryNorm, Normalize
+    from matplotlib.ticker import MaxNLocator
+
+    cmap = colormaps[cmap] if isinstance(cmap, str) else cmap
+    if isinstance(levels, int):
+        finite = np.isfinite(np.ma.filled(data, np.nan) if np.ma.isMaskedArray(data) else data)
+        # An all-missing field still gets a (placeholder) scale so tiles.json stays valid JSON
+        low, high = (np.min(data[finite]), np.max(data[finite])) if finite.any() else (0.0, 1.0)
+        levels = MaxNLocator(levels + 1).tick_values(low, high)
+        norm = Normalize(levels[0], levels[-1])
+        under = over = (0, 0, 0, 0)
+    else:
+        norm = BoundaryNorm(levels, cmap.N, extend='both')
+        under, over = cmap(norm(levels[0] - 1)), cmap(norm(levels[-1] + 1))
+    levels = np.asarray(levels, dtype=np.float64)
+    bands = cmap(norm(0.5 * (levels[:-1] + levels[1:])))
+    lut = np.vstack([under, bands, over, (0, 0, 0, 0)])
+    return levels, (lut * 255).round().astype(np.uint8)
+
+
+def band_raster(data, raster, levels):
+    """Band index of every raster cell (len(levels) + 1 marks missing)."""
+    data = np.ma.filled(data, np.nan) if np.ma.isMaskedArray(data) else np.asarray(data)
+    flat = raster['flat']
+    values = np.ravel(data)[np.maximum(flat, 0)].astype(np.float64)
+    values[flat < 0] = np.nan
+
+    nbands = len(levels) - 1
+    index = np.searchsorted(levels, values, side='right')
+    index[values == levels[-1]] = nbands  # the top level closes the last band
+    index[np.isnan(values)] = nbands + 2
+    return index.astype(np.uint8 if nbands + 2 < 256 else np.uint16)
+
+
+def _bounds(raster):
+    height, width = raster['flat'].shape
+    return (raster['west'], raster['north'] - height * raster['dlat'],
+            raster['west'] + width * raster['dlon'], raster['north'])
+
+
+def _tile_lat(y, n):
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+
+
+def tile_range(bounds, zoom):
+    """(x, y) of every tile at zoom that overlaps bounds (west, south, east, north)."""
+    west, south, east, north = bounds
+    n = 2 ** zoom
+    if east - west >= 360:
+        xs = range(n)
+    else:
+        first = (west + 180) % 360 / 360 * n
+        last = first + (east - west) / 360 * n
+        xs = sorted({x % n for x in range(int(first), math.ceil(last))})
+
+    def y_of(lat):
+        lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+        return (1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n
+
+    ys = range(min(int(y_of(north)), n - 1), min(math.ceil(y_of(south)), n))
+    return [(x, y) for x in xs for y in ys]
+
+
+def tile_pixels(bands, raster, zoom, x, y):
+    """Band indices of one tile's pixels, or None if every pixel falls outside the raster."""
+    height, width = bands.shape
+    n = 2 ** zoom * TILE_SIZE
+    centers = np.arange(TILE_SIZE) + 0.5
+    lon = (x * TILE_SIZE + centers) / n * 360 - 180
+    lat = _tile_lat(y * TILE_SIZE + centers, n)
+
+    cols = (((lon - raster['west']) % 360) // raster['dlon']).astype(np.int64)
+    rows = ((raster['north'] - lat) // raster['dlat']).astype(np.int64)
+    cols[cols >= width] = -1
+    rows[(rows < 0) | (rows >= height)] = -1
+    if (cols < 0).all() or (rows < 0).all():
+        return None
+    # Index -1 reads the padding row/column, which holds the missing band
+    return bands[np.ix_(rows, cols)]
+
+
+def write_tiles(bands, lut, raster, path, zooms, threads=None):
+    """Write the pyramid of a band raster under path; returns the number of tiles written."""
+    from PIL import Image
+
+    missing = len(lut) - 1
+    padded = np.pad(bands, ((0, 1), (0, 1)), constant_values=missing)
+    bounds = _bounds(raster)
+
+    def write(tile):
+        zoom, x, y = tile
+        pixels = tile_pixels(padded, raster, zoom, x, y)
+        if pixels is None or (pixels == missing).all():
+            return 0
+        os.makedirs(os.path.join(path, str(zoom), str(x)), exist_ok=True)
+        Image.fromarray(lut[pixels], 'RGBA').save(os.path.join(path, str(zoom), str(x), f"{y}.png"))
+        return 1
+
+    todo = [(zoom, x, y) for zoom in zooms for x, y in tile_range(bounds, zoom)]
+    with ThreadPoolExecutor(max_workers=threads or TILE_THREADS) as pool:
+        return sum(pool.map(write, todo))
+
+
+def _tiff_ifd(entries, offset, next_ifd):
+    """One little-endian TIFF IFD at offset, with its out-of-line values right behind it."""
+    formats = {3: 'H', 4: 'I', 12: 'd'}
+    entries = sorted(entries)
+    extra_at = offset + 2 + 12 * len(entries) + 4
+    head, extra = [struct.pack('<H', len(entries))], b''
+    for tag, kind, values in entries:
+        packed = struct.pack(f"<{len(values)}{formats[kind]}", *values)
+        if len(packed) <= 4:
+            head.append(struct.pack('<HHI', tag, kind, len(values)) + packed.ljust(4, b'\0'))
+        else:
+            head.append(struct.pack('<HHII', tag, kind, len(values), extra_at + len(extra)))
+            extra += packed + b'\0' * (len(packed) % 2)
+    head.append(struct.pack('<I', next_ifd))
+    return b''.join(head) + extra
+
+
+def write_cog(rgba, raster, path):
+    """Write an RGBA raster as a Cloud-Optimized GeoTIFF with nearest-neighbour overviews."""
+    images = [rgba]
+    while max(images[-1].shape[:2]) > TILE_SIZE:
+        images.append(images[-1][::2, ::2])
+
+    def tiles_of(image):
+        height, width = image.shape[:2]
+        for row in range(0, height, TILE_SIZE):
+            for col in range(0, width, TILE_SIZE):
+                tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+                part = image[row:row + TILE_SIZE, col:col + TILE_SIZE]
+                tile[:part.shape[0], :part.shape[1]] = part
+                yield zlib.compress(tile.tobytes(), 6)
+
+    blobs = [list(tiles_of(image)) for image in images]
+
+    def entries(k, offsets):
+        height, width = images[k].shape[:2]
+        tags = [(254, 4, [0 if k == 0 else 1]), (256, 4, [width]), (257, 4, [height]),
+                (258, 3, [8, 8, 8, 8]), (259, 3, [8]), (262, 3, [2]), (277, 3, [4]), (284, 3, [1]),
+                (322, 3, [TILE_SIZE]), (323, 3, [TILE_SIZE]),
+                (324, 4, offsets), (325, 4, [len(blob) for blob in blobs[k]]),
+                (338, 3, [2]), (339, 3, [1, 1, 1, 1])]
+        if k == 0:
+            # Geographic lat/lon (EPSG:4326), pixel-is-area, tied at the north-west corner
+            tags += [(33550, 12, [raster['dlon'], raster['dlat'], 0.0]),
+                     (33922, 12, [0.0, 0.0, 0.0, raster['west'], raster['north'], 0.0]),
+                     (34735, 3, [1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, 4326])]
+        return tags
+
+    # Every IFD first (their sizes do not depend on the offsets), then the tiles,
+    # smallest overview first as GDAL lays them out
+    ifd_offsets = [8]
+    for k in range(len(images)):
+        size = len(_tiff_ifd(entries(k, [0] * len(blobs[k])), 0, 0))
+        ifd_offsets.append(ifd_offsets[-1] + size)
+    data_at = ifd_offsets.pop()
+    tile_offsets = [None] * len(images)
+    for k in reversed(range(len(images))):
+        tile_offsets[k] = []
+        for blob in blobs[k]:
+            tile_offsets[k].append(data_at)
+            data_at += len(blob)
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(b'II*\0' + struct.pack('<I', 8))
+        for k in range(len(images)):
+            next_ifd = ifd_offsets[k + 1] if k + 1 < len(images) else 0
+            f.write(_tiff_ifd(entries(k, tile_offsets[k]), ifd_offsets[k], next_ifd))
+        for k in reversed(range(len(images))):
+            for blob in blobs[k]:
+                f.write(blob)
+    os.replace(tmp, path)
+
+
+def render_field(lons, lats, data, title, filepath, cmap='viridis', cbar_label=None, levels=20, output='tiles',
+                 zooms=None, threads=None, **map_style):
+    """Write one field as tiles or a COG in place of the PNG at filepath; returns the output path.
+
+    Takes the arguments of basemap.plot_on_basemap; the ones that only style a
+    map figure (engine, extent, projection, barbs, ...) have no effect here.
+    """
+    path = output_path(filepath, output)
+    with timings.stage('raster', file=path):
+        raster = grid_raster(lons, lats)
+        levels, lut = color_table(data, levels, cmap)
+        bands = band_raster(data, raster, levels)
+
+    if output == 'cog':
+        with timings.stage('cog', file=path):
+            write_cog(lut[bands], raster, path)
+        return path
+
+    zooms = default_zooms() if zooms is None else zooms
+    # Built beside the old pyramid and swapped in, so tiles of an earlier render never linger
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)  # a pyramid with no tiles (all missing, or beyond Web Mercator) still gets its tiles.json
+    with timings.stage('tiles', file=path, zooms=len(zooms)):
+        count = write_tiles(bands, lut, raster, tmp, zooms, threads)
+    with open(os.path.join(tmp, 'tiles.json'), 'w') as f:
+        json.dump({'title': title, 'label': cbar_label or '', 'levels': levels.tolist(),
+                   'colors': ['#%02x%02x%02x%02x' % tuple(color) for color in lut[:-1]],
+                   'bounds': list(_bounds(raster)), 'zooms': list(zooms), 'tiles': count,
+                   'url': '{z}/{x}/{y}.png'}, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,155 @@
+import contextlib
+import json
+import os
+import socket
+import sys
+import time
+
+import memory_budget
+
+# Per-stage wall time and peak memory.
+#
+# With PLOT_TIMINGS=<path> every instrumented stage appends one JSON line to
+# <path>: stage name, wall seconds, peak RSS during the stage, the output file
+# or field it worked on, plus host, pid, Slurm job/array ids and a run id shared
+# by all processes of one run (render workers included). Stages nest, e.g.
+# render > figure, contour, savefig, and an outer stage's peak covers its inner
+# ones. PLOT_TIMINGS_SUMMARY=1 prints a per-stage table at the end of a run
+# (logging to plot_timings.jsonl if PLOT_TIMINGS is unset). Disabled stages cost
+# nothing beyond a dict lookup.
+#
+# Stages: open, scan, decode, latlons, figure, contour, savefig, render (one per
+# output file), forecast_hour / nc_file (whole input file).
+
+DEFAULT_LOG = 'plot_timings.jsonl'
+
+_stack = []
+
+
+def summary_enabled():
+    return os.environ.get('PLOT_TIMINGS_SUMMARY', '').lower() in ('1', 'true', 'yes')
+
+
+def log_path():
+    return os.environ.get('PLOT_TIMINGS') or (DEFAULT_LOG if summary_enabled() else None)
+
+
+def run_id():
+    """Id shared by this process and the workers it starts; set on first use."""
+    if 'PLOT_RUN_ID' not in os.environ:
+        os.environ['PLOT_RUN_ID'] = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+    return os.environ['PLOT_RUN_ID']
+
+
+def _job():
+    array_job = os.environ.get('SLURM_ARRAY_JOB_ID')
+    if array_job:
+        return f"{array_job}_{os.environ.get('SLURM_ARRAY_TASK_ID')}"
+    return os.environ.get('SLURM_JOB_ID')
+
+
+def start(stage, **fields):
+    """Begin timing a stage; returns a handle for stop(), or None when timings are off."""
+    if log_path() is None:
+        return None
+    run_id()  # before any render worker is started, so workers inherit it
+    if _stack:
+        # The counter is reset below; fold what the enclosing stage has seen so far into it
+        _stack[-1]['peak_mb'] = max(_stack[-1]['peak_mb'], memory_budget.stage_peak_mb())
+    # Stage-local reset: memory_budget.peak_rss_mb() still reports the whole window's peak
+    memory_budget.reset_stage_peak()
+    frame = {'stage': stage, 'fields': fields, 'peak_mb': 0.0, 'wall': time.time(), 't0': time.perf_counter()}
+    _stack.append(frame)
+    return frame
+
+
+def stop(frame, **fields):
+    """Finish a stage started with start() and append its record to the log."""
+    if frame is None:
+        return
+    seconds = time.perf_counter() - frame['t0']
+    peak = max(frame['peak_mb'], memory_budget.stage_peak_mb())
+    while _stack and _stack.pop() is not frame:
+        pass
+    if _stack:
+        _stack[-1]['peak_mb'] = max(_stack[-1]['peak_mb'], peak)
+    frame.update(seconds=seconds, peak_mb=peak)
+
+    record = {'run': run_id(), 'host': socket.gethostname(), 'pid': os.getpid(), 'job': _job(),
+              'start': round(frame['wall'], 3), 'stage': frame['stage'], 'seconds': round(seconds, 6),
+              'peak_mb': round(peak, 1)}
+    record.update(frame['fields'], **fields)
+    # One write per line in append mode, so concurrent workers do not interleave
+    with open(log_path(), 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    frame = start(name, **fields)
+    try:
+        yield frame
+    finally:
+        stop(frame)
+
+
+def read_log(paths, run=None):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    if run is not None:
+        records = [r for r in records if r['run'] == run]
+    return records
+
+
+def print_summary(records, slowest=5):
+    """Per-stage totals, then the outputs with the longest render stage."""
+    stages = {}
+    for r in records:
+        stages.setdefault(r['stage'], []).append(r)
+
+    print(f"\n{'Stage':<15} {'Count':>6} {'Total s':>9} {'Mean s':>8} {'Max s':>8} {'Peak MB':>8}")
+    print("=" * 59)
+    for name, rows in sorted(stages.items(), key=lambda item: -sum(r['seconds'] for r in item[1])):
+        seconds = [r['seconds'] for r in rows]
+        print(f"{name:<15} {len(rows):>6} {sum(seconds):>9.2f} {sum(seconds) / len(rows):>8.3f} "
+              f"{max(seconds):>8.3f} {max(r['peak_mb'] for r in rows):>8.0f}")
+
+    renders = sorted(stages.get('render', []), key=lambda r: -r['seconds'])[:slowest]
+    if renders:
+        print("\nSlowest outputs:")
+        for r in renders:
+            print(f"  {r['seconds']:8.3f} s  {r['peak_mb']:6.0f} MB  {os.path.basename(str(r.get('file')))}")
+
+
+def summary():
+    """Print the table for the current run if PLOT_TIMINGS_SUMMARY is set."""
+    path = log_path()
+    if not summary_enabled() or path is None or not os.path.exists(path):
+        return
+    records = read_log([path], run_id())
+    print(f"\n⏱️  Timings for run {run_id()} ({len(records)} records, log: {path})")
+    print_summary(records)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python timings.py <log.jsonl> [more logs...]")
+        sys.exit(1)
+
+    paths = sys.argv[1:]
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        print(f"❌ Timing log not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    records = read_log(paths)
+    for run in sorted({r['run'] for r in records}):
+        rows = [r for r in records if r['run'] == run]
+        jobs = sorted({str(r['job']) for r in rows if r.get('job')})
+        print(f"\n⏱️  Run {run}" + (f" (job {', '.join(jobs)})" if jobs else "") + f": {len(rows)} records")
+        print_summary(rows)
@@ -0,0 +1,8 @@
+# Unit conversions used by the 'convert' entries of the variables dicts.
+# They modify the decoded array in place (it is a fresh copy from grb.values) and
+# return it, so no second full-size array is allocated.
+
+
+def kelvin_to_celsius(x):
+    x -= 273.15
+    return x
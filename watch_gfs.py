@@ -0,0 +1,132 @@
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import render_pool
+from plot_gfs_forecast import plot_forecast_hour
+
+# Plot forecast hours as their GRIB files arrive.
+#
+# input_dir is polled for gfs.t00z.pgrb2.0p25.fXXX (or the 2-digit fXX fallback).
+# A file counts as complete once it ends with the GRIB end marker "7777" and has
+# not been modified for SETTLE_SECONDS. Complete hours go to a pool of
+# MAX_WORKERS processes; at most MAX_PENDING hours are queued, and while the
+# queue is full the watcher stops scanning (backpressure) until a slot frees up.
+# It gives up after WATCH_IDLE_TIMEOUT seconds (default 2 hours) with no new file
+# and nothing running, so an hour that never arrives does not keep the job alive.
+
+GRIB_NAME = re.compile(r"^gfs\.t00z\.pgrb2\.0p25\.f(\d{2,3})$")
+POLL_SECONDS = int(os.environ.get('WATCH_POLL_SECONDS', 30))
+SETTLE_SECONDS = int(os.environ.get('WATCH_SETTLE_SECONDS', 60))
+IDLE_TIMEOUT = int(os.environ.get('WATCH_IDLE_TIMEOUT', 2 * 3600))
+
+
+def is_complete(path, settle_seconds=SETTLE_SECONDS):
+    try:
+        st = os.stat(path)
+        if st.st_size < 4 or time.time() - st.st_mtime < settle_seconds:
+            return False
+        with open(path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return f.read(4) == b'7777'
+    except OSError:
+        return False
+
+
+def find_ready(input_dir, skip, settle_seconds=SETTLE_SECONDS, hours=None):
+    """Return sorted forecast hours with a complete file in input_dir, excluding `skip`."""
+    ready = set()
+    for name in os.listdir(input_dir):
+        m = GRIB_NAME.match(name)
+        if not m:
+            continue
+        forecast_hour = int(m.group(1))
+        if forecast_hour in skip or forecast_hour in ready or (hours is not None and forecast_hour not in hours):
+            continue
+        if is_complete(os.path.join(input_dir, name), settle_seconds):
+            ready.add(forecast_hour)
+    return sorted(ready)
+
+
+def watch(input_dir='.', pressure_levels=[500], hours=None, max_workers=1, max_pending=None,
+          poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS, idle_timeout=IDLE_TIMEOUT, plot=plot_forecast_hour):
+    """Plot each forecast hour as soon as its file is complete.
+
+    Stops once every hour in `hours` is done, or after `idle_timeout` seconds with
+    nothing new and nothing running (None waits forever). Returns
+    {forecast_hour: 'done' | 'failed'}.
+    """
+    hours = set(hours) if hours is not None else None
+    max_pending = max_pending or 2 * max_workers
+    status = {}
+    pending = {}
+    last_activity = time.time()
+
+    print(f"👀 Watching {input_dir} for GFS files (pool={max_workers}, queue={max_pending})")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                if len(pending) < max_pending:
+                    for forecast_hour in find_ready(input_dir, set(status) | set(pending.values()), settle_seconds, hours):
+                        if len(pending) >= max_pending:
+                            break
+                        print(f"📥 Queued forecast hour {forecast_hour}")
+                        future = executor.submit(plot, forecast_hour, pressure_levels, input_dir=input_dir)
+                        pending[future] = forecast_hour
+                        last_activity = time.time()
+
+                if hours is not None and hours <= set(status):
+                    break
+                if not pending and idle_timeout is not None and time.time() - last_activity > idle_timeout:
+                    print(f"⏹️ No new files for {idle_timeout}s; stopping")
+                    break
+
+                if pending:
+                    done, _ = wait(pending, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                else:
+                    done = ()
+                    time.sleep(poll_seconds)
+
+                for future in done:
+                    forecast_hour = pending.pop(future)
+                    last_activity = time.time()
+                    try:
+                        future.result()
+                        status[forecast_hour] = 'done'
+                        print(f"✅ Finished forecast hour {forecast_hour}")
+                    except Exception as e:
+                        status[forecast_hour] = 'failed'
+                        print(f"❌ Forecast hour {forecast_hour} failed: {e}")
+        except KeyboardInterrupt:
+            print("⏹️ Interrupted; cancelling queued hours")
+            for future in pending:
+                future.cancel()
+    return status
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python watch_gfs.py <input_dir> [pressure_levels] [end_hr] [interval]")
+        sys.exit(1)
+
+    input_dir = sys.argv[1]
+    if not os.path.isdir(input_dir):
+        print(f"❌ Input directory not found: {input_dir}")
+        sys.exit(1)
+
+    try:
+        pressure_levels = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) >= 3 else [500]
+        end_hr = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+        interval = int(sys.argv[4]) if len(sys.argv) >= 5 else 6
+    except ValueError as e:
+        print(f"❌ Invalid arguments: {e}")
+        sys.exit(1)
+
+    hours = range(0, end_hr + 1, interval) if end_hr is not None else None
+    # WATCH_IDLE_TIMEOUT: seconds without new files before giving up (default 7200)
+    status = watch(input_dir, pressure_levels, hours=hours, max_workers=render_pool.default_workers())
+    missing = sorted(set(hours) - set(status)) if hours is not None else []
+    if missing:
+        print(f"❌ Forecast hours never arrived: {', '.join(map(str, missing))}")
+    sys.exit(1 if missing or 'failed' in status.values() else 0)